@@ -8,23 +8,70 @@ You can simply start by replacing your import lines::
 
 """
 
-# This is a fix for Issue13041 ("terminal width is not detected properly")
-try:
-    import os as _os
-    import shutil as _shutil
-    _os.environ.setdefault('COLUMNS', str(_shutil.get_terminal_size().columns))
-except Exception:
-    pass
+import sys as _sys
 
-# for argparse compatibility, make all public names from argparse importable from here
-from argparse import *
 
-from .parser import ArgumentParser, CALLER_DOC
-from .spec import register_spec
+################################################################################
+# lazy loading
+#
+# To keep ``import apegears`` cheap, submodules (and the modules they depend on) are only
+# imported on first access to the names they define.
 
-from .iofile import FileType, fileinput
+# public names, mapped to the submodule defining them:
+_LAZY_NAMES = {
+    'ArgumentParser': 'parser',
+    'CALLER_DOC': 'parser',
+    'register_spec': 'spec',
+    'register_lazy_spec': 'spec',
+    'FileType': 'iofile',
+    'fileinput': 'iofile',
+    'cached_parser': 'cache',
+}
 
-# register standard python types (e.g. datetime.date, pathlib.Path)
-from . import types as _types
 
-ArgumentParser, CALLER_DOC, register_spec, FileType, fileinput, _types  # pyflakes
+def __getattr__(name):
+    module_name = _LAZY_NAMES.get(name)
+    if module_name is not None:
+        value = getattr(_import_submodule(module_name), name)
+    elif name == '__all__':
+        value = _get_all()
+    else:
+        # for argparse compatibility, make all public names from argparse importable from here
+        import argparse
+        if name in argparse.__all__:
+            value = getattr(argparse, name)
+        else:
+            # a submodule (e.g. ``apegears.types``), not imported yet
+            value = _import_submodule_or_none(name)
+            if value is None:
+                raise AttributeError('module %r has no attribute %r' % (__name__, name))
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_get_all()))
+
+
+def _import_submodule(module_name):
+    full_name = '%s.%s' % (__name__, module_name)
+    __import__(full_name)
+    return _sys.modules[full_name]
+
+
+def _import_submodule_or_none(module_name):
+    if module_name.startswith('_'):
+        return None
+    import importlib
+    try:
+        return importlib.import_module('.' + module_name, __name__)
+    except ModuleNotFoundError as e:
+        if e.name != '%s.%s' % (__name__, module_name):
+            # (raised by the submodule)
+            raise
+        return None
+
+
+def _get_all():
+    import argparse
+    return sorted(set(argparse.__all__) | set(_LAZY_NAMES))
@@ -0,0 +1,243 @@
+"""
+Persistent snapshots of constructed parsers, for fast CLI startup.
+
+Building a parser with many arguments can dominate the startup time of a script.  Instead of
+replaying all the adder calls on every run, the fully built parser can be pickled to an on-disk
+cache, and restored on later runs.
+
+Typically used like::
+
+    from apegears import ArgumentParser, cached_parser
+
+    @cached_parser
+    def build_parser():
+        parser = ArgumentParser()
+        parser.add_optional(...)
+        ...
+        return parser
+
+    args = build_parser().parse_args()
+
+The cache is keyed by the hash of the source file of the module defining the builder function
+(as well as the apegears and python versions), so editing the module invalidates it.
+
+:note:
+    types, post-processors, completers etc. are pickled *by reference*, which means they need to
+    be importable (module-level) objects, i.e. not lambdas or local functions.  If a parser can't
+    be pickled, it is simply not cached.
+"""
+
+import os
+import sys
+import argparse as _ap
+import pickle
+import hashlib
+import functools
+
+from .version import __version_string__
+
+
+################################################################################
+# Consts
+
+CACHE_DIR_ENV_VAR = 'APEGEARS_CACHE_DIR'
+
+_PERSISTENT_ID_ARGPARSE_IDENTITY = 'argparse.identity'
+
+# argparse compares some of its consts by identity (e.g. ``help is SUPPRESS``), so they must
+# not be pickled as plain strings:
+_ARGPARSE_CONSTS = {
+    'argparse.%s' % name: getattr(_ap, name)
+    for name in ['SUPPRESS', 'OPTIONAL', 'ZERO_OR_MORE', 'ONE_OR_MORE', 'PARSER', 'REMAINDER']
+}
+_ARGPARSE_CONST_IDS = {id(v): k for k, v in _ARGPARSE_CONSTS.items()}
+
+
+################################################################################
+# cached_parser decorator
+
+def cached_parser(builder=None, *, cache_dir=None):
+    """
+    A decorator for a function which builds and returns a parser.  The built parser is
+    snapshotted to the cache on first call, and restored from it on later calls.
+
+    :param cache_dir:
+        directory to store snapshots in.  Defaults to the ``APEGEARS_CACHE_DIR`` env var, or
+        ``apegears`` under the user's cache directory.
+    """
+    if builder is None:
+        return functools.partial(cached_parser, cache_dir=cache_dir)
+
+    @functools.wraps(builder)
+    def wrapper(*args, **kwargs):
+        key = _get_cache_key(builder, args, kwargs)
+        if key is None:
+            # can't determine the source of the builder
+            return builder(*args, **kwargs)
+        name = ''.join(c if c.isalnum() or c in '._-' else '_' for c in builder.__qualname__)
+        filename = os.path.join(_get_cache_dir(cache_dir), '%s-%s.pickle' % (name, key))
+        try:
+            return load_parser(filename)
+        except Exception:
+            # missing, stale or corrupt snapshot.  rebuild.
+            pass
+        parser = builder(*args, **kwargs)
+        try:
+            save_parser(parser, filename)
+        except Exception:
+            # unpicklable parser, or unwriteable cache dir.  simply don't cache.
+            pass
+        return parser
+
+    return wrapper
+
+
+################################################################################
+# save/load
+
+def save_parser(parser, filename):
+    """
+    Snapshot a parser to a file.  The file is written atomically.
+    """
+    dirname = os.path.dirname(filename) or '.'
+    os.makedirs(dirname, exist_ok=True)
+    tmp_filename = '%s.%s.tmp' % (filename, os.getpid())
+    try:
+        with open(tmp_filename, 'wb') as F:
+            _ParserPickler(F, pickle.HIGHEST_PROTOCOL).dump(parser)
+        os.replace(tmp_filename, filename)
+    finally:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+
+
+def load_parser(filename):
+    """
+    Restore a parser snapshotted using ``save_parser``.
+    """
+    with open(filename, 'rb') as F:
+        return _ParserUnpickler(F).load()
+
+
+################################################################################
+# pickling
+
+class _ParserPickler(pickle.Pickler):
+    """
+    A pickler which handles the (unpicklable) local function argparse registers as the
+    default type, and argparse's consts.
+    """
+
+    def persistent_id(self, obj):
+        if type(obj) is str:
+            return _ARGPARSE_CONST_IDS.get(id(obj))
+        if _is_argparse_identity(obj):
+            return _PERSISTENT_ID_ARGPARSE_IDENTITY
+        return None
+
+
+class _ParserUnpickler(pickle.Unpickler):
+
+    def persistent_load(self, pid):
+        if pid == _PERSISTENT_ID_ARGPARSE_IDENTITY:
+            return _get_argparse_identity()
+        if pid in _ARGPARSE_CONSTS:
+            return _ARGPARSE_CONSTS[pid]
+        raise pickle.UnpicklingError('unsupported persistent id: %r' % (pid,))
+
+
+def _is_argparse_identity(obj):
+    return (
+        getattr(obj, '__module__', None) == 'argparse'
+        and getattr(obj, '__qualname__', '').endswith('<locals>.identity')
+    )
+
+
+def _get_argparse_identity():
+    return _ap.ArgumentParser(add_help=False)._registry_get('type', None)
+
+
+################################################################################
+# privates
+
+def _get_cache_key(builder, args, kwargs):
+    module = sys.modules.get(builder.__module__)
+    filename = getattr(module, '__file__', None)
+    if not filename:
+        return None
+    h = hashlib.sha256()
+    with open(filename, 'rb') as F:
+        h.update(F.read())
+    h.update(repr((
+        builder.__qualname__, args, sorted(kwargs.items()),
+        __version_string__, sys.version_info[:2],
+    )).encode())
+    return h.hexdigest()[:32]
+
+
+def _get_index_filenames(filename, suffix, subdir, cache_dir=None):
+    """
+    Return the candidate filenames for caching an index of a file: a sidecar file next to it
+    (unless ``cache_dir`` is passed), and a file in ``subdir`` of the cache directory.
+    """
+    key = hashlib.sha256(os.fsencode(os.path.abspath(filename))).hexdigest()[:32]
+    cached = os.path.join(_get_cache_dir(cache_dir), subdir, key + suffix)
+    if cache_dir is not None:
+        return [cached]
+    return [os.fspath(filename) + suffix, cached]
+
+
+def _get_cached_index(filename, suffix, subdir, load, build, cache_dir=None, is_usable=None):
+    """
+    Return the cached index of a file (e.g. a ``gzindex.GzipIndex``), if up to date, or a newly
+    built one, which is then cached in the first writeable location (see
+    ``_get_index_filenames``).
+
+    :param load: loads an index file, raising OSError or ValueError if it can't
+    :param build: builds the index (called with no args)
+    :param is_usable: if passed, a cached index is only used if ``is_usable(index)``
+    """
+    index_filenames = _get_index_filenames(filename, suffix, subdir, cache_dir)
+    for index_filename in index_filenames:
+        try:
+            index = load(index_filename)
+        except (OSError, ValueError):
+            continue
+        if not index.is_stale(filename) and (is_usable is None or is_usable(index)):
+            return index
+
+    index = build()
+    for index_filename in index_filenames:
+        try:
+            os.makedirs(os.path.dirname(index_filename) or '.', exist_ok=True)
+            index.save(index_filename)
+            break
+        except OSError:
+            # e.g. not writeable.  try the next location.
+            continue
+    return index
+
+
+def _to_little_endian(arr):
+    """
+    Return ``arr`` (an ``array.array``), or a byteswapped copy of it on big-endian platforms,
+    for index files, which are little-endian.
+    """
+    if sys.byteorder != 'little':
+        import array
+        arr = array.array(arr.typecode, arr)
+        arr.byteswap()
+    return arr
+
+
+def _get_cache_dir(cache_dir=None):
+    if cache_dir is not None:
+        return cache_dir
+    cache_dir = os.environ.get(CACHE_DIR_ENV_VAR)
+    if cache_dir:
+        return cache_dir
+    base_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base_dir, 'apegears')
+
+
+################################################################################
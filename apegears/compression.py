@@ -0,0 +1,410 @@
+"""
+Compression codecs, for transparently reading and writing compressed files.
+
+The codec is determined by the filename extension.  When reading a file without the
+extension of a codec, it is detected from the content of the file (magic bytes).
+
+Supported codecs: gzip, bz2, xz/lzma, and zstd and lz4 (when the ``zstandard`` and ``lz4``
+modules are installed).  More codecs can be added using ``register_codec``.
+
+Where available, (de)compression of large files runs in a subprocess, in parallel to the
+python process reading (or writing) the data: ``pigz`` for gzip, which is faster than the
+standard library, and ``zstd -T0`` for (multi-threaded) zstd compression.  This is only done
+for files opened as sequential streams (``stream=True``, e.g. by ``fileinput`` and
+``open_output``), since a pipe can't seek (or tell).
+"""
+
+import os
+import io
+import stat
+import functools
+
+
+################################################################################
+# Consts
+
+# whether to use (de)compressing programs (e.g. pigz), when found on PATH
+USE_SUBPROCESS = True
+
+# files smaller than this are decompressed in-process (spawning a process has its costs)
+SUBPROCESS_MIN_SIZE = 1 << 20
+
+# buffer size for reading from (de)compressing subprocesses
+READ_BUFFER_SIZE = 1 << 20
+
+_TEXT_KWARGS = ('encoding', 'errors', 'newline')
+
+
+################################################################################
+# Codec
+
+class Codec:
+    """
+    Base class of compression codecs.
+
+    Subclasses define the class attributes describing the codec, and ``open_binary``.
+    """
+
+    # the codec name
+    name = None
+
+    # filename extensions (including the ".")
+    extensions = ()
+
+    # the magic bytes compressed files start with, or None
+    magic = None
+
+    # the module required for in-process (de)compression
+    module = None
+
+    # a (de)compressing program to use instead of ``module``, if found on PATH: a tuple of
+    # (program name, args for decompressing stdin to stdout, args for compressing)
+    program = None
+
+    # the modes in which ``program`` is preferred (if found), even if ``module`` is available
+    program_modes = 'rwax'
+
+    def sniff(self, header):
+        """
+        Whether a file starting with ``header`` is compressed using this codec.
+        """
+        return self.magic is not None and header.startswith(self.magic)
+
+    def is_available(self):
+        return self._has_module() or self._get_program() is not None
+
+    def open_binary(self, filename, mode):
+        """
+        Open a file in-process, in binary mode (one of "rb", "wb", "ab", "xb").
+        """
+        raise NotImplementedError
+
+    def open_indexed(self, filename):
+        """
+        Open a file for seekable reading, in binary mode, or return None if not supported.
+        """
+        return None
+
+    def open(self, filename, mode='rb', index=False, stream=False, **kwargs):
+        """
+        Open a compressed file, same as the builtin ``open`` (in text mode, ``kwargs`` are
+        passed to ``io.TextIOWrapper``).
+
+        :param index:
+            if true, and supported by the codec, a file opened for reading is seekable (see
+            ``open_indexed``).
+        :param stream:
+            if true, the file is only read (or written) sequentially, so it can be
+            (de)compressed by a subprocess (see ``program``), through a (non-seekable) pipe.
+        """
+        base_mode, binary = _parse_mode(mode)
+        unsupported = set(kwargs) - set(_TEXT_KWARGS)
+        if unsupported:
+            raise TypeError('unsupported arguments: %s' % ', '.join(sorted(unsupported)))
+        if binary and any(v is not None for v in kwargs.values()):
+            raise ValueError('binary mode doesn\'t take %s arguments' % '/'.join(kwargs))
+
+        f = self.open_indexed(filename) if index and base_mode == 'r' else None
+        if f is not None:
+            pass
+        elif self._use_subprocess(filename, base_mode, stream):
+            f = _open_pipe(self._get_program(), filename, base_mode)
+        elif self._has_module():
+            f = self.open_binary(filename, base_mode + 'b')
+        else:
+            raise ImportError('%s compression requires the %s module' % (self.name, self.module))
+
+        if binary:
+            return f
+        return io.TextIOWrapper(f, **kwargs)
+
+    def _use_subprocess(self, filename, base_mode, stream=False):
+        if not USE_SUBPROCESS or self._get_program() is None:
+            return False
+        if not self._has_module():
+            return True
+        if not stream or base_mode not in self.program_modes:
+            # (the module's file object is seekable)
+            return False
+        if base_mode == 'r':
+            try:
+                return os.path.getsize(filename) >= SUBPROCESS_MIN_SIZE
+            except OSError:
+                # let the in-process open raise
+                return False
+        return True
+
+    def _has_module(self):
+        return self.module is None or _has_module(self.module)
+
+    def _get_program(self):
+        if self.program is None:
+            return None
+        path = _which(self.program[0])
+        if path is None:
+            return None
+        return (path,) + tuple(self.program[1:])
+
+    def __repr__(self):
+        return '<%s %s>' % (type(self).__name__, self.name)
+
+
+class _GzipCodec(Codec):
+    name = 'gzip'
+    extensions = ('.gz',)
+    magic = b'\x1f\x8b'
+    module = 'gzip'
+    program = ('pigz', ['-dc'], ['-c'])
+
+    def open_binary(self, filename, mode):
+        import gzip
+        return gzip.open(filename, mode)
+
+    def open_indexed(self, filename):
+        from . import gzindex
+        if not gzindex.is_available():
+            return None
+        return gzindex.open_indexed(filename, buffer_size=READ_BUFFER_SIZE)
+
+
+class _Bz2Codec(Codec):
+    name = 'bz2'
+    extensions = ('.bz2',)
+    magic = b'BZh'
+    module = 'bz2'
+
+    def sniff(self, header):
+        # the magic is followed by the block size, '1'-'9'
+        return header.startswith(self.magic) and header[3:4].isdigit()
+
+    def open_binary(self, filename, mode):
+        import bz2
+        return bz2.open(filename, mode)
+
+
+class _XzCodec(Codec):
+    name = 'xz'
+    extensions = ('.xz', '.lzma')
+    magic = b'\xfd7zXZ\x00'
+    module = 'lzma'
+
+    def open_binary(self, filename, mode):
+        import lzma
+        if mode[0] != 'r' and filename.endswith('.lzma'):
+            return lzma.open(filename, mode, format=lzma.FORMAT_ALONE)
+        return lzma.open(filename, mode)
+
+
+class _ZstdCodec(Codec):
+    name = 'zstd'
+    extensions = ('.zst', '.zstd')
+    magic = b'\x28\xb5\x2f\xfd'
+    module = 'zstandard'
+    program = ('zstd', ['-dcq'], ['-cq', '-T0'])
+    # (zstandard decompresses faster than piping from a subprocess)
+    program_modes = 'wax'
+
+    def open_binary(self, filename, mode):
+        import zstandard
+        return zstandard.open(filename, mode)
+
+
+class _Lz4Codec(Codec):
+    name = 'lz4'
+    extensions = ('.lz4',)
+    magic = b'\x04\x22\x4d\x18'
+    module = 'lz4.frame'
+
+    def open_binary(self, filename, mode):
+        import lz4.frame
+        return lz4.frame.open(filename, mode)
+
+
+################################################################################
+# registry
+
+_CODECS = []
+
+
+def register_codec(codec):
+    """
+    Register a ``Codec`` instance.  Codecs registered later take precedence.
+    """
+    _CODECS.insert(0, codec)
+
+
+def get_codec(name):
+    for codec in _CODECS:
+        if codec.name == name:
+            return codec
+    raise KeyError('unknown codec: %r' % (name,))
+
+
+def find_codec(filename, mode='r'):
+    """
+    Return the codec of a file, or None if it is not compressed (or the codec is unknown).
+
+    The codec is determined by the extension.  In read mode, the content of (regular) files
+    without the extension of a codec is sniffed.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    for codec in _CODECS:
+        if ext in codec.extensions:
+            return codec
+    if mode[0] == 'r':
+        return _sniff_codec(filename)
+    return None
+
+
+def open_compressed(filename, mode='rb', index=False, stream=False, **kwargs):
+    """
+    Open a file, transparently (de)compressing it, if compressed.  Mode and kwargs are the
+    same as for the builtin ``open``.
+
+    :param index:
+        if true, compressed files opened for reading are seekable, where supported (gzip
+        files, using an index built on first use, see ``apegears.gzindex``).
+    :param stream:
+        if true, the file is only read (or written) sequentially, so it can be
+        (de)compressed in a subprocess (see ``Codec.open``).
+    """
+    codec = find_codec(filename, mode)
+    if codec is None:
+        return open(filename, mode, **kwargs)
+    return codec.open(filename, mode, index=index, stream=stream, **kwargs)
+
+
+def _sniff_codec(filename):
+    try:
+        if not stat.S_ISREG(os.stat(filename).st_mode):
+            # e.g. a pipe, which can't be read twice
+            return None
+        with open(filename, 'rb') as F:
+            header = F.read(16)
+    except OSError:
+        # let the caller's open raise
+        return None
+    for codec in _CODECS:
+        if codec.sniff(header) and _can_decode(codec, filename):
+            return codec
+    return None
+
+
+def _can_decode(codec, filename):
+    # (a plain file can start with the magic bytes by chance)
+    if not codec._has_module():
+        return True
+    try:
+        with codec.open_binary(filename, 'rb') as F:
+            F.read(1)
+    except Exception:
+        # (each module raises its own errors, e.g. OSError, EOFError, ValueError)
+        return False
+    return True
+
+
+for _codec_cls in [_Lz4Codec, _ZstdCodec, _XzCodec, _Bz2Codec, _GzipCodec]:
+    register_codec(_codec_cls())
+
+
+################################################################################
+# subprocess pipes
+
+class _ProcessPipe(io.FileIO):
+    """
+    The reading (or writing) end of a pipe from (to) a (de)compressing subprocess.
+
+    When reading reaches EOF, or when closing in write mode, the exit status of the process is
+    checked, and OSError is raised if it failed (e.g. corrupt input).
+    """
+
+    def __init__(self, fd, mode, proc, name):
+        super().__init__(fd, mode)
+        self._proc = proc
+        self.name = name
+
+    def readinto(self, b):
+        n = super().readinto(b)
+        if n == 0:
+            self._check_exit_status()
+        return n
+
+    def readall(self):
+        data = super().readall()
+        self._check_exit_status()
+        return data
+
+    def close(self):
+        if self.closed:
+            return
+        readable = self.readable()
+        super().close()
+        if readable:
+            # (if closed before EOF, the process is no longer needed)
+            if self._proc.poll() is None:
+                self._proc.kill()
+            self._proc.wait()
+        else:
+            self._check_exit_status()
+
+    def _check_exit_status(self):
+        status = self._proc.wait()
+        if status != 0:
+            raise OSError('%s failed (exit status %s) on %r' % (
+                os.path.basename(self._proc.args[0]), status, self.name))
+
+
+def _open_pipe(program, filename, base_mode):
+    import subprocess
+    path, decompress_args, compress_args = program
+    if base_mode == 'r':
+        with open(filename, 'rb') as src:
+            r, w = os.pipe()
+            try:
+                proc = subprocess.Popen([path] + decompress_args, stdin=src, stdout=w)
+            except BaseException:
+                os.close(r)
+                raise
+            finally:
+                os.close(w)
+        return io.BufferedReader(_ProcessPipe(r, 'rb', proc, filename), READ_BUFFER_SIZE)
+    else:
+        with open(filename, base_mode + 'b') as dst:
+            r, w = os.pipe()
+            try:
+                proc = subprocess.Popen([path] + compress_args, stdin=r, stdout=dst)
+            except BaseException:
+                os.close(w)
+                raise
+            finally:
+                os.close(r)
+        return io.BufferedWriter(_ProcessPipe(w, 'wb', proc, filename))
+
+
+################################################################################
+# privates
+
+def _parse_mode(mode):
+    base_mode = mode.replace('b', '').replace('t', '')
+    if base_mode not in ('r', 'w', 'a', 'x'):
+        raise ValueError('invalid mode: %r' % (mode,))
+    return base_mode, 'b' in mode
+
+
+@functools.lru_cache(maxsize=None)
+def _which(program):
+    import shutil
+    return shutil.which(program)
+
+
+@functools.lru_cache(maxsize=None)
+def _has_module(module_name):
+    import importlib
+    try:
+        importlib.import_module(module_name)
+        return True
+    except ImportError:
+        return False
+
+
+################################################################################
@@ -0,0 +1,573 @@
+"""
+Seekable (random-access) reading of gzip files, using an index of decompressor checkpoints
+(the technique of zlib's ``examples/zran.c``).
+
+A gzip file can normally only be decompressed from the start.  The index stores a checkpoint
+of the decompressor every ``span`` bytes of uncompressed data: the offsets in the compressed
+and the uncompressed data, the number of lines before it, and the last 32KB of uncompressed
+data (the deflate window).  Decompression can then be resumed from any checkpoint, so seeking
+decompresses at most ``span`` bytes.
+
+The index is built on first use (which decompresses the whole file once), and cached in a
+sidecar file next to the gzip file (``<filename>.gzidx``), or, if it can't be written there,
+in the cache directory (see ``apegears.cache``).  A cached index is rebuilt if the size or the
+modification time of the file changed.
+
+Typically used through ``open_compressed(filename, 'rb', index=True)``, which returns a
+seekable file object.  For processing a file in parallel, ``split_lines`` splits it into
+ranges of whole lines.
+
+:note:
+    Resuming decompression mid-stream requires zlib functions which python's ``zlib`` module
+    doesn't expose, so the system's zlib library is used directly (through ``ctypes``).
+    ``is_available()`` returns whether it was found.
+"""
+
+import os
+import io
+import zlib
+import array
+import bisect
+import struct
+import ctypes
+import ctypes.util
+import functools
+
+from .cache import _get_cached_index, _to_little_endian
+
+
+################################################################################
+# Consts
+
+# the default distance between checkpoints, in bytes of uncompressed data
+DEFAULT_SPAN = 1 << 23
+
+# the suffix of sidecar index files
+INDEX_SUFFIX = '.gzidx'
+
+# the max size of the deflate window
+WINDOW_SIZE = 1 << 15
+
+_INPUT_CHUNK_SIZE = 1 << 18
+_OUTPUT_CHUNK_SIZE = 1 << 18
+
+# magic, file size, file mtime (ns), span, uncompressed size, num lines, num checkpoints
+_INDEX_HEADER = struct.Struct('<8sQQQQQQ')
+_INDEX_MAGIC = b'APGGZIX\x01'
+
+# zlib consts
+_Z_OK = 0
+_Z_STREAM_END = 1
+_Z_NEED_DICT = 2
+_Z_BUF_ERROR = -5
+_Z_NO_FLUSH = 0
+_Z_BLOCK = 5
+_GZIP_MAGIC = b'\x1f\x8b'
+_GZIP_WBITS = 32 + 15  # a gzip (or zlib) header, auto-detected
+_RAW_WBITS = -15
+
+
+################################################################################
+# GzipIndex
+
+class GzipIndex:
+    """
+    An index of decompressor checkpoints of a gzip file.
+
+    Checkpoint ``i`` is at offset ``out_offsets[i]`` of the uncompressed data (after
+    ``linenos[i]`` newlines), and decompression is resumed from it at (bit) offset
+    ``in_offsets[i]`` (minus ``bits[i]`` bits) of the compressed data.
+    """
+
+    def __init__(self, span, size, num_lines, in_offsets, out_offsets, linenos, bits, windows,
+                 file_size=0, file_mtime_ns=0):
+        self.span = span
+        # the size of the uncompressed data, and the number of newlines in it
+        self.size = size
+        self.num_lines = num_lines
+        self.in_offsets = in_offsets
+        self.out_offsets = out_offsets
+        self.linenos = linenos
+        self.bits = bits
+        # (zlib-compressed)
+        self._windows = windows
+        # the stat of the indexed file, for detecting a stale index
+        self.file_size = file_size
+        self.file_mtime_ns = file_mtime_ns
+
+    @classmethod
+    def build(cls, filename, span=DEFAULT_SPAN):
+        """
+        Build the index of a gzip file, by decompressing it.
+        """
+        in_offsets = array.array('Q')
+        out_offsets = array.array('Q')
+        linenos = array.array('Q')
+        bits = bytearray()
+        windows = []
+        out_buf = ctypes.create_string_buffer(_OUTPUT_CHUNK_SIZE)
+        out_addr = ctypes.addressof(out_buf)
+        size = num_lines = 0
+        last = None
+        with open(filename, 'rb') as F:
+            st = os.fstat(F.fileno())
+            inflater = _Inflater(F, _GZIP_WBITS)
+            try:
+                while not inflater.finished:
+                    # (stops at the end of each deflate block)
+                    ret, n = inflater.inflate(out_addr, _OUTPUT_CHUNK_SIZE, _Z_BLOCK)
+                    if n:
+                        num_lines += ctypes.string_at(out_addr, n).count(b'\n')
+                        size += n
+                    if ret == _Z_STREAM_END:
+                        inflater.next_member()
+                        continue
+                    data_type = inflater.data_type
+                    at_block_boundary = data_type & 128 and not data_type & 64
+                    if at_block_boundary and (last is None or size - last >= span):
+                        in_offsets.append(inflater.in_offset)
+                        out_offsets.append(size)
+                        linenos.append(num_lines)
+                        bits.append(data_type & 7)
+                        windows.append(zlib.compress(inflater.get_dictionary(), 1))
+                        last = size
+            finally:
+                inflater.close()
+        return cls(span, size, num_lines, in_offsets, out_offsets, linenos, bytes(bits), windows,
+                   file_size=st.st_size, file_mtime_ns=st.st_mtime_ns)
+
+    def __len__(self):
+        return len(self.out_offsets)
+
+    def find(self, offset):
+        """
+        Return the index of the last checkpoint at or before ``offset`` (of the uncompressed
+        data).
+        """
+        return max(bisect.bisect_right(self.out_offsets, offset) - 1, 0)
+
+    def get_window(self, i):
+        return zlib.decompress(self._windows[i])
+
+    def is_stale(self, filename):
+        st = os.stat(filename)
+        return (st.st_size, st.st_mtime_ns) != (self.file_size, self.file_mtime_ns)
+
+    ################################################################################
+    # save/load
+
+    def save(self, filename):
+        """
+        Save the index to a file.  The file is written atomically.
+        """
+        tmp_filename = '%s.%s.tmp' % (filename, os.getpid())
+        try:
+            with open(tmp_filename, 'wb') as F:
+                F.write(_INDEX_HEADER.pack(
+                    _INDEX_MAGIC, self.file_size, self.file_mtime_ns, self.span, self.size,
+                    self.num_lines, len(self)))
+                for arr in [self.in_offsets, self.out_offsets, self.linenos]:
+                    F.write(_to_little_endian(arr).tobytes())
+                F.write(self.bits)
+                F.write(_to_little_endian(array.array('Q', map(len, self._windows))).tobytes())
+                for window in self._windows:
+                    F.write(window)
+            os.replace(tmp_filename, filename)
+        finally:
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Load an index saved using ``save``.  Raises ValueError if the file is not a valid index.
+        """
+        with open(filename, 'rb') as F:
+            data = F.read()
+        try:
+            magic, file_size, file_mtime_ns, span, size, num_lines, n = \
+                _INDEX_HEADER.unpack_from(data)
+        except struct.error:
+            raise ValueError('%s is not a gzip index' % filename) from None
+        if magic != _INDEX_MAGIC:
+            raise ValueError('%s is not a gzip index' % filename)
+        pos = _INDEX_HEADER.size
+        in_offsets, pos = _read_array(data, pos, n)
+        out_offsets, pos = _read_array(data, pos, n)
+        linenos, pos = _read_array(data, pos, n)
+        bits = data[pos:pos + n]
+        window_sizes, pos = _read_array(data, pos + n, n)
+        windows = []
+        for window_size in window_sizes:
+            windows.append(data[pos:pos + window_size])
+            pos += window_size
+        if pos != len(data):
+            raise ValueError('%s is a corrupt gzip index' % filename)
+        return cls(span, size, num_lines, in_offsets, out_offsets, linenos, bits, windows,
+                   file_size=file_size, file_mtime_ns=file_mtime_ns)
+
+
+def get_index(filename, span=None, cache_dir=None):
+    """
+    Return the index of a gzip file: the cached index, if up to date, or a newly built one
+    (which is then cached).
+
+    :param span: the distance between checkpoints.  Defaults to ``DEFAULT_SPAN``, or to the
+        span of the cached index.
+    :param cache_dir:
+        if passed, the index is cached in this directory (instead of in a sidecar file, or in
+        the default cache directory).
+    """
+    return _get_cached_index(
+        filename, INDEX_SUFFIX, 'gzindex', GzipIndex.load,
+        lambda: GzipIndex.build(filename, span or DEFAULT_SPAN),
+        cache_dir=cache_dir, is_usable=lambda index: span in (None, index.span))
+
+
+################################################################################
+# reading
+
+class IndexedGzipReader(io.RawIOBase):
+    """
+    A seekable raw (unbuffered) reader of the uncompressed data of a gzip file.
+
+    Typically wrapped in ``io.BufferedReader`` (as ``open_compressed(..., index=True)`` does).
+    """
+
+    def __init__(self, filename, index=None):
+        if index is None:
+            index = get_index(filename)
+        self.name = filename
+        self.index = index
+        self._file = open(filename, 'rb')
+        self._inflater = None
+        self._pos = 0
+        self._eof = False
+        self._scratch = None
+        self._restore(0)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self.index.size
+        elif whence != io.SEEK_SET:
+            raise ValueError('invalid whence (%r)' % (whence,))
+        if offset < 0:
+            raise ValueError('negative seek position %d' % offset)
+        i = self.index.find(offset)
+        if offset < self._pos or self.index.out_offsets[i] > self._pos:
+            # (otherwise, it's faster to decompress up to offset)
+            self._restore(i)
+        self._skip(offset - self._pos)
+        return self._pos
+
+    def readinto(self, b):
+        view = memoryview(b).cast('B')
+        if not len(view) or self._eof:
+            return 0
+        buf = (ctypes.c_char * len(view)).from_buffer(view)
+        n = self._inflate(ctypes.addressof(buf), len(view))
+        del buf
+        return n
+
+    def close(self):
+        if self._inflater is not None:
+            self._inflater.close()
+            self._inflater = None
+        self._file.close()
+        super().close()
+
+    def _inflate(self, addr, size):
+        while not self._eof:
+            ret, n = self._inflater.inflate(addr, size)
+            if ret == _Z_STREAM_END:
+                self._inflater.next_member()
+                self._eof = self._inflater.finished
+            if n:
+                self._pos += n
+                return n
+        return 0
+
+    def _skip(self, n):
+        if not n:
+            return
+        if self._scratch is None:
+            self._scratch = ctypes.create_string_buffer(_OUTPUT_CHUNK_SIZE)
+        addr = ctypes.addressof(self._scratch)
+        while n and not self._eof:
+            n -= self._inflate(addr, min(n, _OUTPUT_CHUNK_SIZE))
+
+    def _restore(self, i):
+        """
+        Resume decompressing from checkpoint ``i``.
+        """
+        index = self.index
+        if self._inflater is not None:
+            self._inflater.close()
+            self._inflater = None
+        # (the first checkpoint is at the start of the data, after the gzip header)
+        bits = index.bits[i]
+        self._file.seek(index.in_offsets[i] - (1 if bits else 0))
+        if bits:
+            # the checkpoint is in the middle of this byte
+            byte = self._file.read(1)[0]
+        self._inflater = _Inflater(self._file, _RAW_WBITS)
+        if bits:
+            self._inflater.prime(bits, byte >> (8 - bits))
+        self._inflater.set_dictionary(index.get_window(i))
+        self._pos = index.out_offsets[i]
+        self._eof = False
+
+
+def open_indexed(filename, index=None, buffer_size=io.DEFAULT_BUFFER_SIZE):
+    """
+    Open a gzip file for seekable reading, in binary mode.  The index is built (and cached) on
+    first use.
+    """
+    return io.BufferedReader(IndexedGzipReader(filename, index), buffer_size)
+
+
+def split_lines(filename, num_chunks, index=None):
+    """
+    Split a gzip file into (up to) ``num_chunks`` ranges of whole lines, of about the same
+    (uncompressed) size, for processing in parallel.  The ranges are split at checkpoints,
+    so this only decompresses a little around each of them.
+
+    :return:
+        a list of ``(start, end, lineno)`` tuples: offsets in the uncompressed data, and the
+        (0-based) number of the first line of the range.
+    """
+    if index is None:
+        index = get_index(filename)
+    boundaries = [(0, 0)]
+    with open_indexed(filename, index) as f:
+        for j in range(1, num_chunks):
+            i = index.find(index.size * j // num_chunks)
+            offset, lineno = index.out_offsets[i], index.linenos[i]
+            if offset == 0:
+                continue
+            # the range starts after the end of the line containing the checkpoint:
+            f.seek(offset - 1)
+            start = offset - 1 + len(f.readline())
+            if start > offset:
+                # (the newline is after the checkpoint)
+                lineno += 1
+            if start > boundaries[-1][0]:
+                boundaries.append((start, lineno))
+    ends = [start for start, _ in boundaries[1:]] + [index.size]
+    return [
+        (start, end, lineno)
+        for (start, lineno), end in zip(boundaries, ends)
+        if start < end
+    ]
+
+
+################################################################################
+# zlib, through ctypes
+
+class _ZStream(ctypes.Structure):
+    _fields_ = [
+        ('next_in', ctypes.c_void_p),
+        ('avail_in', ctypes.c_uint),
+        ('total_in', ctypes.c_ulong),
+        ('next_out', ctypes.c_void_p),
+        ('avail_out', ctypes.c_uint),
+        ('total_out', ctypes.c_ulong),
+        ('msg', ctypes.c_char_p),
+        ('state', ctypes.c_void_p),
+        ('zalloc', ctypes.c_void_p),
+        ('zfree', ctypes.c_void_p),
+        ('opaque', ctypes.c_void_p),
+        ('data_type', ctypes.c_int),
+        ('adler', ctypes.c_ulong),
+        ('reserved', ctypes.c_ulong),
+    ]
+
+
+@functools.lru_cache(maxsize=None)
+def _load_zlib():
+    name = ctypes.util.find_library('z') or ctypes.util.find_library('zlib')
+    if name is None:
+        return None
+    try:
+        lib = ctypes.CDLL(name)
+        strm_p = ctypes.POINTER(_ZStream)
+        for func_name, argtypes in [
+                ('inflateInit2_', [strm_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_int]),
+                ('inflate', [strm_p, ctypes.c_int]),
+                ('inflateEnd', [strm_p]),
+                ('inflateReset2', [strm_p, ctypes.c_int]),
+                ('inflatePrime', [strm_p, ctypes.c_int, ctypes.c_int]),
+                ('inflateSetDictionary', [strm_p, ctypes.c_char_p, ctypes.c_uint]),
+                # (zlib>=1.2.8)
+                ('inflateGetDictionary', [strm_p, ctypes.c_char_p, ctypes.POINTER(ctypes.c_uint)]),
+        ]:
+            func = getattr(lib, func_name)
+            func.argtypes = argtypes
+            func.restype = ctypes.c_int
+        lib.zlibVersion.restype = ctypes.c_char_p
+    except (OSError, AttributeError):
+        return None
+    return lib
+
+
+def is_available():
+    """
+    Whether seekable reading of gzip files is supported (i.e. the zlib library was found).
+    """
+    return _load_zlib() is not None
+
+
+class _Inflater:
+    """
+    A zlib inflate stream, reading the compressed data from a file (from its current position).
+    """
+
+    def __init__(self, fileobj, wbits):
+        self._zlib = _load_zlib()
+        if self._zlib is None:
+            raise ImportError('seekable gzip reading requires the zlib library')
+        self._file = fileobj
+        self._file_pos = fileobj.tell()
+        self._in_buf = ctypes.create_string_buffer(_INPUT_CHUNK_SIZE)
+        self._input_eof = False
+        self._raw = wbits < 0
+        self._strm = _ZStream()
+        self._check(self._zlib.inflateInit2_(
+            self._strm, wbits, self._zlib.zlibVersion(), ctypes.sizeof(_ZStream)))
+        self._initialized = True
+        # whether the end of the last gzip member was reached
+        self.finished = False
+
+    @property
+    def data_type(self):
+        return self._strm.data_type
+
+    @property
+    def in_offset(self):
+        # the offset in the file of the next compressed byte to process
+        return self._file_pos - self._strm.avail_in
+
+    def inflate(self, out_addr, out_size, flush=_Z_NO_FLUSH):
+        """
+        :return: the zlib return code, and the number of bytes written to ``out_addr``.
+        """
+        strm = self._strm
+        self._fill()
+        strm.next_out = out_addr
+        strm.avail_out = out_size
+        ret = self._zlib.inflate(strm, flush)
+        n = out_size - strm.avail_out
+        if ret == _Z_BUF_ERROR and self._input_eof and not strm.avail_in:
+            raise EOFError('Compressed file ended before the end-of-stream marker was reached')
+        if ret not in (_Z_OK, _Z_STREAM_END, _Z_BUF_ERROR):
+            self._check(ret)
+        return ret, n
+
+    def next_member(self):
+        """
+        Called on the end of the deflate stream: proceed to the next gzip member, if any.
+        """
+        if self._raw:
+            # skip the gzip trailer (crc32 and size), which raw inflate doesn't process
+            self._skip_input(8)
+        # like gzip, ignore trailing zero padding and garbage after the last member:
+        self._skip_zeros()
+        if not self._fill(2) or self._peek(2) != _GZIP_MAGIC:
+            self.finished = True
+            return
+        self._raw = False
+        self._check(self._zlib.inflateReset2(self._strm, _GZIP_WBITS))
+
+    def prime(self, bits, value):
+        self._check(self._zlib.inflatePrime(self._strm, bits, value))
+
+    def set_dictionary(self, window):
+        if window:
+            self._check(self._zlib.inflateSetDictionary(self._strm, window, len(window)))
+
+    def get_dictionary(self):
+        buf = ctypes.create_string_buffer(WINDOW_SIZE)
+        n = ctypes.c_uint(0)
+        self._check(self._zlib.inflateGetDictionary(self._strm, buf, ctypes.byref(n)))
+        return buf.raw[:n.value]
+
+    def close(self):
+        if self._initialized:
+            self._zlib.inflateEnd(self._strm)
+            self._initialized = False
+
+    def _fill(self, size=1):
+        """
+        Read more input, if less than ``size`` bytes are available.  Returns whether they are.
+        """
+        strm = self._strm
+        while strm.avail_in < size and not self._input_eof:
+            # (move the remaining input to the start of the buffer)
+            k = strm.avail_in
+            if k:
+                ctypes.memmove(self._in_buf, strm.next_in, k)
+            n = self._file.readinto(memoryview(self._in_buf).cast('B')[k:])
+            if not n:
+                self._input_eof = True
+            self._file_pos += n
+            strm.next_in = ctypes.addressof(self._in_buf)
+            strm.avail_in = k + n
+        return strm.avail_in >= size
+
+    def _peek(self, size):
+        strm = self._strm
+        return ctypes.string_at(strm.next_in, min(size, strm.avail_in))
+
+    def _skip_zeros(self):
+        strm = self._strm
+        while self._fill():
+            head = self._peek(1 << 12)
+            k = len(head) - len(head.lstrip(b'\0'))
+            strm.next_in += k
+            strm.avail_in -= k
+            if k < len(head):
+                break
+
+    def _skip_input(self, n):
+        strm = self._strm
+        while n:
+            if not self._fill():
+                raise EOFError('Compressed file ended before the end-of-stream marker was reached')
+            k = min(n, strm.avail_in)
+            strm.next_in += k
+            strm.avail_in -= k
+            n -= k
+
+    def _check(self, ret):
+        if ret == _Z_OK:
+            return
+        msg = self._strm.msg
+        raise zlib.error('Error %d while decompressing data: %s' % (
+            ret, msg.decode() if msg else 'invalid data'))
+
+
+################################################################################
+# privates
+
+def _read_array(data, pos, n):
+    arr = array.array('Q')
+    end = pos + 8 * n
+    if n:
+        arr.frombytes(data[pos:end])
+    if len(arr) != n:
+        raise ValueError('corrupt gzip index')
+    return _to_little_endian(arr), end
+
+
+################################################################################
@@ -4,11 +4,17 @@ Tools for defining arguments involving reading and writing files.
 
 import os
 import os.path
+import sys
+import stat
+import errno
 import argparse as _ap
-import fileinput as _fileinput
-import pickle
+import struct
+import itertools
+import operator
+import collections
+import io
 
-from .spec import register_spec
+from .spec import _register_builtin_spec
 
 
 ################################################################################
@@ -28,24 +34,41 @@ class FileInputType:
         (``add_list``, ``add_optional``).
     """
 
-    def __init__(self, *, decompress=False, **kwargs):
+    def __init__(self, *, decompress=False, prefetch=0, batched=False, **kwargs):
         """
         :param decompress:
             if true, will use ``hook_compressed``, for "transparently open compressed files".
             This is a shorter way of passing
+        :param prefetch:
+            the number of files to open, decompress and read ahead in background threads,
+            while the current file is being consumed (see ``FileInput``).
+        :param batched:
+            if true, the value is a ``FileInput``, which also supports iterating over batches
+            of lines or chunks of data, and ``map``.  Implied by ``prefetch``.
+        :param kwargs:
+            passed to ``fileinput.input`` (or to ``FileInput``, if batched).
         """
         if decompress:
             kwargs.setdefault('openhook', hook_compressed)
+        if prefetch:
+            kwargs['prefetch'] = prefetch
+        self.batched = batched or bool(prefetch)
         self.kwargs = kwargs
 
     def get_fileinput(self, files):
+        if self.batched:
+            return FileInput(files, **self.kwargs)
+        import fileinput as _fileinput
         return _fileinput.input(files, **self.kwargs)
 
+    def _post_process(self, files, **kwargs):
+        return self.get_fileinput(files)
+
     @property
     def __argparse__(self):
         return dict(
             names=['infiles'],
-            post_process=lambda files, **kw: self.get_fileinput(files),
+            post_process=self._post_process,
             metavar='INFILE',
         )
 
@@ -53,66 +76,617 @@ class FileInputType:
 fileinput = FileInputType
 
 
-def open_compressed(filename, mode):
+class FileInput:
     """
-    An alternative implementation for ``fileinput.hook_compressed``, which partially
-    works around Issue5758 ("fileinput.hook_compressed returning bytes from gz file").
+    An alternative implementation of ``fileinput.FileInput`` (without in-place editing), which
+    reads files in batches of lines, and can prefetch files.
+
+    With ``prefetch=K``, the next K files are opened, decompressed and read (into a bounded
+    buffer) in background threads, while the current file is being consumed.  This keeps the
+    CPU busy while waiting for I/O (e.g. on network file systems).  Lines are still returned in
+    order, and ``filename()``, ``lineno()`` etc. behave the same.
+
+    Besides iterating over lines, it supports high-throughput iteration over batches of lines
+    (``iter_batches``), or over chunks of data (``iter_chunks``).
     """
-    ext = os.path.splitext(filename)[1]
 
-    def fix_mode(mode):
-        # default to text. from gzip.open docs:
-        # The mode argument can be "r", "rb", "w", "wb", "x", "xb", "a" or "ab" for
-        # binary mode, or "rt", "wt", "xt" or "at" for text mode. The default mode is
-        # "rb".
-        if mode in 'rwxa':
-            return mode + 't'
+    # the size hint (in bytes, or chars) of the batches of lines read from files
+    BATCH_SIZE_HINT = 1 << 18
+
+    # the default size of the chunks read by ``iter_chunks``
+    CHUNK_SIZE = 1 << 20
+
+    # the max number of batches buffered per prefetched file
+    PREFETCH_QUEUE_SIZE = 8
+
+    def __init__(self, files=None, *, mode='r', openhook=None, encoding=None, errors=None,
+                 prefetch=0):
+        if isinstance(files, str):
+            files = (files,)
+        elif isinstance(files, os.PathLike):
+            files = (os.fspath(files),)
+        else:
+            if files is None:
+                files = sys.argv[1:]
+            files = tuple(files) or ('-',)
+        if mode not in ('r', 'rb'):
+            raise ValueError("FileInput opening mode must be 'r' or 'rb'")
+        if openhook is not None and not callable(openhook):
+            raise ValueError('FileInput openhook must be callable')
+        self._files = files
+        self._mode = mode
+        self._openhook = openhook
+        self._encoding = encoding
+        self._errors = errors
+        self._prefetch = prefetch
+
+        self._index = -1
+        self._filename = None
+        self._isstdin = False
+        self._startlineno = 0
+        self._filelineno = 0
+        self._file = None
+        self._batches = None
+        self._batch = []
+        self._lines = iter(())
+        self._prefetcher = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while True:
+            line = next(self._lines, None)
+            if line is not None:
+                self._filelineno += 1
+                return line
+            if not self._next_batch():
+                raise StopIteration
+
+    def readline(self):
+        return next(self, '' if self._mode == 'r' else b'')
+
+    def iter_batches(self, n=None):
+        """
+        Iterate over batches (lists) of lines, i.e. the same lines as iterating over this
+        object (from the current position), with a single python call per batch, instead of
+        per line.
+
+        Batches don't span files: during iteration, ``filename()`` is the file of the current
+        batch, and ``lineno()``/``filelineno()`` are of its last line.
+
+        :param n: the max number of lines per batch.  If None, batches are of roughly
+            ``BATCH_SIZE_HINT`` bytes (or chars).
+        """
+        if n is not None and n < 1:
+            raise ValueError('n must be positive')
+        while True:
+            # the remaining lines of the current batch:
+            num_remaining = operator.length_hint(self._lines)
+            if not num_remaining:
+                self._lines = iter(())
+                if not self._next_batch():
+                    return
+                continue
+            batch = self._batch
+            if num_remaining < len(batch):
+                batch = batch[len(batch) - num_remaining:]
+            self._lines = iter(())
+            if n is None:
+                self._filelineno += len(batch)
+                yield batch
+            else:
+                for i in range(0, len(batch), n):
+                    lines = batch[i:i + n]
+                    self._filelineno += len(lines)
+                    yield lines
+
+    def iter_chunks(self, size=CHUNK_SIZE, *, decode=None, errors=None):
+        """
+        Iterate over chunks of (roughly) ``size`` bytes of the files, split on line boundaries
+        (i.e. each chunk ends with a newline, except maybe the last one of a file).  This is the
+        fastest way to read the input, e.g. for passing it on, or for vectorized processing.
+
+        Chunks don't span files.  ``filename()`` and ``lineno()`` are updated per chunk.
+        Can't be combined with reading lines.
+
+        :param decode:
+            whether to decode the chunks to str (using the ``encoding``).  By default, decodes
+            in text mode, and not in binary mode ("rb").  Decoding requires an ASCII-compatible
+            encoding (e.g. UTF-8), and newlines are not translated.
+        :param errors:
+            the decoding error handler, e.g. "surrogateescape" for passing undecodable bytes
+            through (overrides the ``errors`` passed to the constructor).
+        """
+        if self._index >= 0:
+            raise ValueError("iter_chunks() can't be used after reading lines")
+        if decode is None:
+            decode = self._mode == 'r'
+        if decode:
+            import codecs
+            import locale
+            encoding = self._encoding or locale.getpreferredencoding(False)
+            get_decoder = codecs.getincrementaldecoder(encoding)
+            errors = errors or self._errors or 'strict'
+        else:
+            get_decoder = None
+
+        def read_chunks(filename, track=False):
+            chunks = self._read_chunks(filename, size, track=track)
+            if get_decoder is None:
+                yield from chunks
+                return
+            decoder = get_decoder(errors)
+            try:
+                for chunk in chunks:
+                    yield decoder.decode(chunk)
+                # (e.g. raises on a trailing incomplete character)
+                chunk = decoder.decode(b'', final=True)
+                if chunk:
+                    yield chunk
+            finally:
+                chunks.close()
+
+        newline = '\n' if decode else b'\n'
+        while self._next_file(read_chunks):
+            for chunk in self._batches:
+                self._filelineno += chunk.count(newline)
+                yield chunk
+            self.nextfile()
+
+    def map(self, func, workers=None, ordered=True, pool='process'):
+        """
+        Apply ``func`` to each of the files, in parallel, using a process (or thread) pool, and
+        iterate over the results.
+
+        ``func`` is called with a ``FileInput`` of a single file, opened the same way as this
+        one (e.g. using the same ``openhook``, for decompression).  With a process pool, it
+        must be picklable (e.g. a module-level function).
+
+        Larger files are scheduled first, to avoid a long tail of work.  Can't be combined
+        with reading lines.
+
+        :param workers: the number of workers.  Defaults to the number of CPUs.
+        :param ordered:
+            if true, results are yielded in the order of the files.  Otherwise, in the order
+            of completion.
+        :param pool: "process" or "thread".
+        """
+        if self._index >= 0:
+            raise ValueError("map() can't be used after reading lines")
+        if pool not in ('process', 'thread'):
+            raise ValueError('pool must be "process" or "thread"')
+        if pool == 'process' and '-' in self._files:
+            raise ValueError("stdin ('-') can't be read in a process pool")
+        return self._map(func, workers, ordered, pool)
+
+    def _map(self, func, workers, ordered, pool):
+        from concurrent import futures
+        files = self._files
+        self.close()
+        options = dict(
+            mode=self._mode, openhook=self._openhook, encoding=self._encoding,
+            errors=self._errors)
+        if pool == 'process':
+            executor = futures.ProcessPoolExecutor(max_workers=workers)
+        else:
+            executor = futures.ThreadPoolExecutor(max_workers=workers)
+        with executor:
+            fs = [None] * len(files)
+            for i in sorted(range(len(files)), key=lambda i: -_get_file_size(files[i])):
+                fs[i] = executor.submit(_map_file, func, files[i], options)
+            try:
+                for f in (fs if ordered else futures.as_completed(fs)):
+                    yield f.result()
+            finally:
+                # (e.g. an exception, or the caller stopped iterating)
+                for f in fs:
+                    f.cancel()
+
+    def filename(self):
+        return self._filename
+
+    def lineno(self):
+        return self._startlineno + self._filelineno
+
+    def filelineno(self):
+        return self._filelineno
+
+    def fileno(self):
+        """
+        The file descriptor of the current file, or -1 if it isn't opened by this thread
+        (e.g. when prefetching).
+        """
+        if self._file is None:
+            return -1
+        try:
+            return self._file.fileno()
+        except (OSError, ValueError):
+            return -1
+
+    def isfirstline(self):
+        return self._filelineno == 1
+
+    def isstdin(self):
+        return self._isstdin
+
+    def nextfile(self):
+        """
+        Close the current file, so the next iteration reads the first line of the next file.
+        """
+        self._lines = iter(())
+        self._batch = []
+        if self._batches is not None:
+            self._batches.close()
+            self._batches = None
+        self._file = None
+
+    def close(self):
+        self.nextfile()
+        self._index = len(self._files)
+        if self._prefetcher is not None:
+            self._prefetcher.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def _next_batch(self):
+        while True:
+            if self._batches is not None:
+                batch = next(self._batches, None)
+                if batch is not None:
+                    self._batch = batch
+                    self._lines = iter(batch)
+                    return True
+                self.nextfile()
+            if not self._next_file(self._read_batches):
+                return False
+
+    def _next_file(self, read_func):
+        """
+        Start reading the next file, using ``read_func(filename)``, which returns an iterator
+        over the items read (e.g. batches of lines).  Returns False if there are no more files.
+        """
+        if self._index + 1 >= len(self._files):
+            return False
+        self._index += 1
+        self._filename = self._files[self._index]
+        self._isstdin = self._filename == '-'
+        self._startlineno += self._filelineno
+        self._filelineno = 0
+        if self._prefetch:
+            if self._prefetcher is None:
+                self._prefetcher = _FilePrefetcher(
+                    read_func, self._files, self._prefetch, self.PREFETCH_QUEUE_SIZE)
+            self._batches = self._prefetcher.iter_items(self._index)
+        else:
+            self._batches = read_func(self._filename, track=True)
+        return True
+
+    def _open(self, filename, mode=None):
+        """
+        Return the (open) file, and whether it should be closed when done.
+        """
+        if mode is None:
+            mode = self._mode
+        if filename == '-':
+            return (sys.stdin if mode == 'r' else sys.stdin.buffer), False
+        if self._openhook is not None:
+            if self._encoding is None or mode == 'rb':
+                f = self._openhook(filename, mode)
+            else:
+                f = self._openhook(filename, mode, encoding=self._encoding, errors=self._errors)
+        elif mode == 'r':
+            f = open(filename, mode, encoding=self._encoding, errors=self._errors)
         else:
-            return mode
+            f = open(filename, mode)
+        _fadvise_sequential(f)
+        return f, True
+
+    def _read_batches(self, filename, track=False):
+        f, close = self._open(filename)
+        if track:
+            self._file = f
+        try:
+            if _is_stream(filename):
+                # (e.g. a pipe.  don't wait for a full batch, pass lines on as they come)
+                for line in iter(f.readline, f.read(0)):
+                    yield [line]
+                return
+            while True:
+                batch = f.readlines(self.BATCH_SIZE_HINT)
+                if not batch:
+                    return
+                yield batch
+        finally:
+            if close:
+                f.close()
+
+    def _read_chunks(self, filename, size, track=False):
+        f, close = self._open(filename, 'rb')
+        if track:
+            self._file = f
+        if _is_stream(filename):
+            # (e.g. a pipe.  don't wait for a full chunk, pass on the lines read so far)
+            read = getattr(f, 'read1', f.readline)
+        else:
+            read = f.read
+        try:
+            # the data read after the last newline.  (a list, not concatenated, because lines
+            # may be very long)
+            rest = []
+            while True:
+                data = read(size)
+                if not data:
+                    if rest:
+                        yield b''.join(rest)
+                    return
+                i = data.rfind(b'\n')
+                if i < 0:
+                    rest.append(data)
+                    continue
+                rest.append(data[:i + 1])
+                yield b''.join(rest)
+                rest = [data[i + 1:]] if i + 1 < len(data) else []
+        finally:
+            if close:
+                f.close()
+
+
+def _map_file(func, filename, options):
+    # (runs in a worker of ``FileInput.map``)
+    with FileInput([filename], **options) as fi:
+        return func(fi)
+
+
+def _is_stream(filename):
+    """
+    Whether the file is a stream (stdin, a pipe, a terminal etc.), as opposed to a regular
+    file, i.e. data should be passed on as soon as it's available.
+    """
+    try:
+        if filename == '-':
+            st = os.fstat(sys.stdin.fileno())
+        else:
+            st = os.stat(filename)
+    except (OSError, ValueError, AttributeError):
+        # e.g. stdin is replaced by a non-file object, or the file doesn't exist (opening it
+        # raises)
+        return filename == '-'
+    return not stat.S_ISREG(st.st_mode)
+
+
+def _get_file_size(filename):
+    try:
+        return os.path.getsize(filename)
+    except OSError:
+        # e.g. stdin.  (errors are raised when the file is opened)
+        return 0
+
+
+class _FilePrefetcher:
+    """
+    Reads files ahead, in background threads.  Each file is read (using ``read_func``) into a
+    bounded queue of items (e.g. batches of lines), which are consumed in order.
+    """
+
+    def __init__(self, read_func, files, depth, queue_size):
+        from concurrent.futures import ThreadPoolExecutor
+        self._read_func = read_func
+        self._files = files
+        self._depth = depth
+        self._queue_size = queue_size
+        # the current file, and the ones read ahead:
+        self._executor = ThreadPoolExecutor(
+            max_workers=depth + 1, thread_name_prefix='apegears-prefetch')
+        self._pending = {}  # file index -> _PrefetchedFile
+        self._next_index = 0
+
+    def iter_items(self, index):
+        # start reading the next files:
+        while self._next_index < len(self._files) and self._next_index <= index + self._depth:
+            pf = _PrefetchedFile(self._read_func, self._files[self._next_index], self._queue_size)
+            self._executor.submit(pf.run)
+            self._pending[self._next_index] = pf
+            self._next_index += 1
+        return self._pending.pop(index).iter_items()
+
+    def close(self):
+        for pf in self._pending.values():
+            pf.stop()
+        self._pending.clear()
+        self._next_index = len(self._files)
+        self._executor.shutdown(wait=False)
 
-    if ext == '.gz':
-        import gzip
-        return gzip.open(filename, fix_mode(mode))
-    elif ext == '.bz2':
-        import bz2
-        return bz2.BZ2File(filename, fix_mode(mode))
-    else:
-        return open(filename, mode)
 
+class _PrefetchedFile:
 
-hook_compressed = open_compressed
+    # how long to block on a full queue, before checking whether reading was stopped
+    PUT_TIMEOUT = 0.1
+
+    # (sentinel)
+    _EOF = object()
+
+    def __init__(self, read_func, filename, queue_size):
+        import queue
+        import threading
+        self._read_func = read_func
+        self._filename = filename
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stopped = threading.Event()
+
+    def run(self):
+        try:
+            items = self._read_func(self._filename)
+            try:
+                for item in items:
+                    if not self._put(item):
+                        break
+            finally:
+                items.close()
+            self._put(self._EOF)
+        except BaseException as e:
+            # raised when the file is reached
+            self._put(_PrefetchError(e))
+
+    def iter_items(self):
+        try:
+            while True:
+                item = self._queue.get()
+                if item is self._EOF:
+                    return
+                if isinstance(item, _PrefetchError):
+                    raise item.error
+                yield item
+        finally:
+            self.stop()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _put(self, item):
+        import queue
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=self.PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+
+class _PrefetchError:
+    __slots__ = ('error',)
+
+    def __init__(self, error):
+        self.error = error
+
+
+def _fadvise_sequential(f):
+    """
+    Hint the OS the file is going to be read sequentially (i.e. to read ahead aggressively).
+    """
+    try:
+        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+    except (AttributeError, OSError, ValueError):
+        # not supported by the OS or the file (e.g. a pipe)
+        pass
+
+
+def open_compressed(filename, mode, **kwargs):
+    """
+    An alternative implementation for ``fileinput.hook_compressed``, which works around
+    Issue5758 ("fileinput.hook_compressed returning bytes from gz file"): files are opened in
+    text mode, unless "b" is in ``mode``.
+
+    The compression codec is determined by the extension, or detected from the content of
+    the file (when reading).  See ``apegears.compression`` for the supported codecs.
+
+    :param kwargs:
+        passed to the open function (e.g. ``encoding``, ``newline``, or ``stream``, see
+        ``apegears.compression.open_compressed``)
+    """
+    from .compression import open_compressed as _open_compressed
+    return _open_compressed(filename, mode, **kwargs)
+
+
+def hook_compressed(filename, mode, **kwargs):
+    """
+    Same as ``open_compressed``, for files which are read sequentially (e.g. by ``fileinput``):
+    large compressed files may be decompressed in a subprocess, and are not seekable.
+    """
+    return open_compressed(filename, mode, stream=True, **kwargs)
 
 
 ################################################################################
 # FileType
 
+def _get_max_open_files(max_files=256):
+    """
+    The default ``MAX_OPEN_FILES``: ``max_files``, or half of the soft limit on open files
+    (``RLIMIT_NOFILE``), if lower, leaving the rest for the other files of the process.
+    """
+    try:
+        import resource
+        soft_limit, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    except (ImportError, OSError, ValueError):
+        # e.g. on windows
+        return max_files
+    if soft_limit == resource.RLIM_INFINITY:
+        return max_files
+    return max(min(soft_limit // 2, max_files), 1)
+
+
+# the max number of files opened by ``LazyOpenFile`` (in read mode) kept open at once
+MAX_OPEN_FILES = _get_max_open_files()
+
+
 class LazyOpenFile:
     """
     Lazy-open functionality.  Can be used instead of builtin ``open`` function.
 
     Upon calling ``LazyOpenFile(...)``, it checks the file can be opened, but
-    doesn't actually open it (in read mode, it might be opened and closed immediately).
+    doesn't actually open it (in read mode, this uses ``stat`` and ``access``, without opening).
 
     The file is only opened on first access.  In write mode, it means the file is not created
     until/unless being accessed.
+
+    Once opened, the file's methods (``read``, ``write``, etc.) are set as attributes of the
+    object, so calling them has no overhead compared to calling them on the file directly.
+
+    In read mode, the number of open files is bounded (see ``MAX_OPEN_FILES``): when it is
+    reached, the least-recently-used file is closed, and transparently reopened (at the same
+    position) when next accessed.  This allows having many (e.g. thousands of) file
+    arguments, without running out of file descriptors.  Also, if opening a file fails because
+    the process ran out of file descriptors, files are closed this way, and opening is retried.
+    In this mode, the methods set as attributes are thin wrappers, which keep track of the use
+    of the file, and reopen it if needed (so they remain valid if held, e.g.
+    ``readline = f.readline``).
+
+    ``name`` and ``mode`` are those passed, and accessing them doesn't open the file.
     """
 
-    def __init__(self, file, mode='r', *args, **kwargs):
+    # the methods of the file bound to the object once opened, bypassing ``__getattr__``
+    _BOUND_METHODS = (
+        'read', 'read1', 'readinto', 'readline', 'readlines', 'write', 'writelines', 'flush',
+        'seek', 'tell', 'fileno', 'truncate', 'readable', 'writable', 'seekable', 'isatty',
+    )
+
+    def __init__(self, file, mode='r', *args, open_func=open, **kwargs):
+        """
+        :param open_func: the function to open the file with (called with ``file``, ``mode``
+            and the rest of the args), e.g. ``open_output``.
+        """
         self.__dict__.update(
             _file=file,
             _mode=mode,
             _args=args,
             _kwargs=kwargs,
+            _open_func=open_func,
             _f=None,
+            # the position to seek to when reopening
+            _pos=None,
+            _closed=False,
         )
         self._check()
 
-    def __getattr__(self, attr, *args):
-        if attr in self.__dict__:
-            return super().__getattr__(attr, *args)
-        else:
-            self._open()
-            return getattr(self._f, attr, *args)
+    def __getattr__(self, attr):
+        # (only called for attributes not found on the object, e.g. before opening)
+        self._open()
+        method = self.__dict__.get(attr)
+        if method is not None:
+            # one of _BOUND_METHODS
+            return method
+        return getattr(self._f, attr)
 
     def __setattr__(self, attr, *args):
         if attr in self.__dict__:
@@ -121,20 +695,161 @@ class LazyOpenFile:
             self._open()
             return setattr(self._f, attr, *args)
 
+    def __iter__(self):
+        return self._iter_lines()
+
+    def __next__(self):
+        # (using readline, so tell() works while iterating, for reopening at the position)
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    def _iter_lines(self):
+        eof = b'' if 'b' in self._mode else ''
+        touch = _open_files.get_toucher(self)
+        while True:
+            self._open()
+            f = self._f
+            try:
+                for line in iter(f.readline, eof):
+                    try:
+                        touch()
+                    except KeyError:
+                        # (e.g. closed concurrently)
+                        pass
+                    yield line
+                return
+            except ValueError:
+                if self._f is f or self._closed:
+                    raise
+                # the file was closed (evicted) while iterating.  reopen and resume.
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is not None and self._f is not None:
+            # e.g. don't commit an atomic output file (see ``open_output``)
+            discard = getattr(self._f, 'discard', None)
+            if discard is not None:
+                discard()
+        self.close()
+
+    @property
+    def name(self):
+        return self._file
+
+    @property
+    def mode(self):
+        return self._mode
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def close(self):
+        if self._closed:
+            return
+        self.__dict__['_closed'] = True
+        f = self._f
+        if f is not None:
+            _open_files.remove(self)
+            self._unbind()
+            f.close()
+
     def _open(self):
         if self._f is None:
-            self._f = self._raw_open()
+            if self._closed:
+                raise ValueError('I/O operation on closed file.')
+            f = self._raw_open_evicting()
+            if self._pos is not None:
+                f.seek(self._pos)
+            self._bind(f)
+            if self._is_read_mode():
+                _open_files.add(self)
+        elif self._is_read_mode():
+            _open_files.touch(self)
+
+    def _evict(self):
+        """
+        Close the file, to be reopened (at the same position) on next access.
+        Returns False if can't.
+        """
+        f = self._f
+        try:
+            pos = f.tell()
+        except (OSError, ValueError):
+            # e.g. not seekable
+            return False
+        self._unbind()
+        self.__dict__['_pos'] = pos
+        f.close()
+        return True
+
+    def _bind(self, f):
+        self.__dict__['_f'] = f
+        pooled = self._is_read_mode()
+        for name in self._BOUND_METHODS:
+            method = getattr(f, name, None)
+            if method is not None:
+                self.__dict__[name] = self._pooled_method(f, name, method) if pooled else method
+
+    def _pooled_method(self, f, name, method):
+        """
+        Wrap a method of the (pooled) file ``f``, to mark the file as most-recently used when
+        called, and to reopen it if it was evicted.
+        """
+        import weakref
+        # (not referencing self, which would keep it, and the file, alive until gc)
+        self_ref = weakref.ref(self)
+        touch = _open_files.get_toucher(self)
+
+        def pooled_method(*args, **kwargs):
+            lazy_file = self_ref()
+            if lazy_file is not None and lazy_file._f is not f:
+                # evicted (or closed) since.  call the method of the reopened file
+                lazy_file._open()
+                return getattr(lazy_file, name)(*args, **kwargs)
+            try:
+                touch()
+            except KeyError:
+                # (e.g. closed concurrently)
+                pass
+            return method(*args, **kwargs)
+
+        return pooled_method
+
+    def _unbind(self):
+        self.__dict__['_f'] = None
+        for name in self._BOUND_METHODS:
+            self.__dict__.pop(name, None)
 
     def _raw_open(self):
-        return open(self._file, self._mode, *self._args, **self._kwargs)
+        return self._open_func(self._file, self._mode, *self._args, **self._kwargs)
+
+    def _raw_open_evicting(self):
+        # if out of file descriptors, close files in the pool (in LRU order) until it succeeds
+        while True:
+            try:
+                return self._raw_open()
+            except OSError as e:
+                if e.errno not in (errno.EMFILE, errno.ENFILE) or not _open_files.evict_one():
+                    raise
+
+    def _is_read_mode(self):
+        return self._mode[0] == 'r' and '+' not in self._mode
 
     def _check(self):
         mode = self._mode[0]
         f = self._file
         if mode == 'r':
-            # read mode, open and close, and raise if fails:
-            with self._raw_open():
-                pass
+            # read mode.  check without opening, and raise the same errors open would raise:
+            st = os.stat(f)
+            if stat.S_ISDIR(st.st_mode):
+                raise IsADirectoryError(errno.EISDIR, os.strerror(errno.EISDIR), f)
+            if not os.access(f, os.R_OK | (os.W_OK if '+' in self._mode else 0)):
+                raise PermissionError(errno.EACCES, os.strerror(errno.EACCES), f)
         else:
             # write mode
             if (not _is_writeable(f)) or (mode == 'x' and os.path.exists(f)):
@@ -143,24 +858,116 @@ class LazyOpenFile:
                 assert 0, 'should have raised already'
 
     def __repr__(self):
-        return '<%s %r %r>' % (type(self).__name__, self._flle, self._mode)
+        return '<%s %r %r>' % (type(self).__name__, self._file, self._mode)
+
+
+class _OpenFilePool:
+    """
+    The (process-wide) LRU pool of ``LazyOpenFile`` objects with an open file, bounded by
+    ``MAX_OPEN_FILES``.
+    """
+
+    def __init__(self):
+        import threading
+        # id -> weakref.  ordered from least- to most-recently used
+        self._files = collections.OrderedDict()
+        self._lock = threading.RLock()
+
+    def add(self, lazy_file):
+        import weakref
+        key = id(lazy_file)
+        with self._lock:
+            self._files[key] = weakref.ref(lazy_file, lambda _: self._discard(key))
+            self._evict()
+
+    def touch(self, lazy_file):
+        with self._lock:
+            try:
+                self._files.move_to_end(id(lazy_file))
+            except KeyError:
+                pass
+
+    def get_toucher(self, lazy_file):
+        """
+        Return a function which marks the file as most-recently used, or raises KeyError if
+        it's not in the pool.  Cheaper than ``touch``, for calling on each access to the file.
+        """
+        import functools
+        # (move_to_end is atomic, so not taking the lock)
+        return functools.partial(self._files.move_to_end, id(lazy_file))
+
+    def remove(self, lazy_file):
+        self._discard(id(lazy_file))
+
+    def evict_one(self):
+        """
+        Close the least-recently used file which can be reopened.  Returns False if there is
+        none.
+        """
+        with self._lock:
+            for key, ref in list(self._files.items()):
+                lazy_file = ref()
+                if lazy_file is None or lazy_file._evict():
+                    del self._files[key]
+                    if lazy_file is not None:
+                        return True
+        return False
+
+    def __len__(self):
+        return len(self._files)
+
+    def _discard(self, key):
+        with self._lock:
+            self._files.pop(key, None)
+
+    def _evict(self):
+        # (the most-recently used file is the one just opened)
+        for key, ref in list(self._files.items())[:-1]:
+            if len(self._files) <= MAX_OPEN_FILES:
+                break
+            lazy_file = ref()
+            if lazy_file is None or lazy_file._evict():
+                del self._files[key]
+
+
+_open_files = _OpenFilePool()
 
 
 class FileType(_ap.FileType):
     """
-    Same as ``argparse.FileType``, but in write-mode (w/a/x), the file
-    is opened lazily, to avoid creating a file before we actually need to.
+    Same as ``argparse.FileType``, but files are opened lazily: in write-mode (w/a/x), to avoid
+    creating a file before we actually need to, and in read mode, to avoid keeping (possibly
+    many) files open.
 
     The lazy functionality is implemented in ``LazyOpenFile``.
+
+    In write mode, output files can also be written atomically, and compressed (see
+    ``open_output``).
     """
 
+    def __init__(self, mode='r', bufsize=-1, encoding=None, errors=None, *,
+                 atomic=False, fsync=None, compress=False):
+        """
+        :param atomic, fsync, compress:
+            for write modes, passed to ``open_output``.  ``bufsize`` is also used as the size
+            of the output buffer.
+        """
+        super().__init__(mode, bufsize, encoding, errors)
+        self._output_kwargs = dict(atomic=atomic, fsync=fsync, compress=compress)
+        if not any(self._output_kwargs.values()):
+            self._output_kwargs = None
+
     def __call__(self, string):
-        is_write = self._mode and self._mode[0] in 'wax'
-        if string == '-' or not is_write:
+        if string == '-':
             return super().__call__(string)
 
         # all other arguments are used as file names
+        is_write = self._mode[0] in 'wax'
         try:
+            if is_write and getattr(self, '_output_kwargs', None):
+                return LazyOpenFile(
+                    string, self._mode, self._bufsize, self._encoding, self._errors,
+                    open_func=open_output, **self._output_kwargs)
             return LazyOpenFile(string, self._mode, self._bufsize, self._encoding, self._errors)
         except OSError as e:
             message = _ap._("can't open '%s': %s")
@@ -187,16 +994,400 @@ def _is_writeable(fnm):
     return os.access(pdir, os.W_OK)
 
 
+################################################################################
+# Output files
+
+# the policies of when to fsync output files:
+#   never: leave it to the OS
+#   file: fsync the file on close (before renaming it, when atomic)
+#   always: also fsync the directory, after renaming (so the rename is durable)
+FSYNC_POLICIES = ('never', 'file', 'always')
+
+# the default size of the buffers of output files opened by ``open_output``
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+# the max number of buffers queued for compressing, per output file
+COMPRESS_QUEUE_SIZE = 4
+
+
+def open_output(filename, mode='w', buffering=-1, encoding=None, errors=None, newline=None, *,
+                atomic=False, fsync=None, compress=False):
+    """
+    Open a file for writing (mode w/a/x, text or binary), atomically and/or compressed.
+
+    :param buffering:
+        the size of the output buffer.  Defaults to ``OUTPUT_BUFFER_SIZE`` (-1), 0 is not
+        supported.
+    :param atomic:
+        if true, data is written to a temp file in the same directory, which is renamed to
+        ``filename`` on ``close()``, so readers never see a partially-written file.  If the file
+        is never closed (or closed due to an exception in a ``with`` block, or by calling
+        ``discard()``), the temp file is removed, and ``filename`` is left untouched.
+        (If not atomic, a file which is never closed is closed normally when garbage-collected.)
+    :param fsync:
+        when to fsync, one of ``FSYNC_POLICIES``.  Defaults to "file" if atomic, else "never".
+    :param compress:
+        if true, and the extension of ``filename`` is of a compression codec (e.g. ".gz",
+        ".xz", ".zst", see ``apegears.compression``), the data is compressed, in a background
+        thread, so writing doesn't block on compressing.
+    """
+    base_mode = mode.replace('b', '').replace('t', '')
+    if base_mode not in ('w', 'a', 'x'):
+        raise ValueError('invalid mode for output: %r' % (mode,))
+    if fsync is None:
+        fsync = 'file' if atomic else 'never'
+    if fsync not in FSYNC_POLICIES:
+        raise ValueError('fsync must be one of %s: %r' % (', '.join(FSYNC_POLICIES), fsync))
+    if buffering == 0:
+        raise ValueError('unbuffered output is not supported')
+    if buffering is None or buffering < 0:
+        buffering = OUTPUT_BUFFER_SIZE
+    codec = None
+    if compress:
+        from .compression import find_codec
+        codec = find_codec(filename, base_mode)
+
+    raw = _OutputRaw(filename, base_mode, atomic=atomic, fsync=fsync, codec=codec)
+    f = _OutputBufferedWriter(raw, buffering)
+    if 'b' in mode:
+        if any(x is not None for x in (encoding, errors, newline)):
+            raise ValueError('binary mode doesn\'t take encoding/errors/newline arguments')
+        return f
+    return _OutputTextWrapper(f, encoding=encoding, errors=errors, newline=newline)
+
+
+class _OutputRaw(io.RawIOBase):
+    """
+    The raw layer of files opened by ``open_output``: writes to the file (or to a temp file,
+    if atomic), possibly through a compressor running in a background thread, which is fed
+    through a bounded queue.  On ``close()``, the file is fsynced (by policy), and the temp
+    file is renamed.
+    """
+
+    def __init__(self, filename, base_mode, *, atomic, fsync, codec):
+        self.atomic = atomic
+        self.name = filename
+        self.mode = base_mode + 'b'
+        self._fsync = fsync
+        self._discarded = False
+        self._is_exclusive = base_mode == 'x'
+        self._queue = self._thread = self._error = None
+        self._tmp_filename = None
+        if atomic:
+            self._tmp_filename = _create_temp_file(filename, base_mode)
+            path, sink_mode = self._tmp_filename, 'wb' if base_mode == 'x' else base_mode + 'b'
+        else:
+            path, sink_mode = filename, base_mode + 'b'
+        try:
+            if codec is None:
+                self._sink = io.FileIO(path, sink_mode.replace('b', ''))
+            else:
+                self._sink = codec.open(path, sink_mode, stream=True)
+                self._start_compressing()
+        except BaseException:
+            self._remove_temp_file()
+            raise
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        n = len(memoryview(b))
+        if self._discarded:
+            return n
+        if self._queue is None:
+            return self._sink.write(b)
+        self._raise_compress_error()
+        # (a copy, the buffer is reused by the caller)
+        self._queue.put(bytes(b))
+        return n
+
+    def discard(self):
+        """
+        Don't commit the file on ``close()``: if atomic, the temp file is removed.
+        """
+        self._discarded = True
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self._close_sink()
+            if self._discarded:
+                self._remove_temp_file()
+                return
+            path = self._tmp_filename or self.name
+            if self._fsync != 'never':
+                _fsync_path(path)
+            if self._tmp_filename is not None:
+                self._commit()
+            if self._fsync == 'always':
+                _fsync_path(os.path.dirname(os.path.abspath(self.name)))
+        except BaseException:
+            self._remove_temp_file()
+            raise
+        finally:
+            super().close()
+
+    def __del__(self):
+        # never closed explicitly: don't commit, if atomic
+        if not self.closed and self.atomic:
+            self._discarded = True
+        super().__del__()
+
+    def _commit(self):
+        if self._is_exclusive:
+            # (fails if the file was created in the meantime)
+            os.link(self._tmp_filename, self.name)
+            os.remove(self._tmp_filename)
+        else:
+            os.replace(self._tmp_filename, self.name)
+        self._tmp_filename = None
+
+    def _close_sink(self):
+        try:
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread.join()
+                self._raise_compress_error()
+        finally:
+            self._sink.close()
+
+    def _start_compressing(self):
+        import queue
+        import threading
+        self._queue = queue.Queue(COMPRESS_QUEUE_SIZE)
+        self._thread = threading.Thread(
+            target=self._compress, name='apegears-compress %s' % self.name, daemon=True)
+        self._thread.start()
+
+    def _compress(self):
+        # (runs in the background thread)
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                return
+            if self._error is None:
+                try:
+                    self._sink.write(chunk)
+                except BaseException as e:
+                    # raised in the writing thread.  keep consuming, to not block it.
+                    self._error = e
+
+    def _raise_compress_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def _remove_temp_file(self):
+        if self._tmp_filename is not None:
+            try:
+                os.remove(self._tmp_filename)
+            except FileNotFoundError:
+                pass
+            self._tmp_filename = None
+
+
+class _OutputBufferedWriter(io.BufferedWriter):
+
+    @property
+    def atomic(self):
+        return self.raw.atomic
+
+    def discard(self):
+        self.raw.discard()
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is not None:
+            self.discard()
+        return super().__exit__(exc_type, *exc_info)
+
+    def __del__(self):
+        if not self.closed and self.atomic:
+            self.discard()
+        super().__del__()
+
+
+class _OutputTextWrapper(io.TextIOWrapper):
+
+    @property
+    def atomic(self):
+        return self.buffer.atomic
+
+    def discard(self):
+        self.buffer.discard()
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is not None:
+            self.discard()
+        return super().__exit__(exc_type, *exc_info)
+
+    def __del__(self):
+        if not self.closed and self.atomic:
+            self.discard()
+        super().__del__()
+
+
+def _create_temp_file(filename, base_mode):
+    """
+    Create the temp file for atomically writing ``filename``, in the same directory.
+    """
+    if base_mode == 'x' and os.path.exists(filename):
+        raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), filename)
+    dirname, basename = os.path.split(os.path.abspath(filename))
+    while True:
+        tmp_filename = os.path.join(dirname, '.%s.%s.tmp' % (basename, os.urandom(4).hex()))
+        try:
+            # (mode is subject to the umask, same as the file would have been)
+            os.close(os.open(tmp_filename, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666))
+            break
+        except FileExistsError:
+            continue
+    if base_mode == 'a' and os.path.exists(filename):
+        import shutil
+        try:
+            shutil.copyfile(filename, tmp_filename)
+            shutil.copymode(filename, tmp_filename)
+        except BaseException:
+            os.remove(tmp_filename)
+            raise
+    return tmp_filename
+
+
+def _fsync_path(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    except OSError:
+        # e.g. directories, on some platforms
+        if not os.path.isdir(path):
+            raise
+    finally:
+        os.close(fd)
+
+
 ################################################################################
 # Pickle types
+#
+# Besides regular pickle files, the pickle types support a file format of pickles with
+# out-of-band buffers (pickle protocol 5), written using ``save_pickle``.  Large buffers
+# (e.g. of numpy arrays, or ``pickle.PickleBuffer`` objects) are stored after the pickle
+# stream, and are loaded as zero-copy views over a memory-mapping of the file.  This avoids
+# copying the payloads into memory, which matters for very large pickles.
+#
+# File layout:
+#   MAGIC | pickle stream | buffer 0 | buffer 1 | ... | index | num index entries | MAGIC
+# where the index is a list of (offset, length) pairs, of the pickle stream followed by the
+# buffers.  Buffers are aligned to ``_PICKLE_BUFFER_ALIGNMENT``.
 
+_PICKLE_MAGIC = b'APGPKL\x00\x01'
+_PICKLE_BUFFER_ALIGNMENT = 64
+_PICKLE_MIN_OUT_OF_BAND_SIZE = 4096
 
-def _read_pickle(fn, mode='rb'):
-    with open_compressed(fn, mode) as F:
-        return pickle.load(F)
 
+def save_pickle(obj, filename, protocol=5):
+    """
+    Pickle ``obj`` to a file, storing large buffers out-of-band, so they can be loaded
+    without copying (see ``load_pickle``).  The file is written atomically.
+
+    If the filename has a compression extension (e.g. ".gz"), a regular (compressed) pickle
+    is written instead.
+    """
+    import pickle
+    if _is_compressed(filename, 'w'):
+        with open_compressed(filename, 'wb') as F:
+            pickle.dump(obj, F, protocol=protocol)
+        return
+
+    tmp_filename = '%s.%s.tmp' % (filename, os.getpid())
+    try:
+        with open(tmp_filename, 'wb') as F:
+            F.write(_PICKLE_MAGIC)
+            buffers = []
 
-register_spec(
+            def buffer_callback(buf):
+                try:
+                    raw = buf.raw()
+                except BufferError:
+                    # not contiguous.  serialize in-band.
+                    return True
+                if raw.nbytes < _PICKLE_MIN_OUT_OF_BAND_SIZE:
+                    return True
+                buffers.append(raw)
+                return False
+
+            pickle.Pickler(F, protocol=protocol, buffer_callback=buffer_callback).dump(obj)
+            index = [(len(_PICKLE_MAGIC), F.tell() - len(_PICKLE_MAGIC))]
+            for raw in buffers:
+                F.write(b'\0' * (-F.tell() % _PICKLE_BUFFER_ALIGNMENT))
+                index.append((F.tell(), raw.nbytes))
+                F.write(raw)
+            F.write(struct.pack('<%dQ' % (2 * len(index)), *itertools.chain(*index)))
+            F.write(struct.pack('<Q', len(index)))
+            F.write(_PICKLE_MAGIC)
+        os.replace(tmp_filename, filename)
+    finally:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+
+
+def load_pickle(filename, *, use_mmap=True):
+    """
+    Load a pickle file: a regular (optionally compressed) pickle, or one written using
+    ``save_pickle``.
+
+    Uncompressed files are read through a memory-mapping of the file.  Buffers stored
+    out-of-band (by ``save_pickle``) are not copied, i.e. the objects using them (e.g. numpy
+    arrays) are views over the (copy-on-write) mapping, which is kept open as long as they
+    are.
+    """
+    import pickle
+    if _is_compressed(filename) or not use_mmap:
+        with open_compressed(filename, 'rb') as F:
+            return pickle.load(F)
+
+    import mmap
+    with open(filename, 'rb') as F:
+        if os.fstat(F.fileno()).st_size == 0:
+            return pickle.load(F)  # raises EOFError
+        mm = mmap.mmap(F.fileno(), 0, access=mmap.ACCESS_COPY)
+    if mm[:len(_PICKLE_MAGIC)] == _PICKLE_MAGIC:
+        # (the mapping is not closed, the loaded objects reference it)
+        return _load_out_of_band_pickle(mm)
+    try:
+        return pickle.loads(mm)
+    finally:
+        mm.close()
+
+
+def _load_out_of_band_pickle(mm):
+    import pickle
+    size = len(mm)
+    trailer_size = 8 + len(_PICKLE_MAGIC)
+    if size < len(_PICKLE_MAGIC) + trailer_size or mm[-len(_PICKLE_MAGIC):] != _PICKLE_MAGIC:
+        raise pickle.UnpicklingError('truncated pickle file')
+    n, = struct.unpack_from('<Q', mm, size - trailer_size)
+    index_offset = size - trailer_size - 16 * n
+    if n == 0 or index_offset < len(_PICKLE_MAGIC):
+        raise pickle.UnpicklingError('corrupt pickle file')
+    index = struct.unpack_from('<%dQ' % (2 * n), mm, index_offset)
+    view = memoryview(mm)
+    parts = [view[offset:offset + length] for offset, length in zip(index[::2], index[1::2])]
+    return pickle.loads(parts[0], buffers=parts[1:])
+
+
+def _is_compressed(filename, mode='r'):
+    from .compression import find_codec
+    return find_codec(filename, mode) is not None
+
+
+def _read_pickle(fn):
+    try:
+        return load_pickle(fn)
+    except OSError as e:
+        raise _open_error(fn, e)
+
+
+_register_builtin_spec(
     'pickled_data',
     dict(
         from_string=_read_pickle,
@@ -205,5 +1396,168 @@ register_spec(
     ),
 )
 
+_register_builtin_spec(
+    'lazy_pickled_data',
+    dict(
+        from_string=_read_pickle,
+        lazy=True,
+        metavar='PKL_FILE',
+        help='pickle file (optionally compressed), loaded on first access'
+    ),
+)
+
+
+################################################################################
+# Data file types: JSON, JSON Lines, NPY and CSV
+#
+# All of them support compressed files (see ``open_compressed``).  The streaming types
+# (``jsonl_stream``, ``csv_stream``) only check the file can be opened while parsing, and read
+# it (line by line, in constant memory) on iteration.
+
+def _read_json(fn):
+    import json
+    try:
+        F = open_compressed(fn, 'r', encoding='utf-8', stream=True)
+    except OSError as e:
+        raise _open_error(fn, e)
+    with F:
+        try:
+            return json.load(F)
+        except ValueError as e:
+            raise _ap.ArgumentTypeError('invalid JSON file %r: %s' % (fn, e))
+
+
+def _read_npy(fn):
+    import numpy
+    try:
+        if _is_compressed(fn):
+            # can't memory-map a compressed file
+            with open_compressed(fn, 'rb') as F:
+                return numpy.load(F)
+        return numpy.load(fn, mmap_mode='r')
+    except OSError as e:
+        raise _open_error(fn, e)
+    except ValueError as e:
+        raise _ap.ArgumentTypeError('invalid NPY file %r: %s' % (fn, e))
+
+
+class _DataFileStream:
+    """
+    Base class for iterables over the records of a data file, which are (re)read from the
+    file on each iteration.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    @classmethod
+    def from_string(cls, fn):
+        # only check the file can be opened.  it is read on iteration.
+        try:
+            with open(fn, 'rb'):
+                pass
+        except OSError as e:
+            raise _open_error(fn, e)
+        return cls(fn)
+
+    def _open(self, **kwargs):
+        return open_compressed(self.filename, 'r', stream=True, **kwargs)
+
+    def __repr__(self):
+        return '<%s %r>' % (type(self).__name__, self.filename)
+
+
+class JsonLinesStream(_DataFileStream):
+    """
+    An iterable over the records of a JSON Lines file (one JSON value per line).  Blank lines
+    are skipped.
+    """
+
+    def __iter__(self):
+        import json
+        with self._open(encoding='utf-8') as F:
+            for lineno, line in enumerate(F, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    raise ValueError('%s:%d: %s' % (self.filename, lineno, e)) from None
+
+
+class CsvStream(_DataFileStream):
+    """
+    An iterable over the rows of a CSV file (each row is a list of strings).
+
+    Use ``iter_chunks()`` for iterating over lists of rows.
+    """
+
+    DEFAULT_CHUNK_SIZE = 10000
+
+    def __init__(self, filename, **fmtparams):
+        """
+        :param fmtparams: passed to ``csv.reader`` (e.g. ``delimiter``)
+        """
+        super().__init__(filename)
+        self.fmtparams = fmtparams
+
+    def __iter__(self):
+        import csv
+        with self._open(newline='') as F:
+            yield from csv.reader(F, **self.fmtparams)
+
+    def iter_chunks(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        rows = iter(self)
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+
+_register_builtin_spec(
+    'json_data',
+    dict(
+        from_string=_read_json,
+        metavar='JSON_FILE',
+        help='JSON file (optionally compressed)'
+    ),
+)
+
+_register_builtin_spec(
+    'jsonl_stream',
+    dict(
+        from_string=JsonLinesStream.from_string,
+        metavar='JSONL_FILE',
+        help='JSON Lines file (optionally compressed), streamed'
+    ),
+)
+
+_register_builtin_spec(
+    'npy_data',
+    dict(
+        from_string=_read_npy,
+        metavar='NPY_FILE',
+        help='NPY file (memory-mapped, unless compressed)'
+    ),
+)
+
+_register_builtin_spec(
+    'csv_stream',
+    dict(
+        from_string=CsvStream.from_string,
+        metavar='CSV_FILE',
+        help='CSV file (optionally compressed), streamed'
+    ),
+)
+
+
+################################################################################
+# privates
+
+def _open_error(fn, e):
+    message = _ap._("can't open '%s': %s")
+    return _ap.ArgumentTypeError(message % (fn, e))
+
 
 ################################################################################
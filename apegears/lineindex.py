@@ -0,0 +1,300 @@
+"""
+Random access to the lines of (possibly huge) text files, using an index of line offsets.
+
+Getting lines N..M of a file normally means reading it from the start.  The index stores the
+offset of every ``stride``-th line (in a compact ``array``), so reading a range of lines seeks
+to the nearest indexed line before it, and skips less than ``stride`` lines.
+
+The index is built on first use (which reads the whole file once), and cached, the same way
+as gzip indexes (see ``apegears.gzindex``): in a sidecar file (``<filename>.lineidx``), or in
+the cache directory.  A cached index is rebuilt if the size or the modification time of the
+file changed.  Compressed files are supported (gzip files are read through a gzip index).
+
+Typically used like::
+
+    parser.add_positional('infile', type='indexed_text')
+    parser.add_optional('lines', type='range')  # e.g. --lines 1000000:2000000
+    args = parser.parse_args()
+    for line in args.infile.iter_lines(args.lines):
+        ...
+
+and for splitting a file between K parallel workers, ``args.infile.split(K)``.
+"""
+
+import os
+import array
+import bisect
+import struct
+import locale
+import itertools
+
+from .spec import _register_builtin_spec
+from .cache import _get_cached_index, _to_little_endian
+
+try:
+    import numpy as _numpy
+except ImportError:
+    _numpy = None
+
+
+################################################################################
+# Consts
+
+# the offset of every DEFAULT_STRIDE-th line is stored in the index
+DEFAULT_STRIDE = 1024
+
+# the suffix of sidecar index files
+INDEX_SUFFIX = '.lineidx'
+
+_READ_CHUNK_SIZE = 1 << 20
+
+# magic, file size, file mtime (ns), stride, (uncompressed) size, num lines
+_INDEX_HEADER = struct.Struct('<8sQQQQQ')
+_INDEX_MAGIC = b'APGLNIX\x01'
+
+
+################################################################################
+# LineIndex
+
+class LineIndex:
+    """
+    An index of the offsets of every ``stride``-th line of a text file.
+
+    ``offsets[i]`` is the offset of line ``i * stride`` (0-based).  Lines are terminated by
+    "\\n" (a last line without it is also counted).
+    """
+
+    def __init__(self, stride, size, num_lines, offsets, file_size=0, file_mtime_ns=0):
+        self.stride = stride
+        # the size of the (uncompressed) data
+        self.size = size
+        self.num_lines = num_lines
+        self.offsets = offsets
+        # the stat of the indexed file, for detecting a stale index
+        self.file_size = file_size
+        self.file_mtime_ns = file_mtime_ns
+
+    @classmethod
+    def build(cls, filename, stride=DEFAULT_STRIDE):
+        """
+        Build the index of a file, by reading it.
+        """
+        offsets = array.array('Q', [0])
+        size = num_newlines = 0
+        # the number of the newline after which the next indexed line starts
+        next_newline = stride
+        last_byte = b''
+        st = os.stat(filename)
+        with _open(filename) as F:
+            for chunk in iter(lambda: F.read(_READ_CHUNK_SIZE), b''):
+                n = chunk.count(b'\n')
+                if num_newlines + n >= next_newline:
+                    positions = _find_newlines(
+                        chunk, range(next_newline - num_newlines - 1, n, stride))
+                    offsets.extend(size + pos + 1 for pos in positions)
+                    next_newline += stride * len(positions)
+                num_newlines += n
+                size += len(chunk)
+                last_byte = chunk[-1:]
+        num_lines = num_newlines + (1 if last_byte not in (b'', b'\n') else 0)
+        if offsets[-1] == size and num_lines:
+            # (after the last newline, at the end of the file, there's no line)
+            offsets.pop()
+        return cls(stride, size, num_lines, offsets,
+                   file_size=st.st_size, file_mtime_ns=st.st_mtime_ns)
+
+    def find(self, lineno):
+        """
+        Return the offset and the number of the last indexed line at or before ``lineno``.
+        """
+        i = min(lineno // self.stride, len(self.offsets) - 1)
+        return self.offsets[i], i * self.stride
+
+    def is_stale(self, filename):
+        st = os.stat(filename)
+        return (st.st_size, st.st_mtime_ns) != (self.file_size, self.file_mtime_ns)
+
+    ################################################################################
+    # save/load
+
+    def save(self, filename):
+        """
+        Save the index to a file.  The file is written atomically.
+        """
+        tmp_filename = '%s.%s.tmp' % (filename, os.getpid())
+        try:
+            with open(tmp_filename, 'wb') as F:
+                F.write(_INDEX_HEADER.pack(
+                    _INDEX_MAGIC, self.file_size, self.file_mtime_ns, self.stride, self.size,
+                    self.num_lines))
+                F.write(_to_little_endian(self.offsets).tobytes())
+            os.replace(tmp_filename, filename)
+        finally:
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Load an index saved using ``save``.  Raises ValueError if the file is not a valid index.
+        """
+        with open(filename, 'rb') as F:
+            data = F.read()
+        try:
+            magic, file_size, file_mtime_ns, stride, size, num_lines = \
+                _INDEX_HEADER.unpack_from(data)
+        except struct.error:
+            raise ValueError('%s is not a line index' % filename) from None
+        if magic != _INDEX_MAGIC or (len(data) - _INDEX_HEADER.size) % 8:
+            raise ValueError('%s is not a line index' % filename)
+        offsets = array.array('Q')
+        offsets.frombytes(data[_INDEX_HEADER.size:])
+        return cls(stride, size, num_lines, _to_little_endian(offsets),
+                   file_size=file_size, file_mtime_ns=file_mtime_ns)
+
+
+def get_line_index(filename, stride=None, cache_dir=None):
+    """
+    Return the line index of a file: the cached index, if up to date, or a newly built one
+    (which is then cached).
+
+    :param stride: the distance (in lines) between indexed lines.  Defaults to
+        ``DEFAULT_STRIDE``, or to the stride of the cached index.
+    :param cache_dir: same as in ``gzindex.get_index``.
+    """
+    return _get_cached_index(
+        filename, INDEX_SUFFIX, 'lineindex', LineIndex.load,
+        lambda: LineIndex.build(filename, stride or DEFAULT_STRIDE),
+        cache_dir=cache_dir, is_usable=lambda index: stride in (None, index.stride))
+
+
+################################################################################
+# IndexedTextFile
+
+class IndexedTextFile:
+    """
+    A text file (optionally compressed), for reading ranges of lines without scanning it from
+    the start.  The line index is built (or loaded) on first use.
+    """
+
+    def __init__(self, filename, encoding=None, errors=None):
+        self.filename = filename
+        self.encoding = encoding
+        self.errors = errors
+        self._index = None
+
+    @classmethod
+    def from_string(cls, fn):
+        # only check the file can be opened.  it is indexed on first use.
+        try:
+            with open(fn, 'rb'):
+                pass
+        except OSError as e:
+            from .iofile import _open_error
+            raise _open_error(fn, e)
+        return cls(fn)
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = get_line_index(self.filename)
+        return self._index
+
+    def __len__(self):
+        return self.index.num_lines
+
+    def __iter__(self):
+        return self.iter_lines()
+
+    def iter_lines(self, lines=None, binary=False):
+        """
+        Iterate over a range of lines.
+
+        :param lines:
+            a ``range`` (or ``slice``) of (0-based) line numbers, e.g. the value of a
+            ``type='range'`` argument.  Defaults to all lines.
+        :param binary: if true, lines are returned as bytes.
+        """
+        if lines is None:
+            lines = range(len(self))
+        else:
+            lines = range(len(self))[slice(lines.start, lines.stop, lines.step)]
+        if not lines:
+            return
+        encoding = self.encoding or locale.getpreferredencoding(False)
+        errors = self.errors or 'strict'
+        first = lines[0] if lines.step > 0 else lines[-1]
+        offset, lineno = self.index.find(first)
+        with _open(self.filename) as F:
+            F.seek(offset)
+            for _ in range(first - lineno):
+                F.readline()
+            it = iter(F.readline, b'')
+            if lines.step > 0:
+                it = itertools.islice(it, 0, len(lines) * lines.step, lines.step)
+            else:
+                # (read forward, and reverse)
+                it = reversed(list(itertools.islice(it, 0, len(lines) * -lines.step, -lines.step)))
+            for line in it:
+                yield line if binary else line.decode(encoding, errors)
+
+    def split(self, num_chunks):
+        """
+        Split the lines into (up to) ``num_chunks`` ranges of consecutive lines, of about the
+        same size in bytes, e.g. for processing by parallel workers.  The ranges start at
+        indexed lines, so no reading is needed.
+
+        :return: a list of ``range`` objects, of line numbers.
+        """
+        index = self.index
+        starts = [0]
+        for j in range(1, num_chunks):
+            i = bisect.bisect_left(index.offsets, index.size * j // num_chunks)
+            lineno = min(i * index.stride, index.num_lines)
+            if lineno > starts[-1]:
+                starts.append(lineno)
+        ends = starts[1:] + [index.num_lines]
+        return [range(start, end) for start, end in zip(starts, ends) if start < end]
+
+    def __repr__(self):
+        return '<%s %r>' % (type(self).__name__, self.filename)
+
+
+_register_builtin_spec(
+    'indexed_text',
+    dict(
+        from_string=IndexedTextFile.from_string,
+        metavar='TEXT_FILE',
+        help='text file (optionally compressed), indexed for random access to lines'
+    ),
+)
+
+
+################################################################################
+# privates
+
+def _open(filename):
+    from .compression import open_compressed
+    return open_compressed(filename, 'rb', index=True)
+
+
+def _find_newlines(chunk, ordinals):
+    """
+    Return the positions in ``chunk`` of the newlines with the given (0-based, ascending)
+    ordinals.
+    """
+    if _numpy is not None:
+        positions = _numpy.flatnonzero(_numpy.frombuffer(chunk, _numpy.uint8) == ord('\n'))
+        return positions[ordinals.start:ordinals.stop:ordinals.step].tolist()
+    result = []
+    pos = -1
+    count = 0
+    for ordinal in ordinals:
+        while count <= ordinal:
+            pos = chunk.find(b'\n', pos + 1)
+            count += 1
+        result.append(pos)
+    return result
+
+
+################################################################################
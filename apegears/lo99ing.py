@@ -5,19 +5,25 @@ If lo99ing is installed, a -L/--log-levels option is automatically added to pars
 to allow setting log-level overrides from cli.
 """
 
-try:
-    import lo99ing
-except ImportError as e:
-    lo99ing = None
-    _import_error = e
+from .spec import register_spec
 
 
 ################################################################################
 
+def _is_lo99ing_installed():
+    # (checked without importing lo99ing, which is only imported when overriding levels)
+    import importlib.util
+    try:
+        return importlib.util.find_spec('lo99ing') is not None
+    except (ImportError, ValueError):
+        return False
+
+
 def add_log_levels_option(parser, *args, force=False, **kwargs):
-    if lo99ing is None:
-        if force:
-            raise _import_error
+    if force:
+        # raise ImportError if not installed
+        import lo99ing  # noqa: F401
+    elif not _is_lo99ing_installed():
         return None
 
     return parser.add_dict(
@@ -30,6 +36,9 @@ def add_log_levels_option(parser, *args, force=False, **kwargs):
 
 
 def _post_process_log_levels(cli_levels, **kwargs):
+    if not cli_levels:
+        return cli_levels
+    import lo99ing
     logger = lo99ing.get_logger('lo99ing')
     for logger_name, level in cli_levels.items():
         logger.info('LOG LEVEL OVERRIDE: %s = %s', logger_name, level)
@@ -37,4 +46,40 @@ def _post_process_log_levels(cli_levels, **kwargs):
     return cli_levels
 
 
+################################################################################
+# log level
+
+def _parse_log_level(s):
+    import logging
+    val = None
+    try:
+        # try int
+        val = int(s)
+    except ValueError:
+        pass
+    if val is None:
+        for name in [s, s.upper()]:
+            try:
+                val = logging._nameToLevel[name]
+                break
+            except KeyError:
+                pass
+    if val is not None:
+        try:
+            return logging._levelToName[val]
+        except KeyError:
+            pass
+    raise ValueError(s)
+
+
+register_spec(
+    'log_level',
+    dict(
+        names=['log-level', 'L'],
+        from_string=_parse_log_level,
+        metavar='LOG_LEVEL',
+    ),
+)
+
+
 ################################################################################
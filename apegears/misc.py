@@ -4,6 +4,7 @@ Private definitions of actions, types, etc. used in this package.
 
 import argparse as _ap
 import copy as _copy
+import threading
 
 
 ################################################################################
@@ -22,9 +23,8 @@ class _ExtendAction(_ap.Action):
         super().__init__(nargs=nargs, **kwargs)
 
     def __call__(self, parser, namespace, values, option_string=None):
-        items = _copy.copy(_ensure_value(namespace, self.dest, []))
+        items = _get_owned_value(namespace, self.dest, [])
         items.extend(values)
-        setattr(namespace, self.dest, items)
 
 
 class _SetItemAction(_ap.Action):
@@ -41,10 +41,143 @@ class _SetItemAction(_ap.Action):
         super().__init__(nargs=nargs, **kwargs)
 
     def __call__(self, parser, namespace, values, option_string=None):
-        items = _copy.copy(_ensure_value(namespace, self.dest, {}))
+        items = _get_owned_value(namespace, self.dest, {})
         # values is a list of (key, value) pairs
         items.update(values)
-        setattr(namespace, self.dest, items)
+
+
+class _SubParsersAction(_ap._SubParsersAction):
+    """
+    Same as argparse's subparsers action, with support for *lazy* subparsers, which are only
+    built when chosen (or when the full help is formatted).  See ``add_lazy_parser``.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # lazy subparsers are built on access to the map (e.g. by argparse, when chosen, or
+        # by argcomplete)
+        self._name_parser_map = _LazyParserMap(self._name_parser_map)
+        self.choices = self._name_parser_map
+
+    def add_lazy_parser(self, name, factory, **kwargs):
+        """
+        Add a subparser which is only built when chosen (or explicitly accessed using
+        ``get_parser``).
+
+        :param factory:
+            a callable returning the subparser, or a string of the form "MODULE:ATTR" (or
+            "MODULE", for "MODULE:build_parser") referring to such a callable.  The module
+            is only imported when the subparser is built.
+        :param kwargs:
+            help and aliases are treated the same as in ``add_parser``.  All other kwargs are
+            passed to the factory.  If help is not passed, the subcommand is listed in the
+            help message using the description of the subparser.
+        """
+        prog = kwargs.pop('prog', None)
+        if prog is None:
+            prog = '%s %s' % (self._prog_prefix, name)
+        aliases = kwargs.pop('aliases', ())
+
+        for n in [name, *aliases]:
+            if n in self._name_parser_map:
+                raise _ap.ArgumentError(self, _ap._('conflicting subparser: %s') % n)
+
+        # create a pseudo-action to hold the choice help.
+        # this way, listing the subcommands in the help message doesn't require building them.
+        help = kwargs.pop('help', None)
+        choice_action = self._ChoicesPseudoAction(name, aliases, help)
+        choice_action.lazy_help = help is None
+        self._choices_actions.append(choice_action)
+
+        lazy_parser = _LazyParser(factory, prog, kwargs)
+        for n in [name, *aliases]:
+            self._name_parser_map[n] = lazy_parser
+        return lazy_parser
+
+    def get_parser(self, name):
+        """
+        Return the subparser by name, building it if it's lazy.
+        """
+        return self._name_parser_map[name]
+
+    def _get_subactions(self):
+        # (only called when formatting the full help, which builds all lazy subparsers)
+        for choice_action in self._choices_actions:
+            parser = self._name_parser_map[choice_action.dest]
+            if getattr(choice_action, 'lazy_help', False):
+                choice_action.help = _get_first_line(parser.description)
+                choice_action.lazy_help = False
+        return super()._get_subactions()
+
+
+class _LazyParserMap(dict):
+    """
+    The name->subparser map of ``_SubParsersAction``.  Lazy subparsers are built (and
+    replaced, under all of their names) when looked up.
+    """
+
+    def __getitem__(self, name):
+        parser = super().__getitem__(name)
+        if type(parser) is _LazyParser:
+            with _LAZY_PARSER_LOCK:
+                # (check again, in case it was built by another thread meanwhile)
+                parser = super().__getitem__(name)
+                if type(parser) is _LazyParser:
+                    lazy_parser = parser
+                    parser = lazy_parser.build()
+                    # replace under all names (including aliases)
+                    for n, p in list(self.items()):
+                        if p is lazy_parser:
+                            self[n] = parser
+        return parser
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+
+def _get_first_line(text):
+    lines = (text or '').strip().splitlines()
+    if not lines:
+        return None
+    # (escaped, since help strings are %-formatted)
+    return lines[0].replace('%', '%%')
+
+
+# guards building lazy subparsers, when parsing from multiple threads
+_LAZY_PARSER_LOCK = threading.RLock()
+
+
+class _LazyParser:
+    """
+    A placeholder for a subparser which wasn't built yet.
+    """
+
+    DEFAULT_FACTORY_ATTR = 'build_parser'
+
+    def __init__(self, factory, prog, kwargs):
+        self.factory = factory
+        self.prog = prog
+        self.kwargs = kwargs
+
+    def build(self):
+        factory = self.factory
+        if isinstance(factory, str):
+            factory = self._import_factory(factory)
+        if isinstance(factory, _ap.ArgumentParser):
+            parser = factory
+        else:
+            parser = factory(**self.kwargs)
+        parser.prog = self.prog
+        return parser
+
+    def _import_factory(self, path):
+        import importlib
+        module_name, _, attr = path.partition(':')
+        module = importlib.import_module(module_name)
+        return getattr(module, attr or self.DEFAULT_FACTORY_ATTR)
+
+    def __repr__(self):
+        return '<%s %r>' % (type(self).__name__, self.prog)
 
 
 ################################################################################
@@ -101,10 +234,232 @@ class _KeyValueType:
         return '%s' % getattr(t, '__name__', t)
 
 
-def _ensure_value(namespace, name, value):
-    if getattr(namespace, name, None) is None:
-        setattr(namespace, name, value)
-    return getattr(namespace, name)
+class _LazyType:
+    """
+    Wraps an argument type, deferring the conversion of cli strings.
+    Calling it returns a ``_LazyValue``, which remembers the string and the real type, and is
+    converted only when the argument is first accessed (see ``_LazyNamespace``).
+    """
+
+    def __init__(self, type):
+        self.type = type
+
+    def __call__(self, arg_string):
+        return _LazyValue(self.type, arg_string)
+
+    @property
+    def __name__(self):
+        # defined for nicer error messages
+        return getattr(self.type, '__name__', repr(self.type))
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, self.type)
+
+
+class _LazyValue:
+    """
+    A cli string whose conversion (using ``type``) was deferred.
+    """
+
+    __slots__ = ('type', 'arg_string')
+
+    def __init__(self, type, arg_string):
+        self.type = type
+        self.arg_string = arg_string
+
+    def __repr__(self):
+        return '<lazy %s %r>' % (getattr(self.type, '__name__', self.type), self.arg_string)
+
+
+def _to_lazy_type(type):
+    """
+    Return a lazy version of an argument type.
+    For key-value types, only the *value* is made lazy (keys are needed for building the dict).
+    """
+    if isinstance(type, _KeyValueType):
+        if type.value_type is None:
+            return type
+        type = _copy.copy(type)
+        type.value_type = _LazyType(type.value_type)
+        return type
+    return _LazyType(type)
+
+
+class _DeferredValue:
+    """
+    A namespace value which is only computed on first access, by calling ``resolve``.
+    """
+
+    __slots__ = ('resolve',)
+
+    def __init__(self, resolve):
+        self.resolve = resolve
+
+    def __repr__(self):
+        return '<deferred>'
+
+
+class _LazyNamespace(_ap.Namespace):
+    """
+    A ``Namespace`` which resolves ``_DeferredValue`` attributes on first access, and
+    replaces them with the resolved values.
+    """
+
+    def __getattribute__(self, name):
+        value = super().__getattribute__(name)
+        if type(value) is _DeferredValue:
+            value = value.resolve()
+            setattr(self, name, value)
+        return value
+
+
+class _BatchConverter:
+    """
+    A post-processor of list arguments, which converts all the (string) values at once, and
+    stores them in a container: a list, an ``array.array`` or a numpy array.
+
+    Used by ``add_list`` and ``add_positional_list``, when passing ``container``, or when the
+    spec of the type defines ``from_strings``.
+    """
+
+    CONTAINERS = ('list', 'array', 'numpy')
+
+    # array.array typecodes of supported types
+    ARRAY_TYPECODES = {int: 'q', float: 'd'}
+
+    def __init__(self, type=None, from_strings=None, *,
+                 from_strings_numpy=None, container='list', choices=None, post_process=None):
+        if container not in self.CONTAINERS:
+            raise ValueError('container=%r is not supported (choose from %s)' % (
+                container, ', '.join(self.CONTAINERS)))
+        # int/float, for converting directly into arrays (also if the converter is memoized,
+        # see ``spec.MemoizedConverter``), or None
+        array_type = getattr(type, '__wrapped__', type)
+        if array_type not in self.ARRAY_TYPECODES:
+            array_type = None
+        if container == 'array' and array_type is None:
+            raise ValueError('container=array requires type=int or type=float')
+        if container == 'numpy':
+            import numpy  # noqa: F401 -- raise early if numpy is not installed
+        self.type = type
+        self.array_type = array_type
+        self.from_strings = from_strings
+        self.from_strings_numpy = from_strings_numpy
+        self.container = container
+        self.choices = choices
+        self.post_process = post_process
+
+    def __call__(self, values, *, action, parser, namespace, **kwargs):
+        if values is action.default:
+            # not passed from cli.  (same as argparse, default values of lists are not converted)
+            values = self._to_container(values)
+        else:
+            try:
+                values = self._convert(values)
+            except (TypeError, ValueError, OverflowError, _ap.ArgumentTypeError) as e:
+                parser.error(str(self._get_argument_error(action, values, e)))
+            if self.choices is not None:
+                self._check_choices(action, parser, values)
+        if self.post_process is not None:
+            values = self.post_process(
+                values, action=action, parser=parser, namespace=namespace, **kwargs)
+        return values
+
+    def _convert(self, strings):
+        if self.container == 'numpy':
+            if self.from_strings_numpy is not None:
+                return self.from_strings_numpy(strings)
+            if self.from_strings is None and self.array_type is not None:
+                # convert directly into the array, without intermediate objects
+                import numpy
+                return numpy.fromiter(
+                    map(self.type, strings), dtype=self.array_type, count=len(strings))
+        if self.from_strings is not None:
+            values = self.from_strings(strings)
+        elif self.type is not None:
+            values = map(self.type, strings)
+        else:
+            values = strings
+        return self._to_container(values)
+
+    def _to_container(self, values):
+        if values is None:
+            values = []
+        if self.container == 'array':
+            import array
+            return array.array(self.ARRAY_TYPECODES[self.array_type], values)
+        if self.container == 'numpy':
+            import numpy
+            if not isinstance(values, (list, tuple, numpy.ndarray)):
+                values = list(values)
+            if len(values) == 0 and self.from_strings_numpy is not None:
+                # an empty array, of the right dtype
+                return self.from_strings_numpy([])
+            return numpy.asarray(values, dtype=self.array_type)
+        return values if type(values) is list else list(values)
+
+    def _check_choices(self, action, parser, values):
+        for value in values:
+            if value not in self.choices:
+                args = {'value': value, 'choices': ', '.join(map(repr, self.choices))}
+                msg = _ap._('invalid choice: %(value)r (choose from %(choices)s)') % args
+                parser.error(str(_ap.ArgumentError(action, msg)))
+
+    def _get_argument_error(self, action, strings, error):
+        # the batch conversion failed.  find the invalid value, for a proper error message
+        type_func = self.type
+        if type_func is not None:
+            for s in strings:
+                try:
+                    type_func(s)
+                except _ap.ArgumentTypeError as e:
+                    return _ap.ArgumentError(action, str(e))
+                except (TypeError, ValueError, OverflowError):
+                    name = getattr(type_func, '__name__', repr(type_func))
+                    args = {'type': name, 'value': s}
+                    return _ap.ArgumentError(
+                        action, _ap._('invalid %(type)s value: %(value)r') % args)
+        return _ap.ArgumentError(action, str(error))
+
+
+################################################################################
+# accumulating collections in the namespace
+
+# The name of a namespace attribute holding the collections created during the current parse
+# (e.g. by the extend action), which can be modified in place.  Other collections (e.g. default
+# values) are shared, so they are copied (once) before modifying.
+# The attribute is removed at the end of parsing (same as argparse's _UNRECOGNIZED_ARGS_ATTR).
+_OWNED_VALUES_ATTR = '_apegears_owned_values'
+
+
+def _get_owned_value(namespace, name, empty_value):
+    """
+    Return the collection stored in the namespace under ``name``, such that it can be modified
+    in place.  It is copied at most once per parse.
+    """
+    owned = vars(namespace).setdefault(_OWNED_VALUES_ATTR, {})
+    items = getattr(namespace, name, None)
+    if items is not None and owned.get(id(items)) is items:
+        return items
+    if items is None:
+        items = empty_value
+    else:
+        items = _copy.copy(items)
+    _set_owned_value(namespace, name, items)
+    return items
+
+
+def _set_owned_value(namespace, name, value):
+    """
+    Set a collection, created during the current parse, in the namespace.
+    """
+    owned = vars(namespace).setdefault(_OWNED_VALUES_ATTR, {})
+    owned[id(value)] = value
+    setattr(namespace, name, value)
+
+
+def _clear_owned_values(namespace):
+    vars(namespace).pop(_OWNED_VALUES_ATTR, None)
 
 
 ################################################################################
@@ -120,27 +475,29 @@ class _StrictDefaultActionWrapper(_ap.Action):
     the resulting list is ``['bar']`` instead of ``['foo', 'bar']``.
 
     See https://bugs.python.org/issue16399 .
+
+    :note:
+        no per-parse state is stored on the action, so the parser can be reused, also from
+        multiple threads concurrently.
     """
 
     def __init__(self, action, empty_value, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.action = action
         self.empty_value = empty_value
-        self._called = False
 
     def __call__(self, parser, namespace, *args, **kwargs):
         self._wipe_default(namespace)
         return self.action.__call__(parser, namespace, *args, **kwargs)
 
     def _wipe_default(self, namespace):
-        if self._called:
-            return
-        self._called = True
-        cur_value = getattr(namespace, self.dest, object())
-        if cur_value != self.default:
+        # if the value is still the default object itself, this is the first time the option
+        # is encountered in this parse (the wrapped action always replaces it with a new
+        # collection).
+        if getattr(namespace, self.dest, None) is not self.default:
             return
         # wipe it
-        setattr(namespace, self.dest, _copy.copy(self.empty_value))
+        _set_owned_value(namespace, self.dest, _copy.copy(self.empty_value))
 
     def _get_kwargs(self):
         return self.action._get_kwargs()
@@ -2,17 +2,17 @@
 Definition of the ApeGears ArgumentParser class.
 """
 
+import os
+import sys
 import argparse as _ap
 from collections import OrderedDict
-import inspect
 
-try:
-    import argcomplete
-except ImportError:
-    argcomplete = None  # argcomplete not installed
-
-from .misc import _ExtendAction, _SetItemAction, _KeyValueType, _StrictDefaultActionWrapper
-from .spec import find_spec as _find_spec
+from .misc import (
+    _ExtendAction, _SetItemAction, _SubParsersAction, _KeyValueType, _StrictDefaultActionWrapper,
+    _BatchConverter,
+    _LazyValue, _DeferredValue, _LazyNamespace, _to_lazy_type, _clear_owned_values,
+)
+from .spec import find_spec as _find_spec, MemoizedConverter as _MemoizedConverter
 from .lo99ing import add_log_levels_option
 
 
@@ -21,6 +21,9 @@ from .lo99ing import add_log_levels_option
 
 CALLER_DOC = ...
 
+# argcomplete sets this env var when invoking the script for completing
+_ARGCOMPLETE_ENV_VAR = '_ARGCOMPLETE'
+
 
 ################################################################################
 # Our ArgumentParser class
@@ -36,18 +39,24 @@ class ArgumentParser(_ap.ArgumentParser):
     - Support for some standard python types
     - Support for enum arguments
     - Workaround append-with-nonempty-default bug
+    - Lazy (on-access) conversion of argument values
+    - Lazy subparsers (see ``add_subparsers().add_lazy_parser``)
 
+    Parsing does not modify the parser, so a parser can be reused for parsing many command
+    lines, also concurrently from multiple threads.
     """
 
     _REQUIRED_IS_NONEMPTY_ACTIONS = (_ExtendAction, _SetItemAction)
 
     ################################################################################
 
-    def __init__(self, *args, description=None, log_levels=None, **kwargs):
+    def __init__(self, *args, description=None, log_levels=None, lazy=False, **kwargs):
         """
         :param description:
             if description=CALLER_DOC, will attempt to extract description from docstring of
             caller module.
+        :param lazy:
+            the default value of the ``lazy`` param of ``add_argument`` (and the adder methods).
         :param log_levels:
             lo99ing integration.
             a flag indicating whether to automatically add a log-level override option
@@ -59,12 +68,16 @@ class ArgumentParser(_ap.ArgumentParser):
         if description is CALLER_DOC:
             description = self._generate_description(stack_depth=1)
 
+        # (set before calling super, which adds the help option)
+        self.lazy = lazy
+
         # call super:
         super().__init__(*args, description=description, **kwargs)
 
         # register our actions
         self.register('action', 'extend', _ExtendAction)
         self.register('action', 'setitem', _SetItemAction)
+        self.register('action', 'parsers', _SubParsersAction)
 
         # add default options
         if log_levels or log_levels is None:
@@ -73,12 +86,24 @@ class ArgumentParser(_ap.ArgumentParser):
     ################################################################################
     # parse_args()
 
-    def parse_known_args(self, *args, **kwargs):
+    def parse_known_args(self, args=None, namespace=None):
         # invoke pre-parse hook:
-        self._pre_parse(*args, **kwargs)
+        self._pre_parse(args, namespace)
+
+        # lazy args are resolved on access, which requires our namespace class:
+        if namespace is None and self._has_lazy_actions():
+            namespace = _LazyNamespace()
 
         # call super:
-        namespace, extras = super().parse_known_args(*args, **kwargs)
+        try:
+            namespace, extras = super().parse_known_args(args, namespace)
+        finally:
+            if namespace is not None:
+                _clear_owned_values(namespace)
+
+        # keep only the values of the selected shard (before post-processing, e.g. opening
+        # the files):
+        self._shard_values(namespace)
 
         # run arg post processors:
         self._run_post_processors(namespace)
@@ -86,6 +111,9 @@ class ArgumentParser(_ap.ArgumentParser):
         # enforce required args:
         self._enforce_required(namespace)
 
+        # defer conversion of lazy args:
+        self._defer_lazy_values(namespace)
+
         # invoke post-parse hook:
         self._post_parse(namespace, extras)
 
@@ -101,14 +129,28 @@ class ArgumentParser(_ap.ArgumentParser):
     # add_argument()
 
     def add_argument(self, *args,
-                     strict_default=False, post_process=None, completer=None,
-                     **kwargs):
+                     strict_default=False, post_process=None, completer=None, lazy=None,
+                     sharded=False, **kwargs):
         """
         :param strict_default: whether to enable workaround issue16399
         :param post_process: a callable to apply to the argument post-parsing, in place
         :param completer: a custom argcomplete completer
+        :param lazy:
+            if true, the value is converted (using ``type``, followed by ``post_process``)
+            on first access to the namespace attribute, instead of while parsing.
+            Conversion errors are reported (and exit) the same way, on access.
+            If None (default), uses the value passed to the parser's constructor.
+        :param sharded:
+            if true, for list arguments (e.g. ``add_positional_list``, or ``fileinput``
+            with ``nargs='*'``), adds the ``--shard-index``, ``--shard-count`` and
+            ``--shard-by`` options, and keeps only the values of the selected shard
+            (see ``apegears.sharding``).  Can also be the default sharding strategy, e.g.
+            ``sharded='size'``.
         """
 
+        if sharded and not self._is_list_action(kwargs):
+            raise ValueError('sharded= only applies to list arguments')
+
         # workaround append-with-nonempty-default issue (https://bugs.python.org/issue16399):
         if strict_default:
             action = self._get_strict_default_action(kwargs.get('action'))
@@ -123,12 +165,27 @@ class ArgumentParser(_ap.ArgumentParser):
             if type_metavar is not None:
                 kwargs['metavar'] = type_metavar
 
+        # lazy conversion
+        if lazy is None:
+            lazy = self.lazy
+        lazy = bool(lazy) and (type is not None or post_process is not None)
+        if lazy and type is not None:
+            kwargs['type'] = _to_lazy_type(type)
+
         # call super:
         action = super().add_argument(*args, **kwargs)
 
         # remember post processor for later
         if post_process is not None:
             action.post_process = post_process
+        if lazy:
+            action.lazy = True
+
+        # sharding
+        if sharded:
+            from .sharding import add_shard_options
+            add_shard_options(self, **({} if sharded is True else dict(by=sharded)))
+            action.sharded = True
 
         # argcomplete
         self._set_completer(action, completer)
@@ -217,7 +274,7 @@ class ArgumentParser(_ap.ArgumentParser):
 
         return action
 
-    def add_list(self, *flags, strict_default=True, **kwargs):
+    def add_list(self, *flags, strict_default=True, container=None, **kwargs):
         """
         Add an *optional* list argument.  This calls ``add_argument`` with appropriate values.
 
@@ -227,12 +284,19 @@ class ArgumentParser(_ap.ArgumentParser):
             Supports all kwargs supported by ``add_argument``, except for action.
             nargs is typically not required.
         :param strict_default: whether to enable workaround issue16399
+        :param container:
+            the container to store the values in: "list", "array" (an ``array.array``,
+            for type=int or float) or "numpy" (a numpy array).
+            If passed (or if the spec of the type defines ``from_strings``), all values are
+            converted at once, after parsing (and then checked against ``choices``).
 
         :note: The default default value is an empty list.
         :note: required=True means a **non-empty** list is required.
         """
+        spec = self._spec_from_type(kwargs.get('type'))
         flags, kwargs = self._process_collection_optional(list, 'list', *flags, **kwargs)
         flags, kwargs = self._use_spec(*flags, is_positional=False, **kwargs)
+        kwargs = self._use_batch_converter(container, spec, **kwargs)
         return self.add_argument(
             *flags,
             action='extend',
@@ -240,7 +304,7 @@ class ArgumentParser(_ap.ArgumentParser):
             **kwargs
         )
 
-    def add_positional_list(self, name=None, strict_default=True, **kwargs):
+    def add_positional_list(self, name=None, strict_default=True, container=None, **kwargs):
         """
         Add a *positional* list argument.  This calls ``add_argument`` with appropriate values.
 
@@ -248,11 +312,14 @@ class ArgumentParser(_ap.ArgumentParser):
             Supports all kwargs supported by ``add_argument``, except for action and required.
             nargs is typically not required.
         :param strict_default: whether to enable workaround issue16399
+        :param container: same as in ``add_list``
 
         :note: The default default value is an empty list.
         """
 
+        spec = self._spec_from_type(kwargs.get('type'))
         names, kwargs = self._process_positional(name, **kwargs)
+        kwargs = self._use_batch_converter(container, spec, **kwargs)
 
         nargs = kwargs.pop('nargs', None)
         if nargs is None:
@@ -326,17 +393,26 @@ class ArgumentParser(_ap.ArgumentParser):
     ################################################################################
     # argparse spec
 
-    def _use_spec(self, *args, is_positional=None, **kwargs):
+    def _use_spec(self, *args, is_positional=None, memoize=None, **kwargs):
+        """
+        :param memoize:
+            whether to memoize the conversion of values (in an LRU cache), or the cache size.
+            If None, memoize if the spec of the type enables it.
+        """
         if is_positional is None:
             is_positional = self._is_positional(*args)
         type = kwargs.get('type', None)
         if type is not None:
             spec = self._spec_from_type(type)
             if spec is not None:
-                args, kwargs = self._apply_spec(spec, *args, is_positional=is_positional, **kwargs)
+                args, kwargs = self._apply_spec(
+                    spec, *args, is_positional=is_positional, memoize=memoize, **kwargs)
+            elif memoize:
+                kwargs['type'] = _MemoizedConverter(type, **(
+                    {} if memoize is True else dict(maxsize=memoize)))
         return args, kwargs
 
-    def _apply_spec(self, spec, *args, is_positional, **kwargs):
+    def _apply_spec(self, spec, *args, is_positional, memoize=None, **kwargs):
 
         # default to names from spec:
         if not args:
@@ -357,16 +433,41 @@ class ArgumentParser(_ap.ArgumentParser):
             if v != spec.EMPTY:
                 kwargs.setdefault(attr, v)
 
-        for attr in ['post_process', 'choices', 'help', 'metavar', 'completer']:
+        for attr in ['post_process', 'choices', 'help', 'metavar', 'completer', 'lazy']:
             _setdefault(attr)
 
         if not kwargs.get('required', False):
             _setdefault('default')
 
-        kwargs['type'] = spec.from_string
+        kwargs['type'] = spec.get_converter(memoize)
 
         return args, kwargs
 
+    def _use_batch_converter(self, container, spec, **kwargs):
+        """
+        Replace ``type`` with a post-processor which converts all values at once.
+        """
+        from_strings = getattr(spec, 'from_strings', None)
+        if container is None and from_strings is None:
+            return kwargs
+        # (checked by the converter.  argparse would check the strings, before conversion)
+        choices = kwargs.pop('choices', None)
+        type = kwargs.pop('type', None)
+        type_metavar = getattr(type, '__metavar__', None)
+        if type_metavar is not None:
+            kwargs.setdefault('metavar', type_metavar)
+        if choices is not None:
+            # same as argparse's default metavar of choices
+            kwargs.setdefault('metavar', '{%s}' % ','.join(map(str, choices)))
+        kwargs['post_process'] = _BatchConverter(
+            type, from_strings,
+            from_strings_numpy=getattr(spec, 'from_strings_numpy', None),
+            container=container or 'list',
+            choices=choices,
+            post_process=kwargs.get('post_process'),
+        )
+        return kwargs
+
     def _spec_from_type(self, type):
         if type is None:
             return None
@@ -398,8 +499,14 @@ class ArgumentParser(_ap.ArgumentParser):
     # argcomplete
 
     def _pre_parse_argcomplete(self, *args, **kwargs):
-        if argcomplete is None:
+        if _ARGCOMPLETE_ENV_VAR not in os.environ:
+            # not invoked for completing (autocomplete() would return immediately).
+            # avoid the cost of importing argcomplete
             return
+        try:
+            import argcomplete
+        except ImportError:
+            return  # argcomplete not installed
         if 'IntrospectiveArgumentParser' in type(self).__name__:
             # this is a nested call triggered by previous call to argcomplete.autocomplete().
             # avoid another call to argcomplete.autocomplete()
@@ -410,6 +517,69 @@ class ArgumentParser(_ap.ArgumentParser):
         if action is not None and completer is not None:
             action.completer = completer
 
+    ################################################################################
+    # lazy conversion
+
+    def _has_lazy_actions(self):
+        return any(getattr(action, 'lazy', False) for action in self._actions)
+
+    def _check_value(self, action, value):
+        if isinstance(value, _LazyValue):
+            # choices are checked after conversion
+            return
+        super()._check_value(action, value)
+
+    def _defer_lazy_values(self, namespace):
+        for action in self._actions:
+            if not getattr(action, 'lazy', False):
+                continue
+            try:
+                arg_value = getattr(namespace, action.dest)
+            except AttributeError:
+                continue
+            setattr(namespace, action.dest, _DeferredValue(
+                lambda action=action, arg_value=arg_value:
+                    self._resolve_lazy(action, arg_value, namespace)
+            ))
+
+        if not isinstance(namespace, _LazyNamespace):
+            # can't defer, because attribute access can't be intercepted.  resolve now.
+            # (this also resolves values set by sub-parsers)
+            for arg_name, arg_value in list(vars(namespace).items()):
+                if isinstance(arg_value, _DeferredValue):
+                    setattr(namespace, arg_name, arg_value.resolve())
+
+    def _resolve_lazy(self, action, arg_value, namespace):
+        try:
+            arg_value = self._convert_lazy(action, arg_value)
+        except _ap.ArgumentError as e:
+            if not getattr(self, 'exit_on_error', True):
+                raise
+            self.error(str(e))
+        post_process = getattr(action, 'post_process', None)
+        if post_process is not None:
+            arg_value = post_process(arg_value, action=action, namespace=namespace, parser=self)
+        return arg_value
+
+    def _convert_lazy(self, action, value):
+        if isinstance(value, _LazyValue):
+            type_func = value.type
+            try:
+                result = type_func(value.arg_string)
+            except _ap.ArgumentTypeError as e:
+                raise _ap.ArgumentError(action, str(e))
+            except (TypeError, ValueError):
+                name = getattr(type_func, '__name__', repr(type_func))
+                args = {'type': name, 'value': value.arg_string}
+                raise _ap.ArgumentError(action, _ap._('invalid %(type)s value: %(value)r') % args)
+            self._check_value(action, result)
+            return result
+        if isinstance(value, list):
+            return [self._convert_lazy(action, v) for v in value]
+        if isinstance(value, dict):
+            return type(value)((k, self._convert_lazy(action, v)) for k, v in value.items())
+        return value
+
     ################################################################################
     # misc
 
@@ -445,11 +615,50 @@ class ArgumentParser(_ap.ArgumentParser):
                 ', '.join(empty_required_actions)
             )
 
+    def _is_list_action(self, kwargs):
+        action = kwargs.get('action')
+        if action in ('append', 'extend'):
+            return True
+        if action == 'setitem' or (
+                isinstance(action, type) and issubclass(action, _SetItemAction)):
+            # (a dict, its nargs notwithstanding)
+            return False
+        if isinstance(action, type) and issubclass(action, (_ap._AppendAction, _ExtendAction)):
+            return True
+        nargs = kwargs.get('nargs')
+        return isinstance(nargs, int) or nargs in ('*', '+')
+
+    def _shard_values(self, namespace):
+        sharded_actions = [a for a in self._actions if getattr(a, 'sharded', False)]
+        if not sharded_actions:
+            return
+        from .sharding import shard_from_namespace, _default_key
+
+        def key(value):
+            # lazy values are sharded by their cli string
+            if isinstance(value, _LazyValue):
+                return value.arg_string
+            return _default_key(value)
+
+        for action in sharded_actions:
+            try:
+                arg_value = getattr(namespace, action.dest)
+            except AttributeError:
+                continue
+            if arg_value is None:
+                continue
+            try:
+                arg_value = shard_from_namespace(arg_value, namespace, key=key)
+            except ValueError as e:
+                self.error(str(e))
+            setattr(namespace, action.dest, arg_value)
+
     def _run_post_processors(self, namespace):
         for action in self._actions:
             arg_name = action.dest
             post_process = getattr(action, 'post_process', None)
-            if post_process is None:
+            if post_process is None or getattr(action, 'lazy', False):
+                # (lazy actions are post-processed on access)
                 continue
             try:
                 arg_value = getattr(namespace, arg_name)
@@ -546,9 +755,9 @@ class ArgumentParser(_ap.ArgumentParser):
 
     def _generate_description(self, stack_depth):
         try:
-            stack = inspect.stack()
-            caller_frame = stack[stack_depth + 1]
-            raw_doc = caller_frame.frame.f_globals['__doc__'].strip()
+            # (much faster than inspect.stack(), which also reads source files)
+            caller_frame = sys._getframe(stack_depth + 1)
+            raw_doc = caller_frame.f_globals['__doc__'].strip()
             lines = raw_doc.splitlines()
             # return text up to the first blank line:
             i = lines.index('')
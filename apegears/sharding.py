@@ -0,0 +1,137 @@
+"""
+Deterministic sharding of input lists, for spreading the inputs of a script across nodes.
+
+Typically used like::
+
+    parser.add_positional_list('infiles', sharded=True)
+    args = parser.parse_args()  # e.g. "--shard-index 3 --shard-count 8 a b c ..."
+
+which adds the ``--shard-index``, ``--shard-count`` and ``--shard-by`` options to the parser,
+and keeps only the values of the selected shard (in their original order).
+
+The split is reproducible across runs and machines: it only depends on the values (and, when
+balancing by file size, on the sizes of the files), not on e.g. python's (randomized) ``hash``.
+"""
+
+import os
+import heapq
+import hashlib
+
+
+################################################################################
+# Consts
+
+# the strategies for assigning values to shards:
+#   hash: by a stable hash of the value (a value is always assigned to the same shard,
+#       regardless of the rest of the values)
+#   round-robin: by position in the list
+#   size: balanced by total file size (the values are file names)
+SHARD_STRATEGIES = ('hash', 'round-robin', 'size')
+
+
+################################################################################
+# shard()
+
+def shard(values, index, count, by='hash', key=None):
+    """
+    Return the values assigned to shard ``index`` (of ``count`` shards), in their original
+    order.
+
+    :param by: the sharding strategy, one of ``SHARD_STRATEGIES``.
+    :param key:
+        a function returning the string (or path) to hash (or to get the size of) for a value.
+        Defaults to the value itself.
+    """
+    if count < 1:
+        raise ValueError('shard count must be positive: %r' % (count,))
+    if not 0 <= index < count:
+        raise ValueError('shard index must be in [0, %d): %r' % (count, index))
+    values = list(values)
+    if key is None:
+        key = _default_key
+    if by == 'hash':
+        return [v for v in values if _stable_hash(key(v)) % count == index]
+    if by == 'round-robin':
+        return values[index::count]
+    if by == 'size':
+        shards = _balance_by_size([key(v) for v in values], count)
+        return [v for v, i in zip(values, shards) if i == index]
+    raise ValueError('unknown sharding strategy: %r' % (by,))
+
+
+def _balance_by_size(filenames, count):
+    """
+    Assign files to shards, balancing the total size of the shards.
+
+    Greedy: larger files are assigned first, each to the shard with the smallest total so far.
+    Ties are broken by name and position, so the assignment is deterministic.
+    """
+    sizes = [_get_file_size(fn) for fn in filenames]
+    order = sorted(range(len(filenames)), key=lambda i: (-sizes[i], filenames[i], i))
+    heap = [(0, i) for i in range(count)]
+    shards = [None] * len(filenames)
+    for i in order:
+        total, shard_index = heapq.heappop(heap)
+        shards[i] = shard_index
+        heapq.heappush(heap, (total + sizes[i], shard_index))
+    return shards
+
+
+################################################################################
+# parser integration
+
+def add_shard_options(parser, by='hash'):
+    """
+    Add the ``--shard-index``, ``--shard-count`` and ``--shard-by`` options to a parser (unless
+    already added).
+    """
+    if any(action.dest == 'shard_index' for action in parser._actions):
+        return
+    group = parser.add_argument_group('sharding')
+    group.add_argument(
+        '--shard-index', type=int, default=0, metavar='I',
+        help='process only the inputs of shard I (0-based)')
+    group.add_argument(
+        '--shard-count', type=int, default=1, metavar='N',
+        help='the number of shards to split the inputs into (default: 1)')
+    group.add_argument(
+        '--shard-by', choices=SHARD_STRATEGIES, default=by,
+        help='how to assign inputs to shards (default: %(default)s)')
+
+
+def shard_from_namespace(values, namespace, key=None):
+    """
+    Shard values using the shard options, as parsed into ``namespace``.
+    """
+    return shard(
+        values, namespace.shard_index, namespace.shard_count, by=namespace.shard_by, key=key)
+
+
+################################################################################
+# privates
+
+def _default_key(value):
+    if isinstance(value, (str, bytes)):
+        return value
+    if isinstance(value, os.PathLike):
+        return os.fspath(value)
+    return str(value)
+
+
+def _stable_hash(value):
+    if isinstance(value, os.PathLike):
+        value = os.fspath(value)
+    if isinstance(value, str):
+        value = value.encode('utf-8', 'surrogateescape')
+    return int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), 'big')
+
+
+def _get_file_size(filename):
+    try:
+        return os.path.getsize(filename)
+    except OSError:
+        # e.g. stdin.  (errors are raised when the file is opened)
+        return 0
+
+
+################################################################################
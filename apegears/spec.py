@@ -2,6 +2,8 @@
 Argument-type specs.
 """
 
+import sys
+import functools
 from enum import Enum
 
 
@@ -9,6 +11,10 @@ from enum import Enum
 
 _SPEC_REGISTRY = {}
 
+# registry-keys (for classes: their qualified names) of specs which are registered on first use,
+# mapped to the name of the module registering them:
+_LAZY_SPEC_REGISTRY = {}
+
 
 ################################################################################
 
@@ -19,21 +25,50 @@ class ArgParseSpec:
 
     ``from_string`` corresponds to the argparse ``type`` field. It is a callable which defines
     how to convert a string value (read from CLI) to an object of that type.
+
+    ``from_strings`` is an optional batch version of ``from_string``, converting a list of
+    strings to a sequence of objects.  If defined, list arguments (``add_list``,
+    ``add_positional_list``) call it once for all values.
+    ``from_strings_numpy`` is similar, but converts to a numpy array.  It is used for list
+    arguments with ``container='numpy'``.
+
+    ``memoize`` enables memoizing the results of ``from_string``, in a bounded LRU cache
+    (see ``MemoizedConverter``), shared by all arguments using the spec.  It can be True
+    (for the default cache size), or the cache size.  Only enable it if ``from_string`` is
+    pure, and returns immutable objects.
+
+    ``lazy`` sets the default of the ``lazy`` argument of the adder methods, i.e. whether
+    values are converted on first access (e.g. for types which are expensive to load).
     """
 
     EMPTY = object()
 
     def __init__(self,
                  names=EMPTY, default=EMPTY, from_string=None, post_process=EMPTY,
-                 choices=EMPTY, help=EMPTY, metavar=EMPTY, completer=EMPTY):
+                 choices=EMPTY, help=EMPTY, metavar=EMPTY, completer=EMPTY,
+                 from_strings=None, from_strings_numpy=None, memoize=False, lazy=EMPTY):
         self.names = names
         self.default = default
         self.from_string = from_string
+        self.from_strings = from_strings
+        self.from_strings_numpy = from_strings_numpy
         self.post_process = post_process
         self.choices = choices
         self.help = help
         self.metavar = metavar
         self.completer = completer
+        self.memoize = memoize
+        self.lazy = lazy
+        self.converter = _memoized(from_string, memoize)
+
+    def get_converter(self, memoize=None):
+        """
+        Return the converter to use as the argparse ``type``: ``from_string``, memoized
+        according to ``memoize`` (if None, according to the spec's ``memoize``).
+        """
+        if memoize is None or (memoize is True and self.memoize):
+            return self.converter
+        return _memoized(self.from_string, memoize)
 
     @property
     def __argparse__(self):
@@ -46,6 +81,10 @@ def find_spec(cls):
         return _SPEC_REGISTRY[cls]
     except KeyError:
         pass
+    # then try specs registered lazily
+    spec = _load_lazy_spec(cls)
+    if spec is not None:
+        return spec
     # look for __argparse__ attribute:
     spec = getattr(cls, '__argparse__', None)
     if spec is not None:
@@ -67,6 +106,47 @@ def register_spec(cls, spec):
     return spec
 
 
+def _register_builtin_spec(cls, spec):
+    """
+    Same as ``register_spec``, for the specs of apegears' own modules, which may be loaded
+    lazily (see ``register_lazy_spec``), after the spec was overridden (e.g. by the user):
+    a spec which is already registered is kept.
+    """
+    try:
+        return _SPEC_REGISTRY[cls]
+    except KeyError:
+        return register_spec(cls, spec)
+
+
+def register_lazy_spec(key, module_name):
+    """
+    Register an arg-type spec which is defined in another module, without importing it.
+    The module is imported on first use of ``key``, and is expected to register the spec
+    (using ``register_spec``).
+
+    :param key:
+        same as the ``cls`` param of ``register_spec``.  May also be the qualified name of a
+        class (e.g. "datetime.date"), to avoid importing the module defining the class.
+    """
+    _LAZY_SPEC_REGISTRY[_lazy_spec_key(key)] = module_name
+
+
+def _load_lazy_spec(cls):
+    try:
+        module_name = _LAZY_SPEC_REGISTRY[_lazy_spec_key(cls)]
+    except (KeyError, TypeError):
+        return None
+    if module_name not in sys.modules:
+        __import__(module_name)
+    return _SPEC_REGISTRY.get(cls)
+
+
+def _lazy_spec_key(key):
+    if isinstance(key, type):
+        return '%s.%s' % (key.__module__, key.__qualname__)
+    return key
+
+
 def to_spec(spec):
     if isinstance(spec, ArgParseSpec):
         return spec
@@ -86,6 +166,72 @@ def gen_type_spec(cls, **kwargs):
     return None
 
 
+################################################################################
+# memoizing converters
+
+class MemoizedConverter:
+    """
+    A converter (e.g. ``from_string``) which memoizes its results, in a bounded LRU cache.
+    Conversion errors are not cached.
+
+    Use ``cache_info()`` for hit/miss counters (same as ``functools.lru_cache``).
+    """
+
+    DEFAULT_MAXSIZE = 1024
+
+    def __init__(self, func, maxsize=DEFAULT_MAXSIZE):
+        self.func = func
+        self.maxsize = maxsize
+        self._init_cache()
+
+    def _init_cache(self):
+        self._cached_func = functools.lru_cache(maxsize=self.maxsize)(self.func)
+
+    def __call__(self, arg_string):
+        return self._cached_func(arg_string)
+
+    def cache_info(self):
+        return self._cached_func.cache_info()
+
+    def cache_clear(self):
+        self._cached_func.cache_clear()
+
+    @property
+    def __wrapped__(self):
+        # (same as ``functools.wraps``.  e.g., for batch-converting memoized int/float lists)
+        return self.func
+
+    @property
+    def __name__(self):
+        # defined for nicer error messages
+        return getattr(self.func, '__name__', repr(self.func))
+
+    @property
+    def __metavar__(self):
+        return getattr(self.func, '__metavar__', None)
+
+    def __getstate__(self):
+        # the cache is not pickled
+        state = dict(self.__dict__)
+        del state['_cached_func']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_cache()
+
+    def __repr__(self):
+        return '%s(%r, maxsize=%r)' % (type(self).__name__, self.func, self.maxsize)
+
+
+def _memoized(func, memoize):
+    if not memoize or func is None:
+        return func
+    if memoize is True:
+        return MemoizedConverter(func)
+    return MemoizedConverter(func, maxsize=memoize)
+
+
 ################################################################################
 # enum support
 
@@ -111,6 +257,19 @@ class _EnumValueType:
         return self.__name__.upper()
 
 
+class _ChoicesCompleter:
+    """
+    An argcomplete completer which completes from a fixed list of strings.
+    Defined as a class (rather than a lambda) so parsers using it can be pickled.
+    """
+
+    def __init__(self, strings):
+        self.strings = strings
+
+    def __call__(self, *args, **kwargs):
+        return self.strings
+
+
 def gen_enum_spec(cls, **kwargs):
     enum_value_type = _EnumValueType(cls)
     strings = [e.name for e in cls]
@@ -119,10 +278,34 @@ def gen_enum_spec(cls, **kwargs):
         from_string=enum_value_type,
         choices=list(cls),
         help='/'.join(strings),
-        completer=lambda *a, **kw: strings,
+        completer=_ChoicesCompleter(strings),
+        memoize=True,
     )
     kw.update(kwargs)
     return ArgParseSpec(**kw)
 
 
+################################################################################
+# specs for standard python types (e.g. datetime.date, pathlib.Path), defined in the
+# ``types`` and ``iofile`` modules
+
+for _key in [
+        'range', 'builtins.range',
+        'intervals',
+        'date', 'datetime.date',
+        'datetime', 'datetime.datetime',
+        'path', 'pathlib.Path',
+        'regex', 'regex_set', 'literal',
+        'ipaddress', 'ipnetwork', 'ipaddress.IPv4Network', 'ipaddress.IPv6Network',
+        'ipnetwork_set']:
+    register_lazy_spec(_key, 'apegears.types')
+
+for _key in [
+        'pickled_data', 'lazy_pickled_data',
+        'json_data', 'jsonl_stream', 'npy_data', 'csv_stream']:
+    register_lazy_spec(_key, 'apegears.iofile')
+
+register_lazy_spec('indexed_text', 'apegears.lineindex')
+
+
 ################################################################################
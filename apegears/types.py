@@ -7,18 +7,28 @@ Included here:
 - datetime (type=datetime.datetime or type='datetime')
 - path (type=pathlib.Path or type='path')
 - regular expressions (type='regex')
+- regex set, i.e. a set of regexes matched at once (type=RegexSet or type='regex_set')
 - IP address (type='ipaddress')
+- IP network (type='ipnetwork')
+- network set, i.e. a set of IP networks (type=NetworkSet or type='ipnetwork_set')
+- interval set, i.e. a set of ranges (type=IntervalSet or type='intervals')
 
 """
 
+import sys
+import argparse as _ap
 import datetime
 import pathlib
-import logging
 import ast
 import re
 import ipaddress
+import array
+import bisect
+import math
+import itertools
+import warnings
 
-from .spec import register_spec
+from .spec import _register_builtin_spec
 
 
 ################################################################################
@@ -30,7 +40,7 @@ def _parse_range(s):
 
 
 for _x in [range, 'range']:
-    register_spec(
+    _register_builtin_spec(
         _x,
         dict(
             from_string=_parse_range,
@@ -40,25 +50,212 @@ for _x in [range, 'range']:
     )
 
 
+################################################################################
+# interval set
+
+class IntervalSet:
+    """
+    A set of integers, defined by a union of ranges, e.g. "0:100,250:300,1000:".
+    The ranges are merged and sorted, and stored compactly, without expanding them.
+
+    Supports O(log n) membership tests (n being the number of ranges), lazy iteration, and
+    ``len``.  The last range may be unbounded (STOP omitted), in which case ``len`` raises
+    OverflowError.
+    """
+
+    # the STOP stored for an unbounded range (whether the last range is unbounded is stored
+    # separately, so an explicit STOP of the same value is still bounded)
+    UNBOUNDED = 2 ** 63 - 1
+
+    def __init__(self, ranges=()):
+        """
+        :param ranges: an iterable of (START, STOP) pairs, or ``range`` objects with step=1.
+            STOP=None means unbounded.
+        """
+        pairs = []
+        for r in ranges:
+            if isinstance(r, range):
+                if r.step != 1:
+                    raise ValueError('step must be 1: %r' % r)
+                start, stop = r.start, r.stop
+            else:
+                start, stop = r
+            if stop is None:
+                stop = math.inf
+            if start < stop:
+                pairs.append((start, stop))
+
+        # merge overlapping and adjacent ranges
+        merged = []
+        for start, stop in sorted(pairs):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], stop)
+            else:
+                merged.append([start, stop])
+
+        self._unbounded = bool(merged) and merged[-1][1] == math.inf
+        if self._unbounded:
+            merged[-1][1] = self.UNBOUNDED
+        try:
+            self._starts = array.array('q', [start for start, _ in merged])
+            self._stops = array.array('q', [stop for _, stop in merged])
+        except OverflowError:
+            # (ValueError, for argparse to report it as an invalid value)
+            raise ValueError('range bounds must be 64-bit integers: %r' % (merged,)) from None
+
+    @classmethod
+    def from_string(cls, s):
+        """
+        Parse a string of comma-separated ranges, each of the form START:STOP (START and
+        STOP are optional, defaulting to 0 and unbounded) or a single integer.
+        """
+        pairs = []
+        for part in s.split(','):
+            part = part.strip()
+            if not part:
+                continue
+            if ':' in part:
+                start, _, stop = part.partition(':')
+                start = int(start) if start.strip() else 0
+                stop = int(stop) if stop.strip() else None
+            else:
+                start = int(part)
+                stop = start + 1
+            pairs.append((start, stop))
+        return cls(pairs)
+
+    def is_bounded(self):
+        return not self._unbounded
+
+    def ranges(self):
+        """
+        Yield the (merged) ranges.  An unbounded range is yielded as a (START, None) pair.
+        """
+        last = len(self._starts) - 1
+        for i, (start, stop) in enumerate(zip(self._starts, self._stops)):
+            if i == last and self._unbounded:
+                yield (start, None)
+            else:
+                yield range(start, stop)
+
+    def to_numpy(self, stop=None):
+        """
+        Return a numpy index array of all the integers in the set.
+
+        :param stop: an upper bound.  Required if the set is unbounded.
+        """
+        import numpy
+        starts = numpy.frombuffer(self._starts, dtype=numpy.int64)
+        stops = numpy.frombuffer(self._stops, dtype=numpy.int64)
+        if stop is not None:
+            stops = numpy.minimum(stops, stop)
+        elif not self.is_bounded():
+            raise ValueError('stop is required for converting an unbounded set')
+        lengths = numpy.maximum(stops - starts, 0)
+        total = int(lengths.sum())
+        # each element is its range's start, plus its offset within the range:
+        offsets = numpy.arange(total, dtype=numpy.int64)
+        range_offsets = numpy.repeat(numpy.cumsum(lengths) - lengths, lengths)
+        return numpy.repeat(starts, lengths) + (offsets - range_offsets)
+
+    def __contains__(self, x):
+        i = bisect.bisect_right(self._starts, x) - 1
+        if i < 0:
+            return False
+        return x < self._stops[i] or (self._unbounded and i == len(self._starts) - 1)
+
+    def __iter__(self):
+        for r in self.ranges():
+            if isinstance(r, range):
+                yield from r
+            else:
+                yield from itertools.count(r[0])
+
+    def __len__(self):
+        if not self.is_bounded():
+            raise OverflowError('an unbounded %s has no length' % type(self).__name__)
+        return sum(stop - start for start, stop in zip(self._starts, self._stops))
+
+    def __bool__(self):
+        return len(self._starts) > 0
+
+    def __eq__(self, other):
+        if not isinstance(other, IntervalSet):
+            return NotImplemented
+        return (self._starts == other._starts and self._stops == other._stops
+                and self._unbounded == other._unbounded)
+
+    def __hash__(self):
+        return hash((self._starts.tobytes(), self._stops.tobytes(), self._unbounded))
+
+    def __str__(self):
+        parts = []
+        for r in self.ranges():
+            if isinstance(r, range):
+                parts.append('%s:%s' % (r.start, r.stop))
+            else:
+                parts.append('%s:' % r[0])
+        return ','.join(parts)
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, str(self))
+
+
+for _x in [IntervalSet, 'intervals']:
+    _register_builtin_spec(
+        _x,
+        dict(
+            names=['intervals'],
+            from_string=IntervalSet.from_string,
+            metavar='RANGES',
+            help='comma-separated ranges (e.g. 0:100,250:300,1000:)'
+        ),
+    )
+
+
 ################################################################################
 # datetime.date and datetime.datetime
 
 DATE_FORMAT = '%Y-%m-%d'
 BASE_DATETIME_FORMAT = DATE_FORMAT + 'T%H:%M:%S'
 
+# formats to fall back to, for strings ``fromisoformat`` doesn't support (in older python
+# versions).  (strptime caches the compiled formats)
+DATETIME_FORMATS = [
+    '%s%s%s' % (base, milli, z)
+    for base in [BASE_DATETIME_FORMAT]
+    for milli in ['', '.%f']
+    for z in ['', '%z']
+] + [DATE_FORMAT]
+
+
+if sys.version_info >= (3, 11):
+    _date_fromisoformat = datetime.date.fromisoformat
+    _datetime_fromisoformat = datetime.datetime.fromisoformat
+else:
+    _date_fromisoformat = datetime.date.fromisoformat
+
+    def _datetime_fromisoformat(s):
+        # "Z" is only supported since python 3.11
+        if s[-1:] in ('Z', 'z'):
+            s = s[:-1] + '+00:00'
+        return datetime.datetime.fromisoformat(s)
+
 
 def _parse_date(s):
+    try:
+        return _date_fromisoformat(s)
+    except ValueError:
+        pass
     return datetime.datetime.strptime(s, DATE_FORMAT).date()
 
 
 def _parse_datetime(s):
-    PATTERNS = [
-        '%s%s%s' % (base, milli, z)
-        for base in [BASE_DATETIME_FORMAT]
-        for milli in ['', '.%f']
-        for z in ['', 'Z']
-    ]
-    for p in PATTERNS:
+    try:
+        return _datetime_fromisoformat(s)
+    except ValueError:
+        pass
+    for p in DATETIME_FORMATS:
         try:
             return datetime.datetime.strptime(s, p)
         except ValueError:
@@ -66,12 +263,64 @@ def _parse_datetime(s):
     raise ValueError(s)
 
 
+def _parse_datetimes(strings):
+    return [_parse_datetime(s) for s in strings]
+
+
+# the strings which numpy parses the same as ``_parse_date``/``_parse_datetime``.  (numpy also
+# accepts e.g. "now", "NaT", "" and partial dates, which these reject)
+_NUMPY_DATE_RE = re.compile(r'\d{4}-\d\d-\d\d')
+_NUMPY_DATETIME_RE = re.compile(
+    _NUMPY_DATE_RE.pattern +
+    r'(?:[T ](?:[01]\d|2[0-3]):[0-5]\d(?::[0-5]\d(?:\.\d{1,6})?)?(?:Z|[+-]\d\d:\d\d)?)?')
+
+
+def _parse_dates_numpy(strings):
+    return _parse_numpy_datetime64(strings, 'D', _parse_date, _NUMPY_DATE_RE)
+
+
+def _parse_datetimes_numpy(strings):
+    return _parse_numpy_datetime64(strings, 'us', _parse_datetime, _NUMPY_DATETIME_RE)
+
+
+def _parse_numpy_datetime64(strings, unit, parse, regex):
+    """
+    Convert a list of ISO 8601 strings to a ``numpy.datetime64`` array, in one vectorized pass.
+    Timestamps with timezone offsets are converted to UTC.
+    """
+    import numpy
+    import warnings
+    dtype = 'datetime64[%s]' % unit
+    if all(map(regex.fullmatch, strings)):
+        # numpy's parsing of "Z" is slow (and deprecated).  datetime64 values are UTC anyway.
+        strings = [s[:-1] if s[-1:] == 'Z' else s for s in strings]
+        try:
+            with warnings.catch_warnings():
+                # numpy warns when parsing timezone offsets (it converts them to UTC)
+                warnings.simplefilter('ignore')
+                return numpy.array(strings, dtype=dtype)
+        except (ValueError, TypeError):
+            # e.g. invalid dates (2001-02-30)
+            pass
+    # parse the strings one by one (raising ValueError on invalid ones)
+    values = [_to_naive_utc(parse(s)) for s in strings]
+    return numpy.array(values, dtype=dtype)
+
+
+def _to_naive_utc(t):
+    if isinstance(t, datetime.datetime) and t.tzinfo is not None:
+        t = t.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return t
+
+
 for _x in [datetime.date, 'date']:
-    register_spec(
+    _register_builtin_spec(
         _x,
         dict(
             names=['date', 'd'],
             from_string=_parse_date,
+            from_strings_numpy=_parse_dates_numpy,
+            memoize=True,
             metavar='DATE',
             help='a date (YYYY-MM-DD)'
         ),
@@ -79,13 +328,15 @@ for _x in [datetime.date, 'date']:
 
 
 for _x in [datetime.datetime, 'datetime']:
-    register_spec(
+    _register_builtin_spec(
         _x,
         dict(
             names=['timestamp', 't'],
             from_string=_parse_datetime,
+            from_strings=_parse_datetimes,
+            from_strings_numpy=_parse_datetimes_numpy,
             metavar='TIMESTAMP',
-            help='a timestamp (ISO 8601: YYYY-MM-DDTHH:MM:SS[.micros][Z])'
+            help='a timestamp (ISO 8601: YYYY-MM-DD[THH:MM:SS[.micros]][Z|+HH:MM])'
         ),
     )
 
@@ -94,7 +345,7 @@ for _x in [datetime.datetime, 'datetime']:
 # pathlib.Path
 
 for _x in [pathlib.Path, 'path']:
-    register_spec(
+    _register_builtin_spec(
         _x,
         dict(
             names=['path'],
@@ -104,69 +355,351 @@ for _x in [pathlib.Path, 'path']:
     )
 
 
-################################################################################
-# log level
-
-def _parse_log_level(s):
-    val = None
-    try:
-        # try int
-        val = int(s)
-    except ValueError:
-        pass
-    if val is None:
-        for name in [s, s.upper()]:
-            try:
-                val = logging._nameToLevel[name]
-                break
-            except KeyError:
-                pass
-    if val is not None:
-        try:
-            return logging._levelToName[val]
-        except KeyError:
-            pass
-    raise ValueError(s)
-
-
-register_spec(
-    'log_level',
-    dict(
-        names=['log-level', 'L'],
-        from_string=_parse_log_level,
-        metavar='LOG_LEVEL',
-    ),
-)
-
-
 ################################################################################
 # regex
 
-register_spec(
+_register_builtin_spec(
     'regex',
     dict(
         names=['regex'],
         from_string=re.compile,
+        memoize=True,
         metavar='REGEX',
         help='a regular expression',
     ),
 )
 
 
+################################################################################
+# regex set
+
+class RegexSet:
+    """
+    A set of regular expressions, matched at once.
+
+    The patterns are compiled into a single alternation, so that scanning a string for a match
+    of any of the patterns is a single regex call (instead of one per pattern).  Only when a
+    match is found, the pattern which matched is identified.  If the patterns can't be combined
+    (e.g. they use different flags, numbered backreferences, or conflicting group names), they
+    are matched separately, with the same semantics.
+
+    ``search``, ``match`` and ``fullmatch`` return an ``(index, match)`` pair, where ``index``
+    is the index of the matching pattern and ``match`` is the match object of that pattern (so
+    group numbers are the pattern's own), or None if no pattern matches.  If several patterns
+    match, ``search`` returns the leftmost match, and ties are broken by the order of the
+    patterns.
+    """
+
+    # numbered backreferences (``\1``, ``(?(1)...)``) would refer to the wrong groups when
+    # combined.  (this is conservative: e.g. an escaped backslash followed by a digit matches)
+    _NUMBERED_REF_REGEX = re.compile(r'\\[1-9]|\(\?\([0-9]')
+
+    def __init__(self, patterns=()):
+        """
+        :param patterns: an iterable of pattern strings or compiled patterns.
+        """
+        self.patterns = [p if isinstance(p, re.Pattern) else re.compile(p) for p in patterns]
+        self.combined = self._combine(self.patterns)
+
+    @classmethod
+    def from_strings(cls, strings):
+        return cls(strings)
+
+    @property
+    def is_combined(self):
+        """ Whether the patterns are matched using a single combined pattern """
+        return self.combined is not None
+
+    def search(self, string, pos=0, endpos=sys.maxsize):
+        if self.combined is not None:
+            m = self.combined.search(string, pos, endpos)
+            if m is None:
+                return None
+            # the alternation matches the first pattern (in order) which matches at this point
+            return self._first(lambda p: p.match(string, m.start(), endpos))
+        best = None
+        for i, p in enumerate(self.patterns):
+            m = p.search(string, pos, endpos)
+            if m is not None and (best is None or m.start() < best[1].start()):
+                best = (i, m)
+                if m.start() == pos:
+                    # leftmost possible
+                    break
+        return best
+
+    def match(self, string, pos=0, endpos=sys.maxsize):
+        if self.combined is not None and self.combined.match(string, pos, endpos) is None:
+            return None
+        return self._first(lambda p: p.match(string, pos, endpos))
+
+    def fullmatch(self, string, pos=0, endpos=sys.maxsize):
+        if self.combined is not None and self.combined.fullmatch(string, pos, endpos) is None:
+            return None
+        return self._first(lambda p: p.fullmatch(string, pos, endpos))
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def __iter__(self):
+        return iter(self.patterns)
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, [p.pattern for p in self.patterns])
+
+    def _first(self, match_func):
+        for i, p in enumerate(self.patterns):
+            m = match_func(p)
+            if m is not None:
+                return i, m
+        return None
+
+    @classmethod
+    def _combine(cls, patterns):
+        # Note: the alternatives are wrapped in non-capturing groups.  Capturing (e.g. named)
+        # groups would prevent the regex compiler from factoring out common prefixes and
+        # skipping ahead to possible first characters, which makes the combined pattern slower
+        # than matching the patterns one by one.
+        if not patterns:
+            return None
+        flags = patterns[0].flags
+        if any(p.flags != flags or type(p.pattern) is not type(patterns[0].pattern)
+               for p in patterns):
+            return None
+        if any(cls._NUMBERED_REF_REGEX.search(cls._to_str(p.pattern)) for p in patterns):
+            return None
+        # in verbose mode, a trailing comment would swallow the closing paren
+        sep = '\n' if flags & re.VERBOSE else ''
+        combined = '|'.join('(?:%s%s)' % (cls._to_str(p.pattern), sep) for p in patterns)
+        if isinstance(patterns[0].pattern, bytes):
+            combined = combined.encode('latin-1')
+        try:
+            with warnings.catch_warnings():
+                # e.g. global flags not at the start of the expression
+                warnings.simplefilter('error')
+                return re.compile(combined, flags)
+        except (re.error, DeprecationWarning):
+            return None
+
+    @staticmethod
+    def _to_str(pattern):
+        return pattern.decode('latin-1') if isinstance(pattern, bytes) else pattern
+
+
+def _compile_regex(s):
+    try:
+        return re.compile(s)
+    except re.error as e:
+        raise _ap.ArgumentTypeError('invalid regex %r: %s' % (s, e))
+
+
+def _to_regex_set(value, **kwargs):
+    if value is None or isinstance(value, RegexSet):
+        return value
+    if isinstance(value, (str, re.Pattern)):
+        value = [value]
+    return RegexSet(value)
+
+
+for _x in [RegexSet, 'regex_set']:
+    _register_builtin_spec(
+        _x,
+        dict(
+            names=['regex'],
+            from_string=_compile_regex,
+            post_process=_to_regex_set,
+            memoize=True,
+            metavar='REGEX',
+            help='a regular expression (matched as a set)',
+        ),
+    )
+
+
 ################################################################################
 # IP address / hostname
 
-register_spec(
+_register_builtin_spec(
     'ipaddress',
     dict(
         names=['ip'],
         from_string=ipaddress.ip_address,
+        memoize=True,
         metavar='IP',
         help='an IP address, e.g. "192.168.0.1" or "2001:db8::"'
     ),
 )
 
 
+################################################################################
+# IP network / network set
+
+def _parse_ip_network(s):
+    # (strict=False: allow host bits to be set, e.g. "10.1.2.3/8")
+    return ipaddress.ip_network(s, strict=False)
+
+
+for _x in [ipaddress.IPv4Network, ipaddress.IPv6Network, 'ipnetwork']:
+    _register_builtin_spec(
+        _x,
+        dict(
+            names=['network'],
+            from_string=_parse_ip_network,
+            metavar='CIDR',
+            help='an IP network, e.g. "192.168.0.0/16" or "2001:db8::/32"'
+        ),
+    )
+
+
+class NetworkSet:
+    """
+    A set of IP addresses, defined by a union of (IPv4 and/or IPv6) networks.
+
+    The networks are collapsed (see ``ipaddress.collapse_addresses``), and indexed as sorted,
+    disjoint integer intervals, for O(log n) membership tests (n being the number of
+    intervals) of addresses and networks.
+    """
+
+    def __init__(self, networks=()):
+        """
+        :param networks: an iterable of networks, addresses, or strings of either.
+        """
+        by_version = {4: [], 6: []}
+        for net in networks:
+            if isinstance(net, str):
+                net = _parse_ip_network(net)
+            elif isinstance(net, (ipaddress.IPv4Address, ipaddress.IPv6Address)):
+                net = ipaddress.ip_network(net)
+            by_version[net.version].append(net)
+        self._networks = {
+            version: list(ipaddress.collapse_addresses(nets))
+            for version, nets in by_version.items()
+        }
+        # version -> (firsts, lasts): inclusive intervals (the last address of an IPv6 set can
+        # be 2**128-1, so exclusive stops wouldn't fit in the address space)
+        self._index = {
+            version: self._to_intervals(nets) for version, nets in self._networks.items()
+        }
+
+    @classmethod
+    def from_strings(cls, strings):
+        return cls(strings)
+
+    def networks(self):
+        """
+        Return the collapsed networks, IPv4 first.
+        """
+        return self._networks[4] + self._networks[6]
+
+    @property
+    def num_addresses(self):
+        return sum(net.num_addresses for net in self.networks())
+
+    def __contains__(self, x):
+        """
+        :param x:
+            an address or a network, a string of either, or an int (as in
+            ``ipaddress.ip_address``: an IPv4 address if less than 2**32, else IPv6).
+        """
+        if isinstance(x, str):
+            x = _parse_ip_network(x) if '/' in x else ipaddress.ip_address(x)
+        if isinstance(x, (ipaddress.IPv4Network, ipaddress.IPv6Network)):
+            first, last = int(x.network_address), int(x.broadcast_address)
+            version = x.version
+        elif isinstance(x, (ipaddress.IPv4Address, ipaddress.IPv6Address)):
+            first = last = int(x)
+            version = x.version
+        elif isinstance(x, int):
+            if not 0 <= x < 2 ** 128:
+                raise ValueError('%r does not appear to be an IPv4 or IPv6 address' % (x,))
+            first = last = x
+            version = 4 if x < 2 ** 32 else 6
+        else:
+            raise TypeError('expected an IP address or network, got %r' % (x,))
+        firsts, lasts = self._index[version]
+        i = bisect.bisect_right(firsts, first) - 1
+        return i >= 0 and last <= lasts[i]
+
+    def __iter__(self):
+        return iter(self.networks())
+
+    def __bool__(self):
+        return bool(self._networks[4] or self._networks[6])
+
+    def __eq__(self, other):
+        if not isinstance(other, NetworkSet):
+            return NotImplemented
+        return self._index == other._index
+
+    def __hash__(self):
+        return hash(tuple(tuple(map(tuple, self._index[v])) for v in (4, 6)))
+
+    def __str__(self):
+        return ','.join(str(net) for net in self.networks())
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, str(self))
+
+    @staticmethod
+    def _to_intervals(networks):
+        # the collapsed networks are sorted and don't overlap, but can still be adjacent
+        firsts = []
+        lasts = []
+        for net in networks:
+            first, last = int(net.network_address), int(net.broadcast_address)
+            if lasts and first == lasts[-1] + 1:
+                lasts[-1] = last
+            else:
+                firsts.append(first)
+                lasts.append(last)
+        return firsts, lasts
+
+
+def _parse_ip_networks(s):
+    """
+    Parse a network, or, if ``s`` is of the form "@FILE", a file of networks, one per line
+    (blank lines and "#" comments are skipped).  Returns a list of networks.
+    """
+    if not s.startswith('@'):
+        return [_parse_ip_network(s)]
+    filename = s[1:]
+    networks = []
+    try:
+        with open(filename) as F:
+            for lineno, line in enumerate(F, 1):
+                line = line.partition('#')[0].strip()
+                if not line:
+                    continue
+                try:
+                    networks.append(_parse_ip_network(line))
+                except ValueError as e:
+                    raise _ap.ArgumentTypeError('%s:%d: %s' % (filename, lineno, e))
+    except OSError as e:
+        raise _ap.ArgumentTypeError("can't open '%s': %s" % (filename, e))
+    return networks
+
+
+def _to_network_set(value, **kwargs):
+    if value is None or isinstance(value, NetworkSet):
+        return value
+    if not isinstance(value, list):
+        value = [value]
+    # flatten (values converted by ``_parse_ip_networks`` are lists of networks)
+    return NetworkSet(itertools.chain.from_iterable(
+        x if isinstance(x, list) else [x] for x in value))
+
+
+for _x in [NetworkSet, 'ipnetwork_set']:
+    _register_builtin_spec(
+        _x,
+        dict(
+            names=['networks'],
+            from_string=_parse_ip_networks,
+            post_process=_to_network_set,
+            metavar='CIDR',
+            help='an IP network, or @FILE of networks (one per line)',
+        ),
+    )
+
+
 ################################################################################
 # literal
 
@@ -182,7 +715,7 @@ def _parse_literal(s):
         return s
 
 
-register_spec(
+_register_builtin_spec(
     'literal',
     dict(
         from_string=_parse_literal,
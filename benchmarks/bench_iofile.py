@@ -0,0 +1,303 @@
+"""
+Benchmarks of reading (compressed) input files.
+
+Run like::
+
+    python -m benchmarks.bench_iofile [--quick] [--json results.json]
+"""
+
+import os
+import shutil
+import tempfile
+import contextlib
+import unittest.mock
+
+from apegears import CALLER_DOC
+from apegears import compression
+from apegears.iofile import open_compressed, hook_compressed, FileInput
+
+from .common import measure, main
+
+
+################################################################################
+# scales
+
+NUM_LINES = [100000, 2000000]
+QUICK_NUM_LINES = [100000]
+
+
+################################################################################
+# input files
+
+@contextlib.contextmanager
+def _input_files(num_lines, codecs=()):
+    """
+    Yield a dict mapping codec names (and None, for uncompressed) to files with
+    ``num_lines`` lines.
+    """
+    tmpdir = tempfile.mkdtemp(prefix='apegears-bench-')
+    try:
+        files = {None: os.path.join(tmpdir, 'data.txt')}
+        with open(files[None], 'w') as F:
+            for i in range(num_lines):
+                F.write('%d\tsome text, with words and numbers\t%d\n' % (i, i * 7))
+        for codec in codecs:
+            fn = files[None] + codec.extensions[0]
+            with open(files[None], 'rb') as src, codec.open(fn, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            files[codec.name] = fn
+        yield files
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def _get_codecs():
+    return [
+        compression.get_codec(name)
+        for name in ['gzip', 'bz2', 'xz', 'zstd', 'lz4']
+        if compression.get_codec(name).is_available()
+    ]
+
+
+################################################################################
+# benchmarks
+
+def _read_lines(filename):
+    with open_compressed(filename, 'r', stream=True) as F:
+        for _ in F:
+            pass
+
+
+def bench_read_compressed(results, quick=False):
+    codecs = _get_codecs()
+    for n in QUICK_NUM_LINES if quick else NUM_LINES:
+        with _input_files(n, codecs) as files:
+            for codec_name, fn in files.items():
+                results.add('read_compressed', codec_name or 'none',
+                            measure(lambda: _read_lines(fn)), n=n)
+                codec = compression.get_codec(codec_name) if codec_name else None
+                if codec is not None and codec._get_program() is not None:
+                    with unittest.mock.patch.object(compression, 'SUBPROCESS_MIN_SIZE', 0), \
+                            unittest.mock.patch.object(codec, 'program_modes', 'r'):
+                        results.add('read_compressed', '%s-subprocess' % codec_name,
+                                    measure(lambda: _read_lines(fn)), n=n)
+                    with unittest.mock.patch.object(compression, 'USE_SUBPROCESS', False):
+                        results.add('read_compressed', '%s-inprocess' % codec_name,
+                                    measure(lambda: _read_lines(fn)), n=n)
+
+
+def bench_gzip_seek(results, quick=False):
+    import gzip
+    import random
+    from apegears import gzindex
+    if not gzindex.is_available():
+        return
+    gzip_codec = compression.get_codec('gzip')
+    num_reads = 20
+
+    def random_reads(open_func, fn, size):
+        rand = random.Random(0)
+        with open_func(fn) as F:
+            for _ in range(num_reads):
+                F.seek(rand.randrange(size))
+                F.readline()
+
+    for n in QUICK_NUM_LINES if quick else NUM_LINES:
+        with _input_files(n, [gzip_codec]) as files:
+            fn = files['gzip']
+            size = os.path.getsize(files[None])
+            results.add('gzip_build_index', 'apegears',
+                        measure(lambda: gzindex.GzipIndex.build(fn)), n=n)
+            index = gzindex.get_index(fn)
+            for impl, open_func in [
+                    ('gzip', lambda fn: gzip.open(fn, 'rb')),
+                    ('apegears-indexed', lambda fn: gzindex.open_indexed(fn, index)),
+            ]:
+                results.add('gzip_random_reads', impl,
+                            measure(lambda: random_reads(open_func, fn, size)), n=n)
+
+
+def bench_line_range(results, quick=False):
+    import itertools
+    from apegears.lineindex import IndexedTextFile, LineIndex, get_line_index
+
+    def read_range_fileinput(fn, lines):
+        with FileInput([fn]) as fi:
+            for _ in itertools.islice(fi, lines.start, lines.stop):
+                pass
+
+    def read_range_indexed(f, lines):
+        for _ in f.iter_lines(lines):
+            pass
+
+    for n in QUICK_NUM_LINES if quick else NUM_LINES:
+        with _input_files(n) as files:
+            fn = files[None]
+            results.add('line_index_build', 'apegears',
+                        measure(lambda: LineIndex.build(fn)), n=n)
+            f = IndexedTextFile(fn)
+            f._index = get_line_index(fn)
+            lines = range(n - n // 10, n - n // 10 + 1000)
+            results.add('line_range', 'fileinput-islice',
+                        measure(lambda: read_range_fileinput(fn, lines)), n=n)
+            results.add('line_range', 'apegears-indexed',
+                        measure(lambda: read_range_indexed(f, lines)), n=n)
+
+
+def bench_lazy_open_file(results, quick=False):
+    from apegears.iofile import LazyOpenFile
+    tmpdir = tempfile.mkdtemp(prefix='apegears-bench-')
+    fn = os.path.join(tmpdir, 'out.txt')
+
+    def write_records(open_func, n):
+        with open_func(fn, 'w') as F:
+            for _ in range(n):
+                F.write('some record\n')
+
+    def read_lines(open_func):
+        with open_func(fn, 'r') as F:
+            for _ in F:
+                pass
+
+    try:
+        for n in QUICK_NUM_LINES if quick else NUM_LINES:
+            for impl, open_func in [('open', open), ('LazyOpenFile', LazyOpenFile)]:
+                results.add('lazy_open_write', impl,
+                            measure(lambda: write_records(open_func, n)), n=n)
+                results.add('lazy_open_read', impl, measure(lambda: read_lines(open_func)), n=n)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def bench_write_compressed(results, quick=False):
+    from apegears.iofile import open_output
+    tmpdir = tempfile.mkdtemp(prefix='apegears-bench-')
+    codecs = [compression.get_codec(name) for name in ['gzip', 'zstd']]
+
+    def write_records(open_func, fn, n):
+        with open_func(fn) as F:
+            for i in range(n):
+                F.write('some record %d\n' % i)
+
+    try:
+        for n in QUICK_NUM_LINES if quick else NUM_LINES:
+            for codec in codecs:
+                if not codec.is_available():
+                    continue
+                fn = os.path.join(tmpdir, 'out' + codec.extensions[0])
+                for impl, open_func in [
+                        ('inline', lambda fn: codec.open(fn, 'wt')),
+                        ('open_output', lambda fn: open_output(fn, 'w', compress=True)),
+                        ('open_output-atomic', lambda fn: open_output(
+                            fn, 'w', compress=True, atomic=True)),
+                ]:
+                    results.add('write_%s' % codec.name, impl,
+                                measure(lambda: write_records(open_func, fn, n)), n=n)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def _consume(fi):
+    with fi:
+        for _ in fi:
+            pass
+
+
+def bench_fileinput(results, quick=False):
+    import fileinput as _fileinput
+    gzip_codec = compression.get_codec('gzip')
+    num_files = 4 if quick else 8
+    for n in QUICK_NUM_LINES if quick else NUM_LINES:
+        with _input_files(n // num_files, [gzip_codec]) as files:
+            filenames = [files['gzip']] * num_files
+            for impl, get_fileinput in [
+                    ('stdlib', lambda: _fileinput.FileInput(
+                        filenames, openhook=hook_compressed)),
+                    ('apegears', lambda: FileInput(filenames, openhook=hook_compressed)),
+                    ('apegears-prefetch', lambda: FileInput(
+                        filenames, openhook=hook_compressed, prefetch=2)),
+            ]:
+                results.add('fileinput_gzip', impl,
+                            measure(lambda: _consume(get_fileinput())), n=n)
+
+
+def bench_fileinput_batches(results, quick=False):
+    import fileinput as _fileinput
+
+    def lines_stdlib(fn):
+        with _fileinput.FileInput([fn]) as fi:
+            for _ in fi:
+                pass
+
+    def lines(fn, mode='r'):
+        with FileInput([fn], mode=mode) as fi:
+            for _ in fi:
+                pass
+
+    def batches(fn, mode='r'):
+        with FileInput([fn], mode=mode) as fi:
+            for batch in fi.iter_batches():
+                for _ in batch:
+                    pass
+
+    def chunks(fn, mode='r', errors=None):
+        with FileInput([fn], mode=mode) as fi:
+            for _ in fi.iter_chunks(errors=errors):
+                pass
+
+    for n in QUICK_NUM_LINES if quick else NUM_LINES:
+        with _input_files(n) as files:
+            fn = files[None]
+            for impl, func in [
+                    ('stdlib-lines', lambda: lines_stdlib(fn)),
+                    ('apegears-lines', lambda: lines(fn)),
+                    ('apegears-batches', lambda: batches(fn)),
+                    ('apegears-chunks', lambda: chunks(fn)),
+                    ('apegears-chunks-surrogateescape',
+                     lambda: chunks(fn, errors='surrogateescape')),
+                    ('apegears-lines-bytes', lambda: lines(fn, 'rb')),
+                    ('apegears-batches-bytes', lambda: batches(fn, 'rb')),
+                    ('apegears-chunks-bytes', lambda: chunks(fn, 'rb')),
+            ]:
+                results.add('fileinput_iterate', impl, measure(func), n=n)
+
+
+def _count_words(fi):
+    # (module-level, for pickling to process pool workers)
+    return sum(len(line.split()) for line in fi)
+
+
+def bench_fileinput_map(results, quick=False):
+    gzip_codec = compression.get_codec('gzip')
+    num_files = 4 if quick else 8
+    for n in QUICK_NUM_LINES if quick else NUM_LINES:
+        with _input_files(n // num_files, [gzip_codec]) as files:
+            filenames = [files['gzip']] * num_files
+            for impl, func in [
+                    ('sequential', lambda: [
+                        _count_words(FileInput([fn], openhook=hook_compressed))
+                        for fn in filenames]),
+                    ('map-thread', lambda: list(FileInput(
+                        filenames, openhook=hook_compressed).map(_count_words, pool='thread'))),
+                    ('map-process', lambda: list(FileInput(
+                        filenames, openhook=hook_compressed).map(_count_words))),
+            ]:
+                results.add('fileinput_map', impl, measure(func), n=n)
+
+
+BENCHMARKS = [
+    bench_read_compressed,
+    bench_gzip_seek,
+    bench_line_range,
+    bench_lazy_open_file,
+    bench_write_compressed,
+    bench_fileinput,
+    bench_fileinput_batches,
+    bench_fileinput_map,
+]
+
+
+################################################################################
+
+if __name__ == '__main__':
+    main('iofile', BENCHMARKS, description=CALLER_DOC)
@@ -0,0 +1,234 @@
+"""
+Benchmarks of parser construction and parsing, comparing apegears' ArgumentParser with
+argparse's.
+
+Run like::
+
+    python -m benchmarks.bench_parser [--quick] [--json results.json]
+"""
+
+import argparse
+from collections import OrderedDict
+
+import apegears
+from apegears import CALLER_DOC
+
+from .common import measure, measure_subprocess, main
+
+
+################################################################################
+# scales
+
+NUM_OPTIONS = [10, 100, 1000, 5000]
+LIST_LENGTHS = [10, 1000, 100000]
+QUICK_NUM_OPTIONS = [10, 100]
+QUICK_LIST_LENGTHS = [10, 1000]
+
+
+def _scales(full, quick_scales, quick):
+    return quick_scales if quick else full
+
+
+################################################################################
+# parser builders
+
+def _build_optionals(impl, n):
+    if impl == 'apegears':
+        parser = apegears.ArgumentParser()
+        for i in range(n):
+            parser.add_optional('opt%d' % i, type=int, default=0)
+    else:
+        parser = argparse.ArgumentParser()
+        for i in range(n):
+            parser.add_argument('--opt%d' % i, type=int, default=0)
+    return parser
+
+
+def _build_list(impl, positional=False, container=None):
+    if impl == 'apegears':
+        parser = apegears.ArgumentParser()
+        if positional:
+            parser.add_positional_list('x', type=int, container=container)
+        else:
+            parser.add_list('x', type=int, container=container)
+    else:
+        parser = argparse.ArgumentParser()
+        if positional:
+            parser.add_argument('x', nargs='*', type=int, default=[])
+        else:
+            parser.add_argument('-x', nargs='+', type=int, action='extend', default=[])
+    return parser
+
+
+def _build_dict(impl):
+    if impl == 'apegears':
+        parser = apegears.ArgumentParser()
+        parser.add_dict('D', type=int)
+    else:
+        # closest argparse equivalent: a list of KEY=VALUE strings, converted after parsing
+        parser = argparse.ArgumentParser()
+        parser.add_argument('-D', nargs='+', action='extend', default=[])
+    return parser
+
+
+def _parse_dict(impl, parser, cli_args):
+    args = parser.parse_args(cli_args)
+    if impl != 'apegears':
+        args.D = OrderedDict((k, int(v)) for k, v in (x.split('=', 1) for x in args.D))
+    return args
+
+
+def _build_strict_default(impl, n):
+    parser = apegears.ArgumentParser()
+    for i in range(n):
+        parser.add_list('opt%d' % i, default=['a', 'b'], strict_default=(impl == 'strict'))
+    return parser
+
+
+def _get_containers():
+    try:
+        import numpy  # noqa: F401
+        return ['array', 'numpy']
+    except ImportError:
+        return ['array']
+
+
+################################################################################
+# benchmarks
+
+IMPLS = ['apegears', 'argparse']
+
+
+def bench_construct_optionals(results, quick=False):
+    for n in _scales(NUM_OPTIONS, QUICK_NUM_OPTIONS, quick):
+        for impl in IMPLS:
+            results.add('construct_optionals', impl,
+                        measure(lambda: _build_optionals(impl, n)), n=n)
+
+
+def bench_parse_optionals(results, quick=False):
+    for n in _scales(NUM_OPTIONS, QUICK_NUM_OPTIONS, quick):
+        cli_args = []
+        for i in range(n):
+            cli_args += ['--opt%d' % i, str(i)]
+        for impl in IMPLS:
+            parser = _build_optionals(impl, n)
+            results.add('parse_optionals', impl,
+                        measure(lambda: parser.parse_args(cli_args)), n=n)
+
+
+def bench_parse_list(results, quick=False):
+    for positional in [False, True]:
+        name = 'parse_positional_list' if positional else 'parse_list'
+        for n in _scales(LIST_LENGTHS, QUICK_LIST_LENGTHS, quick):
+            values = [str(i) for i in range(n)]
+            cli_args = values if positional else ['-x'] + values
+            for impl in IMPLS:
+                parser = _build_list(impl, positional=positional)
+                results.add(name, impl, measure(lambda: parser.parse_args(cli_args)), n=n)
+            for container in _get_containers():
+                parser = _build_list('apegears', positional=positional, container=container)
+                results.add(name, 'apegears-%s' % container,
+                            measure(lambda: parser.parse_args(cli_args)), n=n)
+
+
+def bench_parse_datetime_list(results, quick=False):
+    for n in _scales(LIST_LENGTHS, QUICK_LIST_LENGTHS, quick):
+        cli_args = ['-t'] + [
+            '2020-01-02T03:04:%02d.%06dZ' % (i % 60, i % 1000000) for i in range(n)]
+        for container in [None] + _get_containers():
+            if container == 'array':
+                continue  # not supported for datetimes
+            parser = apegears.ArgumentParser()
+            parser.add_list(type='datetime', container=container)
+            results.add('parse_datetime_list', 'apegears-%s' % (container or 'default'),
+                        measure(lambda: parser.parse_args(cli_args)), n=n)
+
+
+def bench_parse_dict(results, quick=False):
+    for n in _scales(LIST_LENGTHS, QUICK_LIST_LENGTHS, quick):
+        cli_args = ['-D'] + ['k%d=%d' % (i, i) for i in range(n)]
+        for impl in IMPLS:
+            parser = _build_dict(impl)
+            results.add('parse_dict', impl,
+                        measure(lambda: _parse_dict(impl, parser, cli_args)), n=n)
+
+
+def bench_strict_default(results, quick=False):
+    for n in _scales(NUM_OPTIONS, QUICK_NUM_OPTIONS, quick):
+        cli_args = []
+        for i in range(n):
+            cli_args += ['--opt%d' % i, 'x']
+        for impl in ['strict', 'non-strict']:
+            results.add('construct_strict_default', impl,
+                        measure(lambda: _build_strict_default(impl, n)), n=n)
+            parser = _build_strict_default(impl, n)
+            results.add('parse_strict_default', impl,
+                        measure(lambda: parser.parse_args(cli_args)), n=n)
+
+
+def bench_accumulate(results, quick=False):
+    # Calls the actions directly, n times, the same way the parser does for an option appearing
+    # n times.  This isolates the accumulation from argparse's own scanning of the command line
+    # (which is quadratic in the number of option occurrences).
+    # apegears' extend/setitem actions scale linearly.  argparse's append action copies the
+    # list on every call.
+    scales = [1000, 10000] if quick else [1000, 10000, 100000]
+    for n in scales:
+        for impl, parser, dest, values in [
+                ('apegears', _build_list('apegears'), 'x', ['1']),
+                ('apegears', _build_dict('apegears'), 'D', [('k', 1)]),
+                ('argparse', _build_list('argparse'), 'x', ['1']),
+        ]:
+            if impl == 'argparse' and n > 10000:
+                continue  # quadratic, takes too long
+            action = parser._option_string_actions['-' + dest]
+            if impl == 'argparse':
+                action = argparse._AppendAction(action.option_strings, dest)
+
+            def accumulate():
+                namespace = argparse.Namespace(**{dest: action.default})
+                for _ in range(n):
+                    action(parser, namespace, values, '-' + dest)
+
+            name = 'accumulate_%s' % ('dict' if dest == 'D' else 'list')
+            results.add(name, impl, measure(accumulate), n=n)
+
+
+def bench_import(results, quick=False):
+    repeat = 3 if quick else 10
+    for impl, code in [
+            ('python', 'pass'),
+            ('argparse', 'import argparse'),
+            ('apegears', 'import apegears'),
+            ('argparse', 'import argparse; argparse.ArgumentParser()'),
+            ('apegears', 'import apegears; apegears.ArgumentParser()'),
+    ]:
+        name = 'import_and_construct' if 'ArgumentParser' in code else 'import'
+        results.add(name, impl, measure_subprocess(code, repeat=repeat))
+
+
+def bench_caller_doc(results, quick=False):
+    number = 100 if quick else 1000
+    for impl, description in [('caller_doc', CALLER_DOC), ('none', None)]:
+        results.add('construct_description', impl, measure(
+            lambda: apegears.ArgumentParser(description=description), number=number))
+
+
+BENCHMARKS = [
+    bench_construct_optionals,
+    bench_parse_optionals,
+    bench_parse_list,
+    bench_parse_datetime_list,
+    bench_parse_dict,
+    bench_strict_default,
+    bench_accumulate,
+    bench_import,
+    bench_caller_doc,
+]
+
+
+################################################################################
+
+if __name__ == '__main__':
+    main('parser', BENCHMARKS, description=CALLER_DOC)
@@ -0,0 +1,107 @@
+"""
+Benchmarks of the argument types defined in ``apegears.types``.
+
+Run like::
+
+    python -m benchmarks.bench_types [--quick] [--json results.json]
+"""
+
+import random
+import ipaddress
+import string
+
+from apegears import CALLER_DOC
+from apegears.types import RegexSet, NetworkSet
+
+from .common import measure, main
+
+
+################################################################################
+# scales
+
+NUM_PATTERNS = [10, 200, 1000]
+QUICK_NUM_PATTERNS = [10, 200]
+NUM_LINES = 1000
+NUM_NETWORKS = [100, 10000]
+QUICK_NUM_NETWORKS = [100]
+NUM_ADDRESSES = 10000
+
+
+################################################################################
+# benchmarks
+
+def _get_lines(n):
+    return [
+        '2020-01-02 03:04:05 host%d worker[%d]: request %d done in %dms' % (i % 7, i, i, i % 100)
+        for i in range(n)
+    ]
+
+
+def _get_patterns(kind, n):
+    if kind == 'common_prefix':
+        return [r'error code %d\b' % i for i in range(n)]
+    # distinct words
+    rand = random.Random(0)
+    return [
+        ''.join(rand.choice(string.ascii_lowercase) for _ in range(rand.randint(5, 10)))
+        + r'\s+\d+'
+        for _ in range(n)
+    ]
+
+
+def bench_regex_set(results, quick=False):
+    # patterns which (almost) never match, i.e. the common case of a filter
+    lines = _get_lines(NUM_LINES)
+    for n in QUICK_NUM_PATTERNS if quick else NUM_PATTERNS:
+        for kind in ['common_prefix', 'words']:
+            patterns = _get_patterns(kind, n)
+            regex_set = RegexSet(patterns)
+            compiled = list(regex_set)
+            fallback = RegexSet(patterns)
+            fallback.combined = None
+
+            def match_loop():
+                for line in lines:
+                    for p in compiled:
+                        if p.search(line):
+                            break
+
+            def match_set(regex_set):
+                for line in lines:
+                    regex_set.search(line)
+
+            name = 'regex_set_search_%s' % kind
+            results.add(name, 'loop', measure(match_loop), n=n)
+            results.add(name, 'combined', measure(lambda: match_set(regex_set)), n=n)
+            results.add(name, 'fallback', measure(lambda: match_set(fallback)), n=n)
+
+
+def bench_network_set(results, quick=False):
+    rand = random.Random(0)
+    addresses = [
+        ipaddress.IPv4Address(rand.getrandbits(32)) for _ in range(NUM_ADDRESSES)]
+    for n in QUICK_NUM_NETWORKS if quick else NUM_NETWORKS:
+        networks = [
+            ipaddress.ip_network((rand.getrandbits(32), rand.randint(8, 32)), strict=False)
+            for _ in range(n)
+        ]
+        results.add('network_set_construct', 'apegears', measure(lambda: NetworkSet(networks)),
+                    n=n)
+        network_set = NetworkSet(networks)
+        results.add('network_set_contains', 'apegears',
+                    measure(lambda: [a in network_set for a in addresses]), n=n)
+        if n <= 1000:
+            results.add('network_set_contains', 'loop', measure(
+                lambda: [any(a in net for net in networks) for a in addresses]), n=n)
+
+
+BENCHMARKS = [
+    bench_regex_set,
+    bench_network_set,
+]
+
+
+################################################################################
+
+if __name__ == '__main__':
+    main('types', BENCHMARKS, description=CALLER_DOC)
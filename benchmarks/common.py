@@ -0,0 +1,122 @@
+"""
+Shared utilities for the apegears benchmarks.
+
+Each benchmark script defines a set of benchmark functions, and runs them using ``main``.
+Results are printed as a table, and can also be written as JSON (``--json FILE``), for tracking
+regressions between releases.
+"""
+
+import os
+import sys
+import time
+import json
+import platform
+import subprocess
+
+import apegears
+from apegears import ArgumentParser, FileType
+from apegears.version import __version_string__
+
+
+################################################################################
+# timing
+
+def measure(func, *, repeat=3, number=1):
+    """
+    Return the best time (in seconds, per call) of ``repeat`` rounds of ``number`` calls
+    to ``func``.
+    """
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            func()
+        t = (time.perf_counter() - t0) / number
+        if best is None or t < best:
+            best = t
+    return best
+
+
+def measure_subprocess(code, *, repeat=5):
+    """
+    Return the best wall time (in seconds) of running ``code`` in a fresh python interpreter.
+    """
+    # make sure the same apegears package is imported
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [
+        os.path.dirname(os.path.dirname(os.path.abspath(apegears.__file__))),
+        env.get('PYTHONPATH'),
+    ]))
+
+    def run():
+        subprocess.check_call([sys.executable, '-c', code], env=env)
+    return measure(run, repeat=repeat)
+
+
+################################################################################
+# results
+
+class Results:
+    """
+    A collection of benchmark results.
+    """
+
+    def __init__(self, suite):
+        self.suite = suite
+        self.records = []
+
+    def add(self, benchmark, impl, seconds, **params):
+        record = dict(benchmark=benchmark, impl=impl, params=params, seconds=seconds)
+        self.records.append(record)
+        # (printed to stderr, so results can be written to stdout as JSON)
+        print('%-32s %-12s %-24s %12.6f' % (
+            benchmark, impl, ' '.join('%s=%s' % kv for kv in params.items()), seconds),
+            file=sys.stderr)
+        return record
+
+    def to_json(self):
+        return dict(
+            suite=self.suite,
+            apegears_version=__version_string__,
+            python_version=platform.python_version(),
+            python_implementation=platform.python_implementation(),
+            platform=platform.platform(),
+            timestamp=time.strftime('%Y-%m-%dT%H:%M:%S'),
+            results=self.records,
+        )
+
+    def dump(self, file):
+        json.dump(self.to_json(), file, indent=1)
+        file.write('\n')
+
+
+################################################################################
+# main
+
+def main(suite, benchmarks, description=None):
+    """
+    Run a benchmark suite.
+
+    :param benchmarks:
+        a list of functions, each taking a ``Results`` object, and a ``quick`` flag
+        (if true, should run with reduced scales).
+    """
+    parser = ArgumentParser(description=description)
+    parser.add_optional('json', type=FileType('w'), metavar='OUTFILE',
+                        help='write results as JSON to this file ("-" for stdout)')
+    parser.add_optional('filter', type='regex', help='only run benchmarks matching this regex')
+    parser.add_flag('quick', help='run with reduced scales')
+    args = parser.parse_args()
+
+    results = Results(suite)
+    for benchmark in benchmarks:
+        if args.filter is not None and not args.filter.search(benchmark.__name__):
+            continue
+        benchmark(results, quick=args.quick)
+
+    if args.json is not None:
+        results.dump(args.json)
+    return results
+
+
+################################################################################
@@ -4,11 +4,14 @@ cat - concatenate files and print on the standard output.
 This is a simple ``cat`` script, demonstrating fileinput arg type.
 """
 
+import sys
+
 from apegears import ArgumentParser, fileinput, CALLER_DOC
 
 if __name__ == '__main__':
     parser = ArgumentParser(description=CALLER_DOC)
-    parser.add_positional(type=fileinput(decompress=True), nargs='*')
+    parser.add_positional(type=fileinput(decompress=True, mode='rb', batched=True), nargs='*')
     args = parser.parse_args()
-    for line in args.infiles:
-        print(line, end='')
+    # chunks of lines are much faster than line-by-line iteration
+    for chunk in args.infiles.iter_chunks():
+        sys.stdout.buffer.write(chunk)
@@ -27,9 +27,10 @@ setup(
     author_email='shx222@gmail.com',
     license='MIT',
 
-    packages=find_packages(exclude=['tests*']),
+    packages=find_packages(exclude=['tests*', 'benchmarks*']),
     platforms = ["POSIX", "Windows"],
     install_requires=[],
+    python_requires='>=3.8',
 
     # See https://pypi.python.org/pypi?%3Aaction=list_classifiers
     classifiers=[
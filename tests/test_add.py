@@ -3,10 +3,27 @@ Unit-tests for the ArgumentParser.add_xxx() methods.
 """
 
 import unittest
+import array
+from enum import Enum
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import argcomplete
+except ImportError:
+    argcomplete = None
 
 from apegears import ArgumentParser as AP
 
 
+class Color(Enum):
+    RED = 1
+    BLUE = 2
+
+
 ################################################################################
 
 class AddArgumentTest(unittest.TestCase):
@@ -126,6 +143,46 @@ class AddArgumentTest(unittest.TestCase):
         # test the workaround this issue: https://bugs.python.org/issue16399
         self.assertEqual(P('-x', default=d, cli_args='-x c').x, ['c'])
 
+    def test_list_container(self):
+        def P(*a, **kw):
+            return self._parse('list', *a, **kw)
+
+        self.assertEqual(P('x', type=int, container='list', cli_args='-x 1 2 -x 3').x, [1, 2, 3])
+        res = P('x', type=int, container='array', cli_args='-x 1 2 -x 3').x
+        self.assertEqual(res, array.array('q', [1, 2, 3]))
+        res = P('x', type=float, container='array', cli_args='').x
+        self.assertEqual(res, array.array('d'))
+        res = P('x', type=float, container='array', default=[1.5], cli_args='').x
+        self.assertEqual(res, array.array('d', [1.5]))
+        res = self._parse('positional_list', 'x', type=int, container='array', cli_args='4 5').x
+        self.assertEqual(res, array.array('q', [4, 5]))
+        # the typecode of a memoized type is of the underlying type:
+        res = P('x', type=int, container='array', memoize=True, cli_args='-x 1 2 -x 1').x
+        self.assertEqual(res, array.array('q', [1, 2, 1]))
+
+        # raise if invalid values are passed
+        self.assertRaises(SystemExit, P, 'x', type=int, container='array', cli_args='-x 1 a')
+        # raise if the container is not supported
+        self.assertRaises(ValueError, P, 'x', container='array')
+        self.assertRaises(ValueError, P, 'x', type=int, container='set')
+        # choices are checked after converting (also choices of the spec, e.g. of enums):
+        res = P('x', type=int, container='array', choices=[1, 2], cli_args='-x 1 2 1').x
+        self.assertEqual(res, array.array('q', [1, 2, 1]))
+        self.assertRaises(SystemExit, P, 'x', type=int, container='array', choices=[1, 2],
+                          cli_args='-x 1 3')
+        self.assertRaises(SystemExit, P, 'x', type=Color, container='list', cli_args='-x GREEN')
+        self.assertEqual(P('x', type=Color, container='list', cli_args='-x RED BLUE').x,
+                         [Color.RED, Color.BLUE])
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_list_container_numpy(self):
+        res = self._parse('list', 'x', type=float, container='numpy', cli_args='-x 1 2.5').x
+        self.assertIsInstance(res, numpy.ndarray)
+        self.assertEqual(res.tolist(), [1.0, 2.5])
+        res = self._parse(
+            'list', 'x', type=float, container='numpy', memoize=True, cli_args='-x 1 2.5').x
+        self.assertEqual(res.dtype, numpy.dtype(float))
+
     def test_dict(self):
         def P(*a, **kw):
             return self._parse('dict', *a, **kw)
@@ -153,6 +210,41 @@ class AddArgumentTest(unittest.TestCase):
         # test the workaround this issue: https://bugs.python.org/issue16399
         self.assertEqual(P('-x', default=d, cli_args='-x c=cc').x, {'c': 'cc'})
 
+    def test_reuse_parser(self):
+        # (no -L option, for checking the attributes of the namespace)
+        ap = AP(log_levels=False)
+        ap.add_list('x', default=['a'])
+        ap.add_dict('y', default={'a': 'aa'})
+        for _ in range(3):
+            args = ap.parse_args('-x b -x c -y b=bb'.split())
+            self.assertEqual(args.x, ['b', 'c'])
+            self.assertEqual(args.y, {'b': 'bb'})
+            args = ap.parse_args([])
+            self.assertEqual(args.x, ['a'])
+            self.assertEqual(args.y, {'a': 'aa'})
+            self.assertEqual(sorted(vars(args)), ['x', 'y'])
+        # the default object itself is never modified:
+        self.assertEqual(ap.get_default('x'), ['a'])
+
+    def test_concurrent_parse(self):
+        from concurrent.futures import ThreadPoolExecutor
+        ap = AP()
+        ap.add_list('x', type=int, default=[-1])
+        subparsers = ap.add_subparsers(dest='cmd')
+        subparsers.add_lazy_parser('sub', _build_subparser)
+
+        def parse(i):
+            if i % 2:
+                return ap.parse_args(['sub'])
+            return ap.parse_args(['-x', str(i)] * (i % 5 + 1))
+
+        with ThreadPoolExecutor(8) as executor:
+            for i, args in enumerate(executor.map(parse, range(500))):
+                if i % 2:
+                    self.assertEqual((args.x, args.y), ([-1], 'yy'))
+                else:
+                    self.assertEqual(args.x, [i] * (i % 5 + 1))
+
     def test_issue16399(self):
         # for compatibility, we make sure we reproduce the old behavior, see
         # https://bugs.python.org/issue16399
@@ -164,6 +256,85 @@ class AddArgumentTest(unittest.TestCase):
             ['aa', 'bb', 'cc'],
         )
 
+    def test_lazy_subparsers(self):
+        built = []
+
+        def factory(**kwargs):
+            built.append(kwargs)
+            ap = AP()
+            ap.add_optional('x', type=int)
+            return ap
+
+        ap = AP()
+        subparsers = ap.add_subparsers(dest='cmd')
+        subparsers.add_lazy_parser('a', factory, help='command a', aliases=['aa'], foo=1)
+        subparsers.add_lazy_parser('b', factory)
+        subparsers.add_lazy_parser('c', 'tests.test_add:_build_subparser')
+        self.assertIn('{a,aa,b,c}', ap.format_usage())
+        self.assertEqual(built, [])
+
+        args = ap.parse_args('aa -x 5'.split())
+        self.assertEqual((args.cmd, args.x), ('aa', 5))
+        self.assertEqual(built, [dict(foo=1)])
+        self.assertIs(subparsers.get_parser('a'), subparsers.get_parser('aa'))
+        self.assertEqual(subparsers.get_parser('a').prog.split()[-1], 'a')
+        self.assertEqual(ap.parse_args(['c']).y, 'yy')
+        self.assertEqual(len(built), 1)
+
+        self.assertRaises(SystemExit, ap.parse_args, ['d'])
+        self.assertRaises(Exception, subparsers.add_lazy_parser, 'b', factory)
+
+    def test_lazy_subparsers_help(self):
+        ap = AP()
+        subparsers = ap.add_subparsers(dest='cmd')
+        subparsers.add_lazy_parser('a', _build_subparser, help='command a')
+        subparsers.add_lazy_parser('b', _build_subparser, description='Command b.\nMore.')
+        self.assertTrue(all(type(p).__name__ == '_LazyParser'
+                            for p in dict.values(subparsers._name_parser_map)))
+        # the full help builds the subparsers, and lists them using their description:
+        help = ap.format_help()
+        self.assertIn('command a', help)
+        self.assertIn('Command b.', help)
+        self.assertNotIn('More.', help)
+        self.assertFalse(any(type(p).__name__ == '_LazyParser'
+                             for p in dict.values(subparsers._name_parser_map)))
+
+    @unittest.skipIf(argcomplete is None, 'argcomplete is not installed')
+    def test_lazy_subparsers_argcomplete(self):
+        ap = AP(log_levels=False)
+        subparsers = ap.add_subparsers(dest='cmd')
+        subparsers.add_lazy_parser('a', _build_subparser)
+        finder = argcomplete.CompletionFinder(ap)
+        self.assertIn('-y', finder._get_completions(['prog', 'a', '-'], '-', '', None))
+
+    def test_sharded(self):
+        values = ['v%d' % i for i in range(100)]
+        for by in ['hash', 'round-robin']:
+            shards = [
+                self._parse('positional_list', 'x', sharded=True, cli_args='%s %s' % (
+                    '--shard-index %d --shard-count 3 --shard-by %s' % (i, by), ' '.join(values)
+                )).x
+                for i in range(3)
+            ]
+            # a partition of the values, in their original order:
+            self.assertEqual(sorted(sum(shards, []), key=values.index), values)
+            self.assertTrue(all(shard == sorted(shard, key=values.index) for shard in shards))
+            self.assertTrue(all(shard for shard in shards))
+        # hash sharding doesn't depend on the other values:
+        def parse_ints(cli_args):
+            return self._parse('list', 'x', type=int, sharded=True, cli_args=cli_args).x
+        shard = parse_ints('--shard-count 3 -x 1 2 3 4 5')
+        self.assertEqual(set(shard), {
+            v for v in range(1, 6) if parse_ints('--shard-count 3 -x %d' % v)
+        })
+        # no sharding by default:
+        self.assertEqual(self._parse('positional_list', 'x', sharded=True, cli_args='a b c').x,
+                         ['a', 'b', 'c'])
+        self.assertRaises(SystemExit, self._parse, 'positional_list', 'x', sharded=True,
+                          cli_args='--shard-count 2 --shard-index 2 a')
+        self.assertRaises(ValueError, self._parse, 'optional', 'x', sharded=True)
+        self.assertRaises(ValueError, self._parse, 'dict', 'x', sharded=True)
+
     ################################################################################
 
     def _parse(self, arg_type, *args, cli_args=None, **kwargs):
@@ -174,4 +345,10 @@ class AddArgumentTest(unittest.TestCase):
             return ap.parse_args(cli_args.split())
 
 
+def _build_subparser(**kwargs):
+    ap = AP(**kwargs)
+    ap.add_optional('y', default='yy')
+    return ap
+
+
 ################################################################################
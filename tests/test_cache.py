@@ -0,0 +1,75 @@
+"""
+Unit-tests for persistent parser snapshots.
+"""
+
+import unittest
+import tempfile
+from enum import Enum
+
+from apegears import ArgumentParser as AP, cached_parser, fileinput
+from apegears.cache import save_parser, load_parser
+
+
+################################################################################
+
+class Color(Enum):
+    red = 1
+    green = 2
+
+
+_NUM_BUILDS = 0
+
+
+def _build_parser():
+    global _NUM_BUILDS
+    _NUM_BUILDS += 1
+    ap = AP()
+    ap.add_optional('x', type=int, default=3)
+    ap.add_list('l', type='date')
+    ap.add_dict('d', type=float)
+    ap.add_optional(type=Color)
+    ap.add_flag('f')
+    ap.add_positional_list(type=fileinput())
+    return ap
+
+
+################################################################################
+
+class CacheTest(unittest.TestCase):
+
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = tmpdir + '/parser.pickle'
+            save_parser(_build_parser(), filename)
+            ap = load_parser(filename)
+        args = ap.parse_args('-x 4 -l 2020-01-02 -d a=1.5 --color green -f'.split())
+        self.assertEqual(args.x, 4)
+        self.assertEqual(str(args.l[0]), '2020-01-02')
+        self.assertEqual(args.d, {'a': 1.5})
+        self.assertEqual(args.color, Color.green)
+        self.assertTrue(args.f)
+        self.assertEqual(ap.parse_args([]).x, 3)
+        self.assertEqual(ap.format_help(), _build_parser().format_help())
+
+    def test_cached_parser(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            build = cached_parser(_build_parser, cache_dir=tmpdir)
+            num_builds = _NUM_BUILDS
+            ap1 = build()
+            ap2 = build()
+            self.assertEqual(_NUM_BUILDS, num_builds + 1)
+            self.assertIsNot(ap1, ap2)
+            self.assertEqual(ap2.parse_args(['-x', '7']).x, 7)
+
+    def test_unpicklable(self):
+        def build():
+            ap = AP()
+            ap.add_optional('x', type=lambda s: s * 2)
+            return ap
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            ap = cached_parser(build, cache_dir=tmpdir)()
+            self.assertEqual(ap.parse_args(['-x', 'a']).x, 'aa')
+
+
+################################################################################
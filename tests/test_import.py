@@ -0,0 +1,78 @@
+"""
+Unit-tests for the import-time cost of apegears (lazy loading of submodules).
+"""
+
+import unittest
+import sys
+import os
+import subprocess
+import datetime
+import pathlib
+
+from apegears import spec
+
+
+################################################################################
+
+_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_LOADED_MODULES_SCRIPT = '''
+import sys
+before = set(sys.modules)
+%s
+print(' '.join(sorted(set(sys.modules) - before)))
+'''
+
+
+################################################################################
+
+class ImportTest(unittest.TestCase):
+
+    def test_import_apegears(self):
+        self.assertEqual(self._get_loaded_modules('import apegears'), {'apegears'})
+
+    def test_create_parser(self):
+        loaded = self._get_loaded_modules(
+            'import apegears; apegears.ArgumentParser().add_optional("x", type=int)')
+        for module_name in [
+                'inspect', 'pickle', 'fileinput', 'ipaddress', 'pathlib', 'ast', 'datetime',
+                'argcomplete', 'apegears.types', 'apegears.iofile', 'apegears.cache']:
+            self.assertNotIn(module_name, loaded)
+
+    def test_submodule_attributes(self):
+        output = self._run(
+            'import apegears; '
+            'print(apegears.types.__name__, apegears.iofile.FileType is apegears.FileType); '
+            'print(hasattr(apegears, "no_such_module"))')
+        self.assertEqual(output.split(), ['apegears.types', 'True', 'False'])
+
+    def test_lazy_specs(self):
+        # all lazily-registered specs are registered by their modules:
+        for key in [range, datetime.date, datetime.datetime, pathlib.Path,
+                    *[k for k in spec._LAZY_SPEC_REGISTRY if '.' not in k]]:
+            self.assertIsNotNone(spec.find_spec(key), key)
+
+    def test_override_lazy_spec(self):
+        # specs registered before their module is loaded are not overridden by it
+        output = self._run(
+            'import pathlib, apegears; '
+            'apegears.register_spec("date", dict(from_string=lambda s: "MINE")); '
+            'apegears.spec.find_spec(pathlib.Path); '
+            'import apegears.types; '
+            'print(apegears.spec.find_spec("date").from_string("2020-01-01"))')
+        self.assertEqual(output.strip(), 'MINE')
+
+    ################################################################################
+
+    def _get_loaded_modules(self, code):
+        return set(self._run(_LOADED_MODULES_SCRIPT % code).split())
+
+    def _run(self, code):
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [_ROOT_DIR, env.get('PYTHONPATH')]))
+        env.pop('_ARGCOMPLETE', None)
+        return subprocess.check_output(
+            [sys.executable, '-c', code], env=env, universal_newlines=True)
+
+
+################################################################################
@@ -0,0 +1,857 @@
+"""
+Unit-tests for file-related arg types.
+"""
+
+import os
+import errno
+import unittest
+import unittest.mock
+import tempfile
+import pickle
+import gzip
+import json
+import random
+
+import fileinput as _fileinput
+
+from apegears import ArgumentParser as AP, fileinput, FileType
+from apegears import iofile
+from apegears import compression, gzindex, lineindex
+from apegears.iofile import (
+    save_pickle, load_pickle, open_compressed, hook_compressed, FileInput, LazyOpenFile,
+)
+from apegears.lineindex import LineIndex, IndexedTextFile, get_line_index
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+################################################################################
+
+def _count_lines(fi):
+    return sum(len(batch) for batch in fi.iter_batches())
+
+
+class FileInputTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.files = []
+        for i, num_lines in enumerate([3, 0, 1, 2000, 5]):
+            fn = os.path.join(self.tmpdir.name, 'f%d.txt.gz' % i)
+            with gzip.open(fn, 'wt') as F:
+                F.write(''.join('file %d line %d\n' % (i, j) for j in range(num_lines)))
+            self.files.append(fn)
+
+    def _state(self, fi, line):
+        return (line, fi.filename(), fi.lineno(), fi.filelineno(), fi.isfirstline())
+
+    def _expected(self, mode='r'):
+        with _fileinput.FileInput(self.files, mode=mode, openhook=open_compressed) as fi:
+            return [self._state(fi, line) for line in fi]
+
+    def test_same_as_stdlib(self):
+        for mode in ['r', 'rb']:
+            expected = self._expected(mode)
+            for prefetch in [0, 1, 3]:
+                with FileInput(self.files, mode=mode, openhook=open_compressed,
+                               prefetch=prefetch) as fi:
+                    self.assertEqual([self._state(fi, line) for line in fi], expected)
+
+    def test_iter_batches(self):
+        for mode in ['r', 'rb']:
+            expected = self._expected(mode)
+            for prefetch in [0, 2]:
+                for n in [None, 1, 7]:
+                    fi = FileInput(self.files, mode=mode, openhook=open_compressed,
+                                   prefetch=prefetch)
+                    # continues from the current position:
+                    lines = [next(fi), next(fi)]
+                    for batch in fi.iter_batches(n):
+                        self.assertLessEqual(len(batch), n or len(batch))
+                        lines.extend(batch)
+                        state = (batch[-1], fi.filename(), fi.lineno())
+                        self.assertEqual(state, expected[len(lines) - 1][:3])
+                    self.assertEqual(lines, [x[0] for x in expected])
+
+    def test_iter_chunks(self):
+        text = ''.join(x[0] for x in self._expected())
+        for prefetch in [0, 2]:
+            for mode, decode, expected in [
+                    ('r', None, text), ('rb', None, text.encode()), ('r', False, text.encode()),
+                    ('rb', True, text)]:
+                fi = FileInput(self.files, mode=mode, openhook=open_compressed,
+                               prefetch=prefetch)
+                chunks = list(fi.iter_chunks(100, decode=decode))
+                self.assertEqual(chunks[0][:0].join(chunks), expected)
+                newline = expected[-1:]
+                self.assertTrue(all(chunk.endswith(newline) for chunk in chunks))
+                self.assertEqual(fi.lineno(), 2009)
+        fi = FileInput(self.files, openhook=open_compressed)
+        next(fi)
+        self.assertRaises(ValueError, next, fi.iter_chunks())
+
+    def test_iter_chunks_long_lines(self):
+        fn = os.path.join(self.tmpdir.name, 'long.txt')
+        with open(fn, 'wb') as F:
+            F.write(b'x' * 10000 + b'\ny\n' + b'z' * 5000)
+        chunks = list(FileInput([fn], mode='rb').iter_chunks(100))
+        self.assertEqual(chunks, [b'x' * 10000 + b'\ny\n', b'z' * 5000])
+
+    def test_iter_chunks_errors(self):
+        fn = os.path.join(self.tmpdir.name, 'binary.txt')
+        with open(fn, 'wb') as F:
+            F.write(b'a\xff\nb\n')
+        fi = FileInput([fn], encoding='utf-8')
+        self.assertRaises(UnicodeDecodeError, list, fi.iter_chunks())
+        fi = FileInput([fn], encoding='utf-8')
+        chunks = list(fi.iter_chunks(errors='surrogateescape'))
+        self.assertEqual(chunks, ['a\udcff\nb\n'])
+        self.assertEqual(chunks[0].encode('utf-8', 'surrogateescape'), b'a\xff\nb\n')
+
+    def test_map(self):
+        expected = [len(self._read(fn)) for fn in self.files]
+        for pool in ['thread', 'process']:
+            fi = FileInput(self.files, openhook=open_compressed)
+            self.assertEqual(list(fi.map(_count_lines, workers=2, pool=pool)), expected)
+            fi = FileInput(self.files, openhook=open_compressed)
+            results = list(fi.map(_count_lines, workers=2, ordered=False, pool=pool))
+            self.assertEqual(sorted(results), sorted(expected))
+        # errors are raised when reached:
+        fi = FileInput(self.files + ['no-such-file'], openhook=open_compressed)
+        results = fi.map(_count_lines, workers=2, pool='thread')
+        self.assertEqual([next(results) for _ in self.files], expected)
+        self.assertRaises(FileNotFoundError, next, results)
+
+    def _read(self, fn):
+        with gzip.open(fn, 'rt') as F:
+            return F.readlines()
+
+    def test_parser(self):
+        ap = AP()
+        ap.add_positional_list(type=fileinput(decompress=True, prefetch=2))
+        fi = ap.parse_args(self.files).infiles
+        self.assertIsInstance(fi, FileInput)
+        for line in fi:
+            pass
+        self.assertEqual(fi.lineno(), 2009)
+        ap = AP()
+        ap.add_positional_list(type=fileinput(decompress=True, batched=True))
+        fi = ap.parse_args(self.files).infiles
+        self.assertEqual(_count_lines(fi), 2009)
+        # stdlib's fileinput, unless prefetching or batched:
+        ap = AP()
+        ap.add_positional_list(type=fileinput(decompress=True))
+        fi = ap.parse_args(self.files).infiles
+        self.assertIsInstance(fi, _fileinput.FileInput)
+        for line in fi:
+            self.assertEqual(_fileinput.filename(), fi.filename())
+        self.assertEqual(fi.lineno(), 2009)
+        fi.close()
+
+    def test_nextfile(self):
+        for prefetch in [0, 2]:
+            fi = FileInput(self.files, openhook=open_compressed, prefetch=prefetch)
+            lines = []
+            for line in fi:
+                lines.append(line)
+                if fi.filelineno() == 2:
+                    fi.nextfile()
+            self.assertEqual(len(lines), 2 + 1 + 2 + 2)
+            self.assertEqual(lines[-1], 'file 4 line 1\n')
+            fi.close()
+
+    def test_errors(self):
+        files = self.files[:1] + [os.path.join(self.tmpdir.name, 'no-such-file')]
+        for prefetch in [0, 2]:
+            fi = FileInput(files, prefetch=prefetch, openhook=open_compressed)
+            # raised when reaching the file
+            self.assertEqual(len([next(fi) for _ in range(3)]), 3)
+            self.assertRaises(FileNotFoundError, next, fi)
+
+    def test_close_early(self):
+        with FileInput(self.files, openhook=open_compressed, prefetch=4) as fi:
+            next(fi)
+        self.assertRaises(StopIteration, next, fi)
+
+    @unittest.skipUnless(hasattr(os, 'mkfifo'), 'requires named pipes')
+    def test_stream(self):
+        # lines from a pipe are passed on as they come, not when a full batch is read
+        for prefetch in [0, 1]:
+            items = self._read_stream(lambda fn: FileInput([fn], prefetch=prefetch))
+            self.assertEqual(items, ['line %d\n' % i for i in range(3)])
+            items = self._read_stream(lambda fn: FileInput([fn], prefetch=prefetch).iter_chunks())
+            self.assertEqual(items, ['line %d\n' % i for i in range(3)])
+
+    def _read_stream(self, get_items, num_lines=3):
+        """
+        Read lines written to a named pipe one at a time, each written only after the
+        previous one was read (by iterating ``get_items(filename)``).
+        """
+        import threading
+        fn = os.path.join(self.tmpdir.name, 'fifo')
+        os.mkfifo(fn)
+        received = threading.Semaphore(0)
+        timeouts = []
+
+        def write():
+            with open(fn, 'w') as F:
+                for i in range(num_lines):
+                    F.write('line %d\n' % i)
+                    F.flush()
+                    if not received.acquire(timeout=2):
+                        timeouts.append(i)
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        items = []
+        try:
+            for item in get_items(fn):
+                items.append(item)
+                received.release()
+        finally:
+            writer.join()
+            os.remove(fn)
+        self.assertEqual(timeouts, [])
+        return items
+
+
+class PickleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def _path(self, name):
+        return os.path.join(self.tmpdir.name, name)
+
+    def test_regular_pickle(self):
+        data = {'a': [1, 2, 3], 'b': b'x' * 10000}
+        for name, open_func in [('data.pkl', open), ('data.pkl.gz', gzip.open)]:
+            fn = self._path(name)
+            with open_func(fn, 'wb') as F:
+                pickle.dump(data, F)
+            self.assertEqual(load_pickle(fn), data)
+            self.assertEqual(self._parse('pickled_data', fn), data)
+
+    def test_out_of_band(self):
+        buf = bytearray(range(256)) * 100
+        data = {'small': pickle.PickleBuffer(b'xyz'), 'large': pickle.PickleBuffer(buf), 'n': 5}
+        fn = self._path('data.pkl')
+        save_pickle(data, fn)
+        loaded = self._parse('pickled_data', fn)
+        self.assertEqual(loaded['n'], 5)
+        self.assertEqual(bytes(loaded['small']), b'xyz')
+        # a zero-copy view over the mapping:
+        self.assertIsInstance(loaded['large'], memoryview)
+        self.assertEqual(bytes(loaded['large']), bytes(buf))
+        # compressed:
+        save_pickle({'x': buf}, self._path('data.pkl.gz'))
+        self.assertEqual(load_pickle(self._path('data.pkl.gz')), {'x': buf})
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_out_of_band_numpy(self):
+        arr = numpy.arange(100000, dtype=numpy.float64).reshape(1000, 100)
+        fn = self._path('arr.pkl')
+        save_pickle({'arr': arr, 'T': arr.T}, fn)
+        loaded = load_pickle(fn)
+        numpy.testing.assert_array_equal(loaded['arr'], arr)
+        numpy.testing.assert_array_equal(loaded['T'], arr.T)
+        self.assertFalse(loaded['arr'].flags.owndata)
+        self.assertEqual(loaded['arr'].ctypes.data % 64, 0)
+        # the mapping is copy-on-write:
+        loaded['arr'][0, 0] = -1
+        self.assertEqual(load_pickle(fn)['arr'][0, 0], 0)
+
+    def test_lazy(self):
+        fn = self._path('data.pkl')
+        ap = AP()
+        ap.add_positional('x', type='lazy_pickled_data')
+        args = ap.parse_args([fn])
+        # not loaded yet
+        save_pickle([1, 2], fn)
+        self.assertEqual(args.x, [1, 2])
+        args = ap.parse_args([self._path('no-such-file.pkl')])
+        self.assertRaises(SystemExit, getattr, args, 'x')
+
+    def _parse(self, type, fn):
+        ap = AP()
+        ap.add_positional('x', type=type)
+        return ap.parse_args([fn]).x
+
+
+class DataFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def _write(self, name, text):
+        fn = os.path.join(self.tmpdir.name, name)
+        with (gzip.open(fn, 'wt') if name.endswith('.gz') else open(fn, 'w')) as F:
+            F.write(text)
+        return fn
+
+    def _parse(self, type, fn):
+        ap = AP()
+        ap.add_positional('x', type=type)
+        return ap.parse_args([fn]).x
+
+    def test_json(self):
+        data = {'a': [1, 2], 'b': None}
+        for name in ['data.json', 'data.json.gz']:
+            fn = self._write(name, json.dumps(data))
+            self.assertEqual(self._parse('json_data', fn), data)
+        fn = self._write('bad.json', '{')
+        self.assertRaises(SystemExit, self._parse, 'json_data', fn)
+
+    def test_jsonl(self):
+        for name in ['data.jsonl', 'data.jsonl.gz']:
+            fn = self._write(name, '{"a": 1}\n\n[2]\n"x"\n')
+            stream = self._parse('jsonl_stream', fn)
+            self.assertEqual(next(iter(stream)), {'a': 1})
+            # can be iterated more than once:
+            self.assertEqual(list(stream), [{'a': 1}, [2], 'x'])
+        stream = self._parse('jsonl_stream', self._write('bad.jsonl', '1\n{\n'))
+        self.assertRaisesRegex(ValueError, 'bad.jsonl:2', list, stream)
+        self.assertRaises(SystemExit, self._parse, 'jsonl_stream', 'no-such-file.jsonl')
+
+    def test_csv(self):
+        rows = [['a', 'b'], ['1', 'x,y'], ['2', 'line\nbreak']]
+        for name in ['data.csv', 'data.csv.gz']:
+            fn = self._write(name, 'a,b\n1,"x,y"\n2,"line\nbreak"\n')
+            stream = self._parse('csv_stream', fn)
+            self.assertEqual(list(stream), rows)
+            self.assertEqual(list(stream.iter_chunks(2)), [rows[:2], rows[2:]])
+        self.assertRaises(SystemExit, self._parse, 'csv_stream', 'no-such-file.csv')
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_npy(self):
+        arr = numpy.arange(12).reshape(3, 4)
+        fn = os.path.join(self.tmpdir.name, 'arr.npy')
+        numpy.save(fn, arr)
+        loaded = self._parse('npy_data', fn)
+        self.assertIsInstance(loaded, numpy.memmap)
+        numpy.testing.assert_array_equal(loaded, arr)
+        with open(fn, 'rb') as F, gzip.open(fn + '.gz', 'wb') as G:
+            G.write(F.read())
+        numpy.testing.assert_array_equal(self._parse('npy_data', fn + '.gz'), arr)
+        self.assertRaises(SystemExit, self._parse, 'npy_data', self._write('bad.npy', 'x'))
+
+
+class FileTypeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.files = []
+        for i in range(10):
+            fn = self._path('f%d.txt' % i)
+            with open(fn, 'w') as F:
+                F.write(''.join('file %d line %d\n' % (i, j) for j in range(5)))
+            self.files.append(fn)
+
+    def _path(self, name):
+        return os.path.join(self.tmpdir.name, name)
+
+    def _parse(self, mode, *filenames):
+        ap = AP()
+        ap.add_list('f', type=FileType(mode))
+        return ap.parse_args(['-f'] + list(filenames)).f
+
+    def test_read_lazy(self):
+        with unittest.mock.patch('builtins.open') as open_mock:
+            files = self._parse('r', *self.files)
+            self.assertFalse(open_mock.called)
+        self.assertTrue(all(isinstance(f, LazyOpenFile) for f in files))
+        self.assertEqual(files[3].readline(), 'file 3 line 0\n')
+        self.assertEqual(list(files[3]), ['file 3 line %d\n' % j for j in range(1, 5)])
+        with files[4] as f:
+            self.assertEqual(f.read(), ''.join('file 4 line %d\n' % j for j in range(5)))
+        self.assertTrue(files[4].closed)
+        self.assertRaises(ValueError, lambda: files[4].read())
+        # errors are the same as when opening:
+        for fn in [self._path('no-such-file'), self.tmpdir.name]:
+            with unittest.mock.patch('sys.stderr'):
+                self.assertRaises(SystemExit, self._parse, 'r', fn)
+
+    def test_max_open_files(self):
+        for mode in ['r', 'rb']:
+            with unittest.mock.patch.object(iofile, 'MAX_OPEN_FILES', 3):
+                files = self._parse(mode, *self.files)
+                firsts = [f.readline() for f in files]
+                self.assertEqual(len(iofile._open_files), 3)
+                self.assertEqual(sum(f._f is not None for f in files), 3)
+                # evicted files are reopened at the same position:
+                rests = [f.readlines() for f in files]
+            for i, (first, rest) in enumerate(zip(firsts, rests)):
+                lines = [first] + rest
+                if mode == 'rb':
+                    lines = [line.decode() for line in lines]
+                self.assertEqual(lines, ['file %d line %d\n' % (i, j) for j in range(5)])
+            for f in files:
+                f.close()
+            self.assertEqual(len(iofile._open_files), 0)
+
+    def test_lru(self):
+        with unittest.mock.patch.object(iofile, 'MAX_OPEN_FILES', 3):
+            files = self._parse('r', *self.files)
+            # (held before opening)
+            readline = files[0].readline
+            lines = [readline()]
+            for f in files[1:4]:
+                f.readline()
+                lines.append(readline())
+                # in use, so not evicted:
+                self.assertIsNotNone(files[0]._f)
+            for f in files[4:7]:
+                f.readline()
+            self.assertIsNone(files[0]._f)
+            # a held method reopens the evicted file:
+            lines.append(readline())
+            self.assertEqual(lines, ['file 0 line %d\n' % j for j in range(5)])
+            # (no reference cycles keeping the file open)
+            num_open = len(iofile._open_files)
+            del f, files
+            self.assertEqual(len(iofile._open_files), num_open - 3)
+
+    def test_max_open_files_rlimit(self):
+        import resource
+        for limits, expected in [
+                ((64, 4096), 32), ((4096, 4096), 256),
+                ((resource.RLIM_INFINITY, resource.RLIM_INFINITY), 256),
+        ]:
+            with unittest.mock.patch('resource.getrlimit', return_value=limits):
+                self.assertEqual(iofile._get_max_open_files(), expected)
+
+    @unittest.mock.patch.object(iofile, '_open_files', iofile._OpenFilePool())
+    def test_out_of_file_descriptors(self):
+        files = self._parse('r', *self.files[:2])
+        firsts = [f.readline() for f in files]
+        emfile = OSError(errno.EMFILE, os.strerror(errno.EMFILE))
+        real_open = open
+        errors = [emfile, emfile]
+
+        def open_func(*args, **kwargs):
+            if errors:
+                raise errors.pop()
+            return real_open(*args, **kwargs)
+
+        f = LazyOpenFile(self.files[2], open_func=open_func)
+        self.assertEqual(f.readline(), 'file 2 line 0\n')
+        # (the two least-recently used files were closed)
+        self.assertEqual([g._f for g in files], [None, None])
+        self.assertEqual([g.readline() for g in files], ['file 0 line 1\n', 'file 1 line 1\n'])
+        self.assertEqual(firsts, ['file 0 line 0\n', 'file 1 line 0\n'])
+        # fails if there's nothing to close:
+        for g in files + [f]:
+            g.close()
+        errors.append(emfile)
+        g = LazyOpenFile(self.files[2], open_func=open_func)
+        self.assertRaises(OSError, lambda: g.read())
+
+    def test_name_and_mode(self):
+        with unittest.mock.patch('builtins.open') as open_mock:
+            f, = self._parse('rb', self.files[0])
+            self.assertEqual((f.name, f.mode), (self.files[0], 'rb'))
+            self.assertFalse(open_mock.called)
+        f.close()
+        self.assertEqual((f.name, f.mode), (self.files[0], 'rb'))
+
+    def test_iterate_evicted(self):
+        with unittest.mock.patch.object(iofile, 'MAX_OPEN_FILES', 3):
+            files = self._parse('r', *self.files)
+            # (each file is evicted and reopened while iterating)
+            rows = list(zip(*files))
+        self.assertEqual(rows, [
+            tuple('file %d line %d\n' % (i, j) for i in range(10)) for j in range(5)
+        ])
+
+    def test_bound_methods(self):
+        f, = self._parse('w', self._path('out.txt'))
+        self.assertEqual(repr(f), '<LazyOpenFile %r %r>' % (self._path('out.txt'), 'w'))
+        self.assertNotIn('write', vars(f))
+        f.write('x')
+        # after opening, methods are bound directly:
+        self.assertEqual(vars(f)['write'], f._f.write)
+        f.close()
+        self.assertNotIn('write', vars(f))
+
+    def test_write_lazy(self):
+        fn = self._path('out.txt')
+        f, = self._parse('w', fn)
+        self.assertFalse(os.path.exists(fn))
+        f.write('x')
+        f.close()
+        with open(fn) as F:
+            self.assertEqual(F.read(), 'x')
+
+    def test_write_atomic(self):
+        fn = self.files[0]
+        ap = AP()
+        ap.add_list('f', type=FileType('w', atomic=True))
+        f, g = ap.parse_args(['-f', fn, self._path('new.txt')]).f
+        f.write('new content\n')
+        f.flush()
+        # (written to a temp file, renamed on close)
+        with open(fn) as F:
+            self.assertEqual(F.read(), ''.join('file 0 line %d\n' % j for j in range(5)))
+        f.close()
+        with open(fn) as F:
+            self.assertEqual(F.read(), 'new content\n')
+        # on error, the file is left untouched:
+        with self.assertRaises(KeyError):
+            with g:
+                g.write('partial')
+                raise KeyError()
+        self.assertEqual(sorted(os.listdir(self.tmpdir.name)), sorted(
+            os.path.basename(fn) for fn in self.files))
+
+    def test_open_output(self):
+        fn = self._path('out.txt')
+        with iofile.open_output(fn, 'x', atomic=True, fsync='always') as F:
+            F.write('a\n')
+        with iofile.open_output(fn, 'a', atomic=True) as F:
+            F.write('b\n')
+        with open(fn) as F:
+            self.assertEqual(F.read(), 'a\nb\n')
+        self.assertRaises(FileExistsError, iofile.open_output, fn, 'x', atomic=True)
+        self.assertRaises(ValueError, iofile.open_output, fn, 'r')
+        self.assertRaises(ValueError, iofile.open_output, fn, fsync='sometimes')
+        # not closed:
+        F = iofile.open_output(fn, atomic=True)
+        F.write('c\n')
+        del F
+        with open(fn) as F:
+            self.assertEqual(F.read(), 'a\nb\n')
+        self.assertFalse([fn for fn in os.listdir(self.tmpdir.name) if fn.endswith('.tmp')])
+
+    def test_write_compressed(self):
+        lines = ['line %d\n' % i for i in range(10000)]
+        for codec in [compression.get_codec(name) for name in ['gzip', 'xz', 'zstd']]:
+            if not codec.is_available():
+                continue
+            with self.subTest(codec=codec.name):
+                fn = self._path('out' + codec.extensions[0])
+                f, = self._parse_compressed(fn)
+                f.writelines(lines)
+                f.close()
+                with open_compressed(fn, 'rt') as F:
+                    self.assertEqual(F.readlines(), lines)
+
+    def test_write_not_closed(self):
+        # (unless atomic, the file is closed normally when garbage-collected)
+        fn = self._path('out.txt')
+        F = iofile.open_output(fn, fsync='file')
+        F.write('a\n')
+        del F
+        with open(fn) as F:
+            self.assertEqual(F.read(), 'a\n')
+        lines = ['line %d\n' % i for i in range(10000)]
+        fn = self._path('out.gz')
+        f, = self._parse_compressed(fn)
+        f.writelines(lines)
+        del f
+        with open_compressed(fn, 'rt') as F:
+            self.assertEqual(F.readlines(), lines)
+
+    def test_write_compressed_error(self):
+        fn = self._path('out.gz')
+        with unittest.mock.patch.object(compression.get_codec('gzip'), 'open') as open_mock:
+            open_mock.return_value.write.side_effect = OSError('disk full')
+            F = iofile.open_output(fn, 'wb', buffering=16, compress=True, atomic=True)
+            F.write(b'x' * 100)
+            # (raised in the writing thread, when writing or closing)
+            with self.assertRaisesRegex(OSError, 'disk full'):
+                F.write(b'x' * 100)
+                F.close()
+        self.assertFalse(os.path.exists(fn))
+
+    def _parse_compressed(self, *filenames):
+        ap = AP()
+        ap.add_list('f', type=FileType('w', compress=True))
+        return ap.parse_args(['-f'] + list(filenames)).f
+
+
+class CompressionTest(unittest.TestCase):
+
+    TEXT = 'line 1\nline \u05d1\n' * 1000
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def _path(self, name):
+        return os.path.join(self.tmpdir.name, name)
+
+    def _get_codecs(self):
+        return [
+            compression.get_codec(name)
+            for name in ['gzip', 'bz2', 'xz', 'zstd', 'lz4']
+            if compression.get_codec(name).is_available()
+        ]
+
+    def test_roundtrip(self):
+        for codec in self._get_codecs():
+            for ext in codec.extensions:
+                fn = self._path('data.txt' + ext)
+                with open_compressed(fn, 'w', encoding='utf-8') as F:
+                    F.write(self.TEXT)
+                with open(fn, 'rb') as F:
+                    self.assertTrue(codec.sniff(F.read(16)) or ext == '.lzma', ext)
+                with open_compressed(fn, 'r', encoding='utf-8') as F:
+                    self.assertEqual(F.read(), self.TEXT)
+                with open_compressed(fn, 'ab') as F:
+                    F.write(b'more\n')
+                with open_compressed(fn, 'rb') as F:
+                    self.assertEqual(F.read(), (self.TEXT + 'more\n').encode())
+
+    def test_sniff(self):
+        # detected by content, regardless of the extension
+        for codec in self._get_codecs():
+            fn = self._path('data' + codec.extensions[0])
+            with open_compressed(fn, 'wt') as F:
+                F.write(self.TEXT)
+            os.rename(fn, self._path('data.txt'))
+            self.assertIs(compression.find_codec(self._path('data.txt')), codec)
+            with open_compressed(self._path('data.txt'), 'rt') as F:
+                self.assertEqual(F.readline(), 'line 1\n')
+        # plain files (also starting with the magic bytes):
+        for text in ['BZh', 'BZh91AY plain text\n', '\x1f\x8b plain text\n']:
+            with open(self._path('plain.txt'), 'w', encoding='latin-1') as F:
+                F.write(text)
+            self.assertIsNone(compression.find_codec(self._path('plain.txt')))
+            with open_compressed(self._path('plain.txt'), 'r', encoding='latin-1') as F:
+                self.assertEqual(F.read(), text)
+            ap = AP()
+            ap.add_positional(type=fileinput(decompress=True, mode='rb'), nargs='*')
+            self.assertEqual(list(ap.parse_args([self._path('plain.txt')]).infiles),
+                             [text.encode('latin-1')])
+        # the extension of a codec decides:
+        with open(self._path('data.bz2'), 'wb') as F:
+            F.write(gzip.compress(b'x'))
+        self.assertIs(compression.find_codec(self._path('data.bz2')),
+                      compression.get_codec('bz2'))
+
+    def test_subprocess(self):
+        codecs = [codec for codec in self._get_codecs() if codec._get_program() is not None]
+        if not codecs:
+            self.skipTest('no compression programs found')
+        with unittest.mock.patch.object(compression, 'SUBPROCESS_MIN_SIZE', 0), \
+                unittest.mock.patch.object(compression, '_has_module', lambda name: False):
+            # (without modules, reading also uses the programs)
+            for codec in codecs:
+                fn = self._path('data' + codec.extensions[0])
+                with open_compressed(fn, 'wt') as F:
+                    self.assertIsInstance(F.buffer.raw, compression._ProcessPipe)
+                    F.write(self.TEXT)
+                with open_compressed(fn, 'rt') as F:
+                    self.assertIsInstance(F.buffer.raw, compression._ProcessPipe)
+                    self.assertEqual(F.read(), self.TEXT)
+                # closing before EOF:
+                with open_compressed(fn, 'rt') as F:
+                    F.readline()
+                # corrupt data:
+                with open(fn, 'r+b') as F:
+                    F.seek(-8, os.SEEK_END)
+                    F.write(b'\xff' * 8)
+                with open_compressed(fn, 'rb') as F:
+                    self.assertRaises(OSError, F.read)
+
+    def test_subprocess_stream_only(self):
+        # (a pigz on PATH)
+        bin_dir = self._path('bin')
+        os.mkdir(bin_dir)
+        with open(os.path.join(bin_dir, 'pigz'), 'w') as F:
+            F.write('#!/bin/sh\nexec gzip "$@"\n')
+        os.chmod(os.path.join(bin_dir, 'pigz'), 0o755)
+        compression._which.cache_clear()
+        self.addCleanup(compression._which.cache_clear)
+        path = bin_dir + os.pathsep + os.environ.get('PATH', '')
+        with unittest.mock.patch.dict(os.environ, PATH=path):
+            if compression.get_codec('gzip')._get_program() is None:
+                self.skipTest('gzip not found')
+            data = {'x': os.urandom(compression.SUBPROCESS_MIN_SIZE)}
+            fn = self._path('x.pkl.gz')
+            save_pickle(data, fn)
+            # seekable, unless read as a stream:
+            self.assertEqual(load_pickle(fn), data)
+            with open_compressed(fn, 'rb') as F:
+                self.assertTrue(F.seekable())
+            with hook_compressed(fn, 'rb') as F:
+                self.assertIsInstance(F.raw, compression._ProcessPipe)
+                self.assertEqual(pickle.load(F), data)
+            if numpy is not None:
+                arr = numpy.frombuffer(data['x'], dtype=numpy.uint8)
+                fn = self._path('x.npy.gz')
+                with open_compressed(fn, 'wb') as F:
+                    numpy.save(F, arr)
+                ap = AP()
+                ap.add_optional('x', type='npy_data')
+                self.assertTrue(numpy.array_equal(ap.parse_args(['-x', fn]).x, arr))
+
+    def test_missing_file(self):
+        for name in ['no-such-file.gz', 'no-such-file']:
+            self.assertRaises(OSError, open_compressed, self._path(name), 'r')
+
+
+@unittest.skipUnless(gzindex.is_available(), 'zlib library not found')
+class GzipIndexTest(unittest.TestCase):
+
+    SPAN = 1 << 14
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        rand = random.Random(0)
+        self.data = b''.join(
+            b'line %d %x\n' % (i, rand.getrandbits(rand.randrange(400))) for i in range(20000))
+        self.fn = os.path.join(self.tmpdir.name, 'data.txt.gz')
+        with open(self.fn, 'wb') as F:
+            # (multiple gzip members)
+            F.write(gzip.compress(self.data[:100000]))
+            F.write(gzip.compress(self.data[100000:]))
+
+    def test_seek(self):
+        index = gzindex.get_index(self.fn, span=self.SPAN)
+        self.assertGreater(len(index), 10)
+        self.assertEqual((index.size, index.num_lines), (len(self.data), 20000))
+        rand = random.Random(1)
+        with open_compressed(self.fn, 'rb', index=True) as F:
+            self.assertTrue(F.seekable())
+            for _ in range(100):
+                offset, n = rand.randrange(len(self.data) + 10), rand.randrange(50000)
+                F.seek(offset)
+                self.assertEqual(F.read(n), self.data[offset:offset + n])
+            F.seek(-10, os.SEEK_END)
+            self.assertEqual(F.read(), self.data[-10:])
+
+    def test_cached(self):
+        sidecar = self.fn + gzindex.INDEX_SUFFIX
+        index = gzindex.get_index(self.fn, span=self.SPAN)
+        self.assertTrue(os.path.exists(sidecar))
+        with unittest.mock.patch.object(gzindex.GzipIndex, 'build') as build:
+            loaded = gzindex.get_index(self.fn)
+            self.assertFalse(build.called)
+        for attr in ['size', 'num_lines', 'in_offsets', 'out_offsets', 'linenos', 'bits']:
+            self.assertEqual(getattr(loaded, attr), getattr(index, attr))
+        self.assertEqual(loaded.get_window(5), index.get_window(5))
+        # modifying the file invalidates the index:
+        with open(self.fn, 'ab') as F:
+            F.write(gzip.compress(b'more\n'))
+        self.assertEqual(gzindex.get_index(self.fn).size, len(self.data) + 5)
+        # a cache dir:
+        cache_dir = os.path.join(self.tmpdir.name, 'cache')
+        gzindex.get_index(self.fn, cache_dir=cache_dir)
+        self.assertEqual(len(os.listdir(os.path.join(cache_dir, 'gzindex'))), 1)
+
+    def test_split_lines(self):
+        index = gzindex.get_index(self.fn, span=self.SPAN)
+        ranges = gzindex.split_lines(self.fn, 7, index=index)
+        self.assertEqual(len(ranges), 7)
+        self.assertEqual(b''.join(self.data[start:end] for start, end, _ in ranges), self.data)
+        for start, end, lineno in ranges:
+            self.assertEqual(self.data[:start].count(b'\n'), lineno)
+            self.assertEqual(self.data[end - 1:end], b'\n')
+
+    def test_corrupt(self):
+        with open(self.fn, 'r+b') as F:
+            F.truncate(os.path.getsize(self.fn) - 100)
+        self.assertRaises(EOFError, gzindex.get_index, self.fn)
+
+    def test_trailing_padding(self):
+        data = self.data[:100000]
+        for tail, expected in [
+                (b'\0' * 1000, data),
+                (b'\0' * 10000 + b'garbage', data),
+                (b'\0' * 10 + gzip.compress(b'more\n') + b'\0', data + b'more\n'),
+                (b'garbage', data),
+                (b'\x1f', data),
+        ]:
+            with open(self.fn, 'wb') as F:
+                F.write(gzip.compress(data) + tail)
+            index = gzindex.GzipIndex.build(self.fn, span=self.SPAN)
+            self.assertEqual(index.size, len(expected))
+            with gzindex.open_indexed(self.fn, index) as F:
+                self.assertEqual(F.read(), expected)
+
+
+class LineIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.lines = ['line %d %s\n' % (i, 'x' * (i % 37)) for i in range(1000)]
+        self.fn = self._write('data.txt', ''.join(self.lines))
+
+    def _write(self, name, text, open_func=open):
+        fn = os.path.join(self.tmpdir.name, name)
+        with open_func(fn, 'wt') as F:
+            F.write(text)
+        return fn
+
+    def test_build(self):
+        for text in ['', 'a', 'a\n', 'a\nb', ''.join(self.lines), ''.join(self.lines)[:-1]]:
+            fn = self._write('x.txt', text)
+            for stride in [1, 7, 1000]:
+                index = LineIndex.build(fn, stride)
+                self.assertEqual(index.num_lines, len(text.splitlines()))
+                self.assertEqual(index.size, len(text))
+                for i, offset in enumerate(index.offsets):
+                    self.assertEqual(text[:offset].count('\n'), i * stride)
+                    self.assertTrue(offset == 0 or text[offset - 1] == '\n')
+
+    def test_find_newlines(self):
+        chunk = b'a\nbb\n\nccc\nd'
+        for ordinals in [range(4), range(1, 3), range(0, 4, 2), range(0)]:
+            expected = [i for i, c in enumerate(chunk) if c == ord('\n')][
+                ordinals.start:ordinals.stop:ordinals.step]
+            with unittest.mock.patch.object(lineindex, '_numpy', None):
+                self.assertEqual(lineindex._find_newlines(chunk, ordinals), expected)
+            self.assertEqual(lineindex._find_newlines(chunk, ordinals), expected)
+
+    def test_iter_lines(self):
+        f = IndexedTextFile(self.fn)
+        f._index = get_line_index(self.fn, stride=7)
+        self.assertEqual(len(f), 1000)
+        self.assertEqual(list(f), self.lines)
+        for lines in [range(0, 5), range(500, 600), range(13, 14), range(990, 2000),
+                      range(5, 100, 3), range(50, 3, -4), range(10, 10)]:
+            expected = self.lines[lines.start:lines.stop:lines.step]
+            self.assertEqual(list(f.iter_lines(lines)), expected)
+        self.assertEqual(next(f.iter_lines(range(3, 4), binary=True)), self.lines[3].encode())
+
+    def test_split(self):
+        f = IndexedTextFile(self.fn)
+        f._index = get_line_index(self.fn, stride=10)
+        for num_chunks in [1, 4, 7, 2000]:
+            chunks = f.split(num_chunks)
+            self.assertLessEqual(len(chunks), num_chunks)
+            self.assertEqual([i for chunk in chunks for i in chunk], list(range(1000)))
+        self.assertEqual(len(f.split(4)), 4)
+
+    def test_cached(self):
+        get_line_index(self.fn, stride=10)
+        self.assertTrue(os.path.exists(self.fn + lineindex.INDEX_SUFFIX))
+        with unittest.mock.patch.object(LineIndex, 'build') as build:
+            self.assertEqual(get_line_index(self.fn).num_lines, 1000)
+            self.assertFalse(build.called)
+        with open(self.fn, 'a') as F:
+            F.write('more\n')
+        self.assertEqual(get_line_index(self.fn).num_lines, 1001)
+
+    def test_parser(self):
+        fn = self._write('data.txt.gz', ''.join(self.lines), gzip.open)
+        ap = AP()
+        ap.add_positional('infile', type='indexed_text')
+        ap.add_optional('lines', type='range')
+        args = ap.parse_args([fn, '--lines', '100:103'])
+        self.assertIsInstance(args.infile, IndexedTextFile)
+        self.assertEqual(list(args.infile.iter_lines(args.lines)), self.lines[100:103])
+        self.assertRaises(SystemExit, ap.parse_args, [fn + '.missing'])
+
+
+################################################################################
@@ -3,13 +3,22 @@ Unit-tests for integration of custom types with the argparser.
 """
 
 import unittest
+import unittest.mock
 import datetime
 import pathlib
 import ipaddress
+import tempfile
 from os import path
 from enum import Enum
+from argparse import Namespace
 
 from apegears import ArgumentParser as AP, register_spec
+from apegears.types import IntervalSet, RegexSet, NetworkSet
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 ################################################################################
@@ -68,6 +77,29 @@ register_spec(
 )
 
 
+################################################################################
+# TypeBatch -- a spec with a batch converter
+
+class TypeBatch:
+
+    num_batches = 0
+
+    def __init__(self, val):
+        self.val = val
+
+    @classmethod
+    def from_strings(cls, xs):
+        cls.num_batches += 1
+        return [cls(int(x)) for x in xs]
+
+
+TypeBatch.__argparse__ = dict(
+    from_string=lambda x: TypeBatch(int(x)),
+    from_strings=TypeBatch.from_strings,
+    names=['batch'],
+)
+
+
 ################################################################################
 # Enum type -- auto generated spec
 
@@ -132,6 +164,15 @@ class TypeIntegrationTest(unittest.TestCase):
             self.assertEqual(len(res), 3)
             self.assertEqual([y.val for y in res], [7.5, 8.5, 9.5])
 
+    def test_list_from_strings(self):
+        n = TypeBatch.num_batches
+        res = self._parse('list', type=TypeBatch, cli_args='--batch 1 2 --batch 3').batch
+        self.assertEqual([y.val for y in res], [1, 2, 3])
+        self.assertEqual(TypeBatch.num_batches, n + 1)
+        res = self._parse('positional_list', type=TypeBatch, cli_args='4 5').batch
+        self.assertEqual([y.val for y in res], [4, 5])
+        self.assertRaises(SystemExit, self._parse, 'list', type=TypeBatch, cli_args='--batch a')
+
     def test_dict(self):
         def P(*a, **kw):
             return self._parse('dict', *a, **kw)
@@ -205,6 +246,44 @@ class TypeIntegrationTest(unittest.TestCase):
         self.assertEqual(
             self._parse('list', type='datetime', cli_args='--timestamp %s' % tstr).timestamp, [t])
 
+    def test_datetime_iso8601(self):
+        def P(s):
+            return self._parse('positional', type='datetime', cli_args=s).timestamp
+
+        utc = datetime.timezone.utc
+        self.assertEqual(P('1999-08-07'), datetime.datetime(1999, 8, 7))
+        self.assertEqual(P('1999-08-07T03:04:05.25'),
+                         datetime.datetime(1999, 8, 7, 3, 4, 5, 250000))
+        self.assertEqual(P('1999-08-07T03:04:05Z'),
+                         datetime.datetime(1999, 8, 7, 3, 4, 5, tzinfo=utc))
+        self.assertEqual(P('1999-08-07T05:04:05+02:00'),
+                         datetime.datetime(1999, 8, 7, 3, 4, 5, tzinfo=utc))
+        self.assertRaises(SystemExit, P, '1999-08-07X')
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_datetime_numpy(self):
+        def P(s):
+            return self._parse('list', type='datetime', container='numpy', cli_args=s).timestamp
+
+        res = P('--timestamp 1999-08-07 1999-08-07T05:04:05+02:00 -t 1999-08-07T03:04:05.5Z')
+        self.assertEqual(res.dtype, numpy.dtype('datetime64[us]'))
+        self.assertEqual(res.tolist(), [
+            datetime.datetime(1999, 8, 7),
+            datetime.datetime(1999, 8, 7, 3, 4, 5),
+            datetime.datetime(1999, 8, 7, 3, 4, 5, 500000),
+        ])
+        self.assertEqual(P('').dtype, numpy.dtype('datetime64[us]'))
+        self.assertRaises(SystemExit, P, '-t 1999-08-07 1999-08-07X')
+        res = self._parse('list', type='date', container='numpy', cli_args='-d 1999-08-07').date
+        self.assertEqual(res.tolist(), [datetime.date(1999, 8, 7)])
+        # strings numpy accepts, but the (scalar) parsers don't:
+        for t in ['date', 'datetime']:
+            ap = AP()
+            ap.add_list('x', type=t, container='numpy')
+            for s in ['now', 'today', 'NaT', '', '1999', '1999-08']:
+                with unittest.mock.patch('sys.stderr'):
+                    self.assertRaises(SystemExit, ap.parse_args, ['-x', '1999-08-07', s])
+
     def test_regex(self):
         regex = '.x.'
         match = '1x1'
@@ -213,6 +292,71 @@ class TypeIntegrationTest(unittest.TestCase):
         self.assertTrue(r.match(match))
         self.assertIsNone(r.match(nomatch))
 
+    def test_regex_set(self):
+        ap = AP()
+        ap.add_list('x', type='regex_set', default=['^z'])
+        rs = ap.parse_args('-x err(or) -x warn.*(\\d+) -x o'.split()).x
+        self.assertIsInstance(rs, RegexSet)
+        self.assertTrue(rs.is_combined)
+        i, m = rs.search('a warning 12: error')
+        # leftmost match:
+        self.assertEqual((i, m.group(), m.groups()), (1, 'warning 12', ('2',)))
+        i, m = rs.search('an error')
+        # ties are broken by order:
+        self.assertEqual((i, m.group(1)), (0, 'or'))
+        self.assertIsNone(rs.search('WARN'))
+        self.assertEqual(rs.match('or')[0], 2)
+        self.assertIsNone(rs.fullmatch('ox'))
+        self.assertEqual(ap.parse_args([]).x.search('zz')[0], 0)
+        self.assertRaises(SystemExit, ap.parse_args, ['-x', '('])
+
+    def test_regex_set_fallback(self):
+        for patterns in [
+                [r'(a)\1', 'b'],  # numbered backreference
+                ['(?P<n>a)', '(?P<n>b)'],  # conflicting group names
+                ['(?i)a', 'b'],  # different flags
+        ]:
+            rs = RegexSet(patterns)
+            self.assertFalse(rs.is_combined)
+            self.assertEqual(rs.search('xba')[0], 1)
+            self.assertEqual(rs.search('xaab')[0], 0)
+            self.assertIsNone(rs.search('xyz'))
+            self.assertEqual(rs.fullmatch('b')[0], 1)
+
+    def test_intervals(self):
+        s = self._parse(
+            'positional', type='intervals', cli_args='0:100,250:300,1000:,90:120').intervals
+        self.assertIsInstance(s, IntervalSet)
+        self.assertEqual(str(s), '0:120,250:300,1000:')
+        for x in [0, 119, 250, 299, 1000, 10 ** 12]:
+            self.assertIn(x, s)
+        for x in [-1, 120, 249, 300, 999]:
+            self.assertNotIn(x, s)
+        self.assertRaises(OverflowError, len, s)
+
+        s = self._parse(
+            'list', type=IntervalSet, cli_args='--intervals 7:10,1:3,5:8 4').intervals[0]
+        self.assertEqual(list(s), [1, 2, 5, 6, 7, 8, 9])
+        self.assertEqual(len(s), 7)
+        self.assertEqual(s, IntervalSet([range(5, 10), (1, 3)]))
+        if numpy is not None:
+            self.assertEqual(s.to_numpy().tolist(), list(s))
+
+        self.assertRaises(SystemExit, self._parse, 'positional', type='intervals', cli_args='1:x')
+        self.assertRaises(
+            SystemExit, self._parse, 'positional', type='intervals',
+            cli_args='0:99999999999999999999')
+
+        # an explicit STOP of the max value is still bounded:
+        max_stop = 2 ** 63 - 1
+        s = IntervalSet([(max_stop - 2, max_stop)])
+        self.assertTrue(s.is_bounded())
+        self.assertEqual(str(s), '%d:%d' % (max_stop - 2, max_stop))
+        self.assertEqual(len(s), 2)
+        self.assertNotIn(max_stop, s)
+        self.assertNotEqual(s, IntervalSet([(max_stop - 2, None)]))
+        self.assertIn(max_stop, IntervalSet([(max_stop - 2, None)]))
+
     def test_path(self):
         p = path.join('a', 'b', 'c.zip')
         self.assertEqual(
@@ -226,6 +370,122 @@ class TypeIntegrationTest(unittest.TestCase):
             self._parse('positional', type='ipaddress', cli_args='2001:db8::').ip,
             ipaddress.IPv6Address))
 
+    def test_ipnetwork(self):
+        self.assertEqual(
+            self._parse('positional', type='ipnetwork', cli_args='10.1.2.3/8').network,
+            ipaddress.ip_network('10.0.0.0/8'))
+        args = self._parse('positional', type=ipaddress.IPv6Network, cli_args='2001:db8::/32')
+        self.assertEqual(args.network, ipaddress.ip_network('2001:db8::/32'))
+
+    def test_ipnetwork_set(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt') as F:
+            F.write('# comment\n10.0.0.0/24\n\n10.0.1.0/24  # adjacent\n2001:db8::/32\n')
+            F.flush()
+            ap = AP()
+            ap.add_list('net', type='ipnetwork_set', default=['127.0.0.1'])
+            nets = ap.parse_args(['--net', '@' + F.name, '192.168.0.0/16', '10.0.0.0/25']).net
+        self.assertIsInstance(nets, NetworkSet)
+        self.assertEqual(str(nets), '10.0.0.0/23,192.168.0.0/16,2001:db8::/32')
+        for x in ['10.0.1.255', '192.168.3.4', '2001:db8::1', '10.0.0.0/23']:
+            self.assertIn(x, nets)
+        for x in ['10.0.2.0', '9.255.255.255', '::1', '10.0.0.0/22']:
+            self.assertNotIn(x, nets)
+        self.assertIn(ipaddress.ip_address('2001:db8:ffff:ffff:ffff:ffff:ffff:ffff'), nets)
+        self.assertEqual(nets.num_addresses, 512 + 2 ** 16 + 2 ** 96)
+        self.assertEqual(ap.parse_args([]).net, NetworkSet(['127.0.0.1/32']))
+        self.assertRaises(SystemExit, ap.parse_args, ['--net', '@no-such-file.txt'])
+        self.assertRaises(SystemExit, ap.parse_args, ['--net', '10.0.0.0/33'])
+
+    def test_ipnetwork_set_edges(self):
+        nets = NetworkSet(['0.0.0.0/0', '::/0'])
+        self.assertIn('255.255.255.255', nets)
+        self.assertIn('ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff', nets)
+        self.assertFalse(NetworkSet())
+        self.assertNotIn('1.2.3.4', NetworkSet())
+        # ints, as in ipaddress.ip_address:
+        nets = NetworkSet(['10.0.0.0/8', '::1'])
+        self.assertIn(int(ipaddress.ip_address('10.1.2.3')), nets)
+        self.assertNotIn(int(ipaddress.ip_address('11.1.2.3')), nets)
+        self.assertNotIn(1, nets)
+        self.assertIn(2 ** 32, NetworkSet(['::1:0:0/96']))
+        self.assertRaises(ValueError, nets.__contains__, -1)
+        self.assertRaises(ValueError, nets.__contains__, 2 ** 128)
+        self.assertRaises(TypeError, nets.__contains__, 1.5)
+
+    ################################################################################
+    # lazy conversion
+
+    def test_lazy(self):
+        calls = []
+
+        def conv(x):
+            calls.append(x)
+            return int(x)
+
+        ap = AP()
+        ap.add_optional('x', type=conv, lazy=True, post_process=lambda v, **kw: v * 10)
+        ap.add_list('y', type=conv, lazy=True, choices=[1, 2])
+        ap.add_dict('z', type=conv, lazy=True)
+        ap.add_optional('w', type=conv)
+        args = ap.parse_args('-x 1 -y 1 2 -y 3 -z k=5 -w 7'.split())
+        self.assertEqual(calls, ['7'])
+        self.assertEqual(args.x, 10)
+        self.assertEqual(args.x, 10)
+        self.assertEqual(calls, ['7', '1'])
+        self.assertEqual(args.z, {'k': 5})
+        # errors (e.g. invalid choice) are only raised on access:
+        self.assertRaises(SystemExit, getattr, args, 'y')
+
+    def test_lazy_parser_default(self):
+        ap = AP(lazy=True)
+        ap.add_positional('x', type='pickled_data', default='no-such-file.pkl')
+        ap.add_optional('n', type=int, default='3')
+        args = ap.parse_args([])
+        self.assertEqual(args.n, 3)
+        self.assertRaises(SystemExit, getattr, args, 'x')
+
+    def test_lazy_explicit_namespace(self):
+        # attribute access can't be intercepted, so values are resolved while parsing
+        ap = AP()
+        ap.add_optional('x', type=int, lazy=True)
+        self.assertEqual(ap.parse_args(['-x', '4'], namespace=Namespace()).x, 4)
+        self.assertRaises(SystemExit, ap.parse_args, ['-x', 'a'], namespace=Namespace())
+
+    def test_memoize(self):
+        calls = []
+
+        def conv(s):
+            calls.append(s)
+            return int(s)
+
+        ap = AP()
+        ap.add_list('x', type=conv, memoize=2)
+        self.assertEqual(ap.parse_args('-x 1 2 1 2 3 1'.split()).x, [1, 2, 1, 2, 3, 1])
+        # '1' was evicted by '3':
+        self.assertEqual(calls, ['1', '2', '3', '1'])
+        info = ap._option_string_actions['-x'].type.cache_info()
+        self.assertEqual((info.hits, info.misses), (2, 4))
+
+    def test_memoize_spec(self):
+        # the cache of a spec is shared by all parsers, so only look at the deltas
+        ap = AP()
+        ap.add_list('x', type='regex')
+        ap.add_list('y', type='regex', memoize=False)
+        ap.add_optional('ip', type='ipaddress')
+        x_type = ap._option_string_actions['-x'].type
+        ip_type = ap._option_string_actions['--ip'].type
+        hits = x_type.cache_info().hits
+        args = ap.parse_args('-x a+memo -x a+memo -y b+ -y b+'.split())
+        self.assertIs(args.x[0], args.x[1])
+        self.assertEqual(args.y[0].pattern, 'b+')
+        self.assertEqual(x_type.cache_info().hits, hits + 1)
+        self.assertFalse(hasattr(ap._option_string_actions['-y'].type, 'cache_info'))
+        # errors are not cached:
+        misses = ip_type.cache_info().misses
+        self.assertRaises(SystemExit, ap.parse_args, ['--ip', 'x'])
+        self.assertRaises(SystemExit, ap.parse_args, ['--ip', 'x'])
+        self.assertEqual(ip_type.cache_info().misses, misses + 2)
+
     ################################################################################
 
     def _parse(self, arg_type, *args, cli_args=None, **kwargs):